@@ -2,10 +2,12 @@
 import os
 import time # <-- ADD THIS
 from flask import Flask
+from sqlalchemy import inspect, text
 from config import Config
 from extensions import db
 from services.llm_service import configure_llm
-from models import User, Project, Table
+from engine import parallel
+from models import User, Project, Table, SchemaSnapshot, PlanCacheEntry
 
 
 from routes.pages import pages_bp
@@ -15,6 +17,23 @@ from routes.chat import chat_bp
 from routes.databases import databases_bp
 from routes.tables import tables_bp 
 
+def add_missing_columns():
+    """
+    create_all() only creates missing tables; add columns introduced since
+    an existing database was created (all of them are nullable).
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+                ))
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -26,10 +45,15 @@ def create_app():
 
     # Import models AFTER db.init_app(app)
     with app.app_context():
-        from models import User, Project, Table
+        from models import User, Project, Table, SchemaSnapshot, PlanCacheEntry
         db.create_all()
+        add_missing_columns()
 
     configure_llm()
+    parallel.configure(
+        workers=Config.PARALLEL_WORKERS,
+        min_bytes=Config.PARALLEL_MIN_MB * 1024 * 1024
+    )
 
 
     @app.context_processor
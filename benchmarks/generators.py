@@ -0,0 +1,176 @@
+# benchmarks/generators.py
+"""
+Deterministic generators for accounting-export shaped CSV files.
+
+Every generator is driven by random.Random(seed), so the same
+(shape, rows, wide, seed) always produces byte-identical files and
+results can be compared across commits.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+ACCOUNTS = [
+    "Sales", "Cost of Goods Sold", "Advertising", "Bank Charges", "Rent",
+    "Utilities", "Office Supplies", "Travel", "Meals", "Insurance",
+    "Professional Fees", "Payroll Expenses", "Accounts Receivable",
+    "Accounts Payable", "Undeposited Funds", "Sales Tax Payable",
+]
+TXN_TYPES = ["Invoice", "Payment", "Bill", "Bill Payment", "Deposit", "Expense", "Journal Entry", "Credit Memo"]
+CURRENCIES = ["USD", "GBP", "EUR", "AUD", "CAD", "NZD"]
+COUNTRIES = ["US", "GB", "DE", "AU", "CA", "NZ", "FR", "NL", "IE", "ES"]
+INVOICE_STATUS = ["PAID", "AUTHORISED", "DRAFT", "VOIDED"]
+FINANCIAL_STATUS = ["paid", "pending", "refunded", "partially_refunded", "authorized"]
+FULFILLMENT_STATUS = ["fulfilled", "unfulfilled", "partial"]
+PRODUCTS = [f"Product {i:04d}" for i in range(500)]
+
+START_DATE = date(2019, 1, 1)
+DAYS = 6 * 365
+
+# Rows of the dimension table the fact tables join to (see ensure_dimension)
+CUSTOMERS = 5000
+
+
+def _day(rng):
+    return (START_DATE + timedelta(days=rng.randrange(DAYS))).isoformat()
+
+
+def _money(rng, low, high):
+    return f"{rng.uniform(low, high):.2f}"
+
+
+def _quickbooks(rng, i):
+    amount = _money(rng, -5000, 15000)
+    return {
+        "txn_id": i,
+        "date": _day(rng),
+        "transaction_type": rng.choice(TXN_TYPES),
+        "num": f"{rng.randrange(100000):06d}",
+        "customer_id": rng.randint(1, CUSTOMERS),
+        "memo": f"Memo {rng.randrange(2000)}",
+        "account": rng.choice(ACCOUNTS),
+        "split": rng.choice(ACCOUNTS),
+        "amount": amount,
+        "balance": _money(rng, -50000, 250000),
+    }
+
+
+def _xero(rng, i):
+    subtotal = rng.uniform(10, 20000)
+    tax = subtotal * rng.choice([0.0, 0.05, 0.1, 0.15, 0.2])
+    return {
+        "invoice_id": i,
+        "invoice_number": f"INV-{i:08d}",
+        "customer_id": rng.randint(1, CUSTOMERS),
+        "invoice_date": _day(rng),
+        "due_date": _day(rng),
+        "status": rng.choice(INVOICE_STATUS),
+        "currency": rng.choice(CURRENCIES),
+        "account_code": rng.randint(200, 899),
+        "sub_total": f"{subtotal:.2f}",
+        "tax_total": f"{tax:.2f}",
+        "total": f"{subtotal + tax:.2f}",
+        "amount_due": _money(rng, 0, subtotal + tax),
+    }
+
+
+def _shopify(rng, i):
+    quantity = rng.randint(1, 12)
+    price = rng.uniform(2, 400)
+    shipping = rng.choice([0.0, 4.99, 9.99, 14.99])
+    return {
+        "order_id": i,
+        "name": f"#{1000 + i}",
+        "customer_id": rng.randint(1, CUSTOMERS),
+        "created_at": _day(rng),
+        "financial_status": rng.choice(FINANCIAL_STATUS),
+        "fulfillment_status": rng.choice(FULFILLMENT_STATUS),
+        "currency": rng.choice(CURRENCIES),
+        "lineitem_name": rng.choice(PRODUCTS),
+        "lineitem_quantity": quantity,
+        "lineitem_price": f"{price:.2f}",
+        "shipping": f"{shipping:.2f}",
+        "total": f"{quantity * price + shipping:.2f}",
+        "billing_country": rng.choice(COUNTRIES),
+    }
+
+
+# shape -> (row generator, columns the benchmarks use)
+SHAPES = {
+    "quickbooks": (_quickbooks, {"measure": "amount", "dimension": "account", "date": "date"}),
+    "xero": (_xero, {"measure": "total", "dimension": "status", "date": "invoice_date"}),
+    "shopify": (_shopify, {"measure": "total", "dimension": "billing_country", "date": "created_at"}),
+}
+
+# Extra columns appended in "wide" mode, to mimic full exports
+WIDE_EXTRA_COLUMNS = 30
+
+
+def _wide_extras(rng):
+    extras = {}
+    for c in range(WIDE_EXTRA_COLUMNS):
+        if c % 3 == 0:
+            extras[f"extra_{c}"] = rng.randrange(1000000)
+        elif c % 3 == 1:
+            extras[f"extra_{c}"] = f"{rng.random() * 1000:.3f}"
+        else:
+            extras[f"extra_{c}"] = f"tag{rng.randrange(500)}"
+    return extras
+
+
+def dataset_path(data_dir, shape, rows, wide=False, seed=0):
+    width = "wide" if wide else "narrow"
+    return os.path.join(data_dir, f"{shape}_{rows}_{width}_s{seed}.csv")
+
+
+def generate(path, shape, rows, wide=False, seed=0, batch_size=10000):
+    """Writes `rows` rows of the given shape to `path`."""
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape: {shape}. Choose from {sorted(SHAPES)}")
+    make_row, _ = SHAPES[shape]
+    rng = random.Random(f"{shape}:{seed}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        header = None
+        batch = []
+        for i in range(1, rows + 1):
+            row = make_row(rng, i)
+            if wide:
+                row.update(_wide_extras(rng))
+            if header is None:
+                header = list(row.keys())
+                f.write(",".join(header) + "\n")
+            batch.append(",".join(str(row[c]) for c in header))
+            if len(batch) >= batch_size:
+                f.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            f.write("\n".join(batch) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def ensure_dataset(data_dir, shape, rows, wide=False, seed=0):
+    """Generates the dataset unless an identical one already exists."""
+    path = dataset_path(data_dir, shape, rows, wide, seed)
+    if not os.path.exists(path):
+        generate(path, shape, rows, wide=wide, seed=seed)
+    return path
+
+
+def ensure_dimension(data_dir, seed=0):
+    """Writes the customers table every fact shape joins to on customer_id."""
+    path = os.path.join(data_dir, f"customers_s{seed}.csv")
+    if os.path.exists(path):
+        return path
+    rng = random.Random(f"customers:{seed}")
+    os.makedirs(data_dir, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write("customer_id,customer_name,segment,country\n")
+        for i in range(1, CUSTOMERS + 1):
+            segment = rng.choice(["retail", "wholesale", "online", "enterprise"])
+            f.write(f"{i},Customer {i},{segment},{rng.choice(COUNTRIES)}\n")
+    os.replace(path + ".tmp", path)
+    return path
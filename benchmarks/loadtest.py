@@ -0,0 +1,336 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test for the chat path.
+
+Starts the app under the real gunicorn config (or targets --url), with
+the deterministic LLM stub from services/llm_service.py, a throwaway
+SQLite database and upload folder. Each simulated user registers, logs
+in, creates and selects a database, uploads a generated Shopify export
+(orders.csv + customers.csv) and then asks the recorded questions from
+benchmarks/llm_recordings.json in a loop:
+
+    python -m benchmarks.loadtest --sessions 8 --requests 50 --rows 200000
+
+The report gives p50/p95/p99 of the total request latency and of its
+LLM / execution / serialization split (read from the Server-Timing
+header), throughput and the error rate.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generators import ensure_dataset, ensure_dimension  # noqa: E402
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_RECORDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_recordings.json")
+PHASES = ("llm", "exec", "serialize")
+
+
+# ---------- HTTP client ----------
+
+class Session:
+    """One simulated user: a cookie jar plus JSON / multipart helpers."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def _send(self, req):
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, resp.headers, json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            try:
+                return e.code, e.headers, json.loads(body)
+            except ValueError:
+                return e.code, e.headers, {"error": body.decode("utf-8", "replace")}
+
+    def post_json(self, path, payload):
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        return self._send(req)
+
+    def upload(self, path, files):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for filename, filepath in files:
+            with open(filepath, "rb") as f:
+                content = f.read()
+            parts.append(
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+                "Content-Type: text/csv\r\n\r\n".encode("utf-8") + content + b"\r\n"
+            )
+        body = b"".join(parts) + f"--{boundary}--\r\n".encode("utf-8")
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            method="POST",
+        )
+        return self._send(req)
+
+
+def parse_server_timing(header):
+    """'llm;dur=12.5, exec;dur=3.0' -> {'llm': 0.0125, 'exec': 0.003}"""
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    timings[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return timings
+
+
+# ---------- Server ----------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, llm_latency_ms, recordings, no_plan_cache, workers=None):
+    """Runs gunicorn with gunicorn_config.py against a private DB and upload folder."""
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_PATH": recordings,
+        "LLM_STUB_LATENCY_MS": str(llm_latency_ms),
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, "loadtest.db"),
+        "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "SECRET_KEY": "loadtest",
+    })
+    if no_plan_cache:
+        env["PLAN_CACHE_TTL"] = "0"
+    os.makedirs(env["UPLOAD_FOLDER"], exist_ok=True)
+
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py",
+           "--bind", f"127.0.0.1:{port}", "--access-logfile", os.devnull]
+    if workers:
+        cmd += ["--workers", str(workers)]
+    cmd.append("app:app")
+    log = open(os.path.join(workdir, "gunicorn.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}, see {log.name}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start within 60s")
+
+
+# ---------- Load ----------
+
+def setup_session(base_url, index, files, timeout, upload_lock):
+    """register -> login -> create database -> select -> upload"""
+    session = Session(base_url, timeout)
+    email = f"loadtest-{uuid.uuid4().hex[:8]}-{index}@example.com"
+    session.post_json("/api/register", {"email": email, "password": "loadtest"})
+    status, _, body = session.post_json("/api/login", {"email": email, "password": "loadtest"})
+    if status != 200:
+        raise RuntimeError(f"login failed: {body}")
+    _, _, body = session.post_json("/api/databases", {"name": f"loadtest {index}"})
+    session.post_json("/api/databases/select", {"id": body["database"]["id"]})
+    # Uploads are saved under their file name in one shared folder, so
+    # concurrent uploads of the same files would race each other.
+    with upload_lock:
+        t0 = time.perf_counter()
+        status, _, body = session.upload("/api/upload", files)
+        upload_seconds = time.perf_counter() - t0
+    if status != 200 or not body.get("success"):
+        raise RuntimeError(f"upload failed: {body}")
+    session.post_json("/api/detect-relationships", {})
+    return session, upload_seconds
+
+
+def run_session(session, questions, requests, seed, samples, lock):
+    rng = random.Random(seed)
+    for _ in range(requests):
+        question = rng.choice(questions)
+        t0 = time.perf_counter()
+        try:
+            status, headers, body = session.post_json("/api/chat", {"query": question})
+            error = status != 200 or (body or {}).get("type") == "error"
+            timings = parse_server_timing(headers.get("Server-Timing"))
+        except Exception as e:
+            error, timings, body = True, {}, {"data": str(e)}
+        sample = {
+            "question": question,
+            "total": time.perf_counter() - t0,
+            "error": error,
+            "detail": (body or {}).get("data") if error else None,
+        }
+        sample.update(timings)
+        with lock:
+            samples.append(sample)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(samples, wall_seconds):
+    ok = [s for s in samples if not s["error"]]
+    report = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "throughput_rps": len(samples) / wall_seconds if wall_seconds > 0 else None,
+        "latency": {},
+    }
+    for phase in ("total",) + PHASES:
+        values = [s[phase] for s in ok if phase in s]
+        if not values:
+            continue
+        report["latency"][phase] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "mean": statistics.mean(values),
+        }
+    errors = {}
+    for s in samples:
+        if s["error"]:
+            errors[str(s["detail"])[:120]] = errors.get(str(s["detail"])[:120], 0) + 1
+    report["error_samples"] = errors
+    return report
+
+
+def print_report(report):
+    print(f"requests {report['requests']}  errors {report['errors']} "
+          f"({report['error_rate'] * 100:.1f}%)  throughput {report['throughput_rps'] or 0:.1f} req/s")
+    print(f"  {'phase':<10} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for phase, stats in report["latency"].items():
+        print(f"  {phase:<10} " + " ".join(f"{stats[p] * 1000:8.1f}ms" for p in ("p50", "p95", "p99")))
+    for detail, count in report["error_samples"].items():
+        print(f"  error x{count}: {detail}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AIStora /api/chat load test")
+    parser.add_argument("--url", help="Target a running server instead of starting gunicorn")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent users")
+    parser.add_argument("--requests", type=int, default=25, help="Chat requests per user")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows in the uploaded orders table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Override the gunicorn worker count")
+    parser.add_argument("--llm-latency-ms", type=int, default=0,
+                        help="Simulated model latency of the stub")
+    parser.add_argument("--no-plan-cache", action="store_true",
+                        help="Disable the plan cache so every request waits for the model")
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    orders_path = ensure_dataset(args.data_dir, "shopify", args.rows, seed=args.seed)
+    customers_path = ensure_dimension(args.data_dir, args.seed)
+    files = [("orders.csv", orders_path), ("customers.csv", customers_path)]
+    with open(args.recordings, "r", encoding="utf-8") as f:
+        questions = list(json.load(f)["chat"])
+
+    workdir = tempfile.mkdtemp(prefix="aistora-loadtest-")
+    server = None
+    try:
+        base_url = args.url
+        if not base_url:
+            port = _free_port()
+            server = start_server(workdir, port, args.llm_latency_ms, args.recordings,
+                                  args.no_plan_cache, workers=args.workers)
+            base_url = f"http://127.0.0.1:{port}"
+        print(f"Target {base_url}, {args.sessions} sessions x {args.requests} requests")
+
+        upload_lock = threading.Lock()
+        sessions = [None] * args.sessions
+        upload_times = [None] * args.sessions
+
+        def _setup(i):
+            sessions[i], upload_times[i] = setup_session(base_url, i, files, args.timeout, upload_lock)
+
+        threads = [threading.Thread(target=_setup, args=(i,)) for i in range(args.sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if any(s is None for s in sessions):
+            print("Session setup failed")
+            return 1
+        print(f"Setup done, upload p50 {statistics.median(upload_times) * 1000:.0f}ms")
+
+        samples, lock = [], threading.Lock()
+        threads = [
+            threading.Thread(target=run_session,
+                             args=(sessions[i], questions, args.requests, f"{args.seed}:{i}", samples, lock))
+            for i in range(args.sessions)
+        ]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        report = summarize(samples, time.perf_counter() - t0)
+        report["meta"] = {
+            "sessions": args.sessions,
+            "requests_per_session": args.requests,
+            "rows": args.rows,
+            "llm_latency_ms": args.llm_latency_ms,
+            "plan_cache": not args.no_plan_cache,
+            "upload_p50": statistics.median(upload_times),
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
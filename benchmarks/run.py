@@ -0,0 +1,327 @@
+# benchmarks/run.py
+"""
+Engine benchmark suite.
+
+Generates deterministic accounting exports (see benchmarks/generators.py),
+times the ingest path and every DataFrame operator on them, and records
+throughput and peak memory. Results can be saved as a JSON baseline and
+compared against a previous one:
+
+    python -m benchmarks.run --rows 1000000 --width both --output baseline.json
+    python -m benchmarks.run --rows 1000000 --width both --baseline baseline.json
+
+The comparison exits with status 1 when any benchmark is slower (or uses
+more memory) than the baseline by more than --threshold.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generators import SHAPES, ensure_dataset, ensure_dimension  # noqa: E402
+from engine import parallel  # noqa: E402
+from engine.dataframe import DataFrame  # noqa: E402
+from engine.parser import CsvParser  # noqa: E402
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+# ---------- Benchmarks ----------
+# Each benchmark receives a context dict and returns a value whose size is
+# used as a sanity check (so nothing is optimised away).
+
+def bench_ingest(ctx):
+    """What /api/upload does for a new file: header, type inference, row count."""
+    df = DataFrame(source=ctx["path"])
+    df.get_column_types()
+    return len(df)
+
+
+def bench_parse(ctx):
+    count = 0
+    for _ in CsvParser(ctx["path"], column_types=ctx["types"]).parse():
+        count += 1
+    return count
+
+
+def bench_len(ctx):
+    return len(ctx["df"])
+
+
+def bench_filter(ctx):
+    measure = ctx["cols"]["measure"]
+    return len(ctx["df"].filter(lambda row: row[measure] is not None and row[measure] > 1000))
+
+
+def bench_filter_equality(ctx):
+    dimension = ctx["cols"]["dimension"]
+    value = ctx["dimension_value"]
+    return len(ctx["df"].filter(lambda row: row[dimension] == value))
+
+
+def bench_project(ctx):
+    cols = ctx["cols"]
+    return len(ctx["df"].project([cols["date"], cols["dimension"], cols["measure"]]))
+
+
+def bench_aggregate(ctx):
+    df, cols = ctx["df"], ctx["cols"]
+    return len(df.aggregate(df.groupby(cols["dimension"]), {cols["measure"]: "sum"}))
+
+
+def bench_aggregate_multi(ctx):
+    df, cols = ctx["df"], ctx["cols"]
+    measure = cols["measure"]
+    groups = df.groupby("customer_id")
+    return len(df.aggregate(groups, {measure: "avg", "customer_id": "count"}))
+
+
+def bench_groupby_materialized(ctx):
+    df, cols = ctx["df"], ctx["cols"]
+    groups = df.groupby(cols["dimension"])
+    return sum(len(rows) for rows in groups.values())
+
+
+def bench_join(ctx):
+    return len(ctx["df"].join(ctx["customers"], "customer_id", "customer_id"))
+
+
+def bench_max_by(ctx):
+    return len(ctx["df"].max_by(ctx["cols"]["measure"]))
+
+
+def bench_min_by(ctx):
+    return len(ctx["df"].min_by(ctx["cols"]["measure"]))
+
+
+def bench_top_k_by(ctx):
+    return len(ctx["df"].top_k_by(ctx["cols"]["measure"], 10))
+
+
+BENCHMARKS = [
+    ("ingest", bench_ingest),
+    ("parse", bench_parse),
+    ("len", bench_len),
+    ("filter_range", bench_filter),
+    ("filter_equality", bench_filter_equality),
+    ("project", bench_project),
+    ("aggregate", bench_aggregate),
+    ("aggregate_by_key", bench_aggregate_multi),
+    ("groupby_materialized", bench_groupby_materialized),
+    ("join", bench_join),
+    ("max_by", bench_max_by),
+    ("min_by", bench_min_by),
+    ("top_k_by", bench_top_k_by),
+]
+
+
+# ---------- Measurement ----------
+
+def _current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_in_child(conn, func, ctx, repeat):
+    try:
+        ctx = dict(ctx)
+        ctx["df"] = DataFrame(source=ctx["path"], column_types=ctx["types"])
+        ctx["customers"] = DataFrame(source=ctx["customers_path"])
+        start_rss = _current_rss_mb()
+        times = []
+        size = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            size = func(ctx)
+            times.append(time.perf_counter() - t0)
+        conn.send({
+            "times": times,
+            "size": size,
+            "peak_rss_mb": max(0.0, _peak_rss_mb() - start_rss),
+        })
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def measure(func, ctx, repeat):
+    """
+    Runs one benchmark `repeat` times in a forked child, so its peak RSS
+    is not polluted by earlier benchmarks.
+    """
+    mp = multiprocessing.get_context("fork")
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    proc = mp.Process(target=_run_in_child, args=(child_conn, func, ctx, repeat))
+    proc.start()
+    child_conn.close()
+    outcome = parent_conn.recv()
+    proc.join()
+    return outcome
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run_suite(shapes, rows, wide, seed, repeat, data_dir, only=None, log=print):
+    results = {}
+    customers_path = ensure_dimension(data_dir, seed)
+    for shape in shapes:
+        t0 = time.perf_counter()
+        path = ensure_dataset(data_dir, shape, rows, wide=wide, seed=seed)
+        log(f"[{shape}] dataset ready in {time.perf_counter() - t0:.1f}s: {path}")
+
+        parser = CsvParser(path)
+        cols = SHAPES[shape][1]
+        first = next(parser.parse(), {})
+        ctx = {
+            "path": path,
+            "customers_path": customers_path,
+            "types": parser.get_column_types(),
+            "cols": cols,
+            "dimension_value": first.get(cols["dimension"]),
+        }
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+
+        for name, func in BENCHMARKS:
+            if only and name not in only:
+                continue
+            outcome = measure(func, ctx, repeat)
+            key = f"{shape}/{'wide' if wide else 'narrow'}/{rows}/{name}"
+            if "error" in outcome:
+                log(f"  {name:<22} ERROR {outcome['error']}")
+                results[key] = {"error": outcome["error"]}
+                continue
+
+            best = min(outcome["times"])
+            results[key] = {
+                "seconds": best,
+                "seconds_median": statistics.median(outcome["times"]),
+                "rows_per_sec": rows / best if best > 0 else None,
+                "mb_per_sec": size_mb / best if best > 0 else None,
+                "peak_rss_mb": round(outcome["peak_rss_mb"], 1),
+                "result_size": outcome["size"],
+            }
+            log(f"  {name:<22} {best:8.3f}s  {rows / best:12,.0f} rows/s  "
+                f"{outcome['peak_rss_mb']:8.1f} MB")
+    return results
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """Returns a list of human-readable regressions against a baseline."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        if current["seconds"] > previous["seconds"] * (1 + threshold):
+            regressions.append(
+                f"{key}: {previous['seconds']:.3f}s -> {current['seconds']:.3f}s "
+                f"(+{(current['seconds'] / previous['seconds'] - 1) * 100:.0f}%)"
+            )
+        # Ignore noise on tiny allocations
+        if (current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + memory_threshold)
+                and current["peak_rss_mb"] - previous["peak_rss_mb"] > 5):
+            regressions.append(
+                f"{key}: peak RSS {previous['peak_rss_mb']:.1f}MB -> {current['peak_rss_mb']:.1f}MB"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AIStora engine benchmarks")
+    parser.add_argument("--shape", action="append", choices=sorted(SHAPES),
+                        help="Export shape to benchmark (repeatable, default: all)")
+    parser.add_argument("--rows", type=int, action="append",
+                        help="Rows per dataset (repeatable, default: 1000000)")
+    parser.add_argument("--width", choices=["narrow", "wide", "both"], default="narrow",
+                        help="wide adds extra columns to every row")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", help="Run only these benchmarks")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--parallel-workers", type=int, default=0,
+                        help="Enable partitioned execution with this many processes")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown before a benchmark counts as a regression")
+    parser.add_argument("--memory-threshold", type=float, default=0.20)
+    args = parser.parse_args(argv)
+
+    parallel.configure(workers=args.parallel_workers, min_bytes=0)
+    shapes = args.shape or sorted(SHAPES)
+    row_counts = args.rows or [1000000]
+    widths = [False, True] if args.width == "both" else [args.width == "wide"]
+
+    results = {}
+    for rows in row_counts:
+        for wide in widths:
+            results.update(run_suite(shapes, rows, wide, args.seed, args.repeat,
+                                     args.data_dir, only=args.only))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "rows": row_counts,
+            "width": args.width,
+            "seed": args.seed,
+            "parallel_workers": args.parallel_workers,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        print(f"Compared with {args.baseline} (commit {baseline.get('meta', {}).get('commit')})")
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 # config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,12 +9,115 @@ class Config:
     # Read from env, fallback to random only for local dev
     SECRET_KEY = os.environ.get("SECRET_KEY", os.urandom(24))
     
-    UPLOAD_FOLDER = 'uploads'
+    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", 'uploads')
     GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+
+    # "gemini", or "stub" for the deterministic local model (dev / load tests)
+    LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+    LLM_STUB_PATH = os.environ.get(
+        "LLM_STUB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'llm_recordings.json')
+    )
+    LLM_STUB_LATENCY_MS = int(os.environ.get("LLM_STUB_LATENCY_MS", 0))
     DATABASE_URL = os.environ.get("DATABASE_URL")
     if DATABASE_URL:
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
     else:
         SQLALCHEMY_DATABASE_URI = "sqlite:///local.db"
 
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Database connections: each gunicorn worker has its own pool, sized for
+    # its threads (GUNICORN_THREADS, see gunicorn_config.py), so the server
+    # holds at most workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    # Connections are checked before use and recycled after DB_POOL_RECYCLE
+    # seconds. SQLite keeps SQLAlchemy's defaults.
+    GUNICORN_WORKERS = int(os.environ.get("GUNICORN_WORKERS", 0))  # 0: 2 x CPUs + 1
+    GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", 2))
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", GUNICORN_THREADS))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 2))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    if SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_pre_ping": True,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+
+    # LLM plan cache: answers are reused for the same question on the same schema
+    PLAN_CACHE_TTL = int(os.environ.get("PLAN_CACHE_TTL", 7 * 24 * 3600))
+    PLAN_CACHE_MAX_ENTRIES = int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", 5000))
+
+    # Per-worker table catalog: max number of open table handles (metadata is
+    # cached until the project's schema version changes)
+    CATALOG_MAX_HANDLES = int(os.environ.get("CATALOG_MAX_HANDLES", 256))
+
+    # Versioned schema snapshots per project: how many old versions are kept
+    # and how many projects' current snapshot each worker caches
+    SCHEMA_SNAPSHOTS_KEPT = int(os.environ.get("SCHEMA_SNAPSHOTS_KEPT", 10))
+    SCHEMA_CACHE_MAX_PROJECTS = int(os.environ.get("SCHEMA_CACHE_MAX_PROJECTS", 1024))
+
+    # Columnar copies of tables, mmap'd and shared by every worker on the host
+    SHARED_SEGMENTS = os.environ.get("SHARED_SEGMENTS", "1") == "1"
+    SEGMENT_DIR = os.environ.get("SEGMENT_DIR", os.path.join(UPLOAD_FOLDER, '.segments'))
+    SEGMENT_BUDGET_MB = int(os.environ.get("SEGMENT_BUDGET_MB", 4096))
+
+    # Generated code runs in a pool of executor processes ("process"),
+    # or directly in the request thread ("inline")
+    QUERY_EXECUTOR = os.environ.get("QUERY_EXECUTOR", "process")
+    EXECUTOR_PROCESSES = int(os.environ.get("EXECUTOR_PROCESSES", 2))
+    QUERY_TIMEOUT = int(os.environ.get("QUERY_TIMEOUT", 30))
+    QUERY_CPU_LIMIT = int(os.environ.get("QUERY_CPU_LIMIT", 30))
+    # /api/export runs in the same executors; its limit covers the download
+    EXPORT_TIMEOUT = int(os.environ.get("EXPORT_TIMEOUT", 300))
+    EXECUTOR_CANCEL_DIR = os.environ.get(
+        "EXECUTOR_CANCEL_DIR", os.path.join(tempfile.gettempdir(), 'aistora-cancel')
+    )
+
+    # Rollups pre-aggregated at upload and used instead of scanning (see
+    # engine.rollups): "auto", "off" or "dimension:measure,..." pairs
+    ROLLUPS = os.environ.get("ROLLUPS", "auto")
+
+    # Partitioned execution of filter/aggregate/join for tables above PARALLEL_MIN_MB
+    PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", os.cpu_count() or 1))
+    PARALLEL_MIN_MB = int(os.environ.get("PARALLEL_MIN_MB", 32))
+
+    # Queries whose estimated cost (bytes scanned + memory, see engine.planner)
+    # exceeds QUERY_COST_LIMIT_MB are sent back for confirmation ("confirm")
+    # or rejected ("refuse"). 0 disables the check.
+    QUERY_COST_LIMIT_MB = int(os.environ.get("QUERY_COST_LIMIT_MB", 0))
+    QUERY_COST_ACTION = os.environ.get("QUERY_COST_ACTION", "confirm")
+
+    # Table results in /api/chat: "rows" (a dict per row) or "columnar" (column
+    # names once, a value array per row) unless the request asks for one.
+    # Results over RESULT_PAGE_ROWS rows are paged through a server-side cursor
+    # that keeps at most CURSOR_MAX_ROWS rows (the rest only via /api/export);
+    # its pages are written in the background, and a page not written yet is
+    # waited for up to CURSOR_WAIT seconds.
+    RESULT_FORMAT = os.environ.get("RESULT_FORMAT", "rows")
+    RESULT_PAGE_ROWS = int(os.environ.get("RESULT_PAGE_ROWS", 1000))
+    CURSOR_DIR = os.environ.get(
+        "CURSOR_DIR", os.path.join(tempfile.gettempdir(), 'aistora-cursors')
+    )
+    CURSOR_TTL = int(os.environ.get("CURSOR_TTL", 3600))
+    CURSOR_MAX_ROWS = int(os.environ.get("CURSOR_MAX_ROWS", 100000))
+    CURSOR_WAIT = float(os.environ.get("CURSOR_WAIT", 10))
+
+    # Charts: "local" renders SVG files served from /api/charts (cached in
+    # CHART_DIR for CHART_TTL seconds), "quickchart" builds QuickChart URLs.
+    # Line charts are downsampled to CHART_MAX_POINTS points, bar and pie
+    # charts to CHART_MAX_CATEGORIES groups (the rest summed as 'Other').
+    CHART_BACKEND = os.environ.get("CHART_BACKEND", "local")
+    CHART_DIR = os.environ.get(
+        "CHART_DIR", os.path.join(tempfile.gettempdir(), 'aistora-charts')
+    )
+    CHART_TTL = int(os.environ.get("CHART_TTL", 86400))
+    CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 500))
+    CHART_MAX_CATEGORIES = int(os.environ.get("CHART_MAX_CATEGORIES", 25))
+
+    # Per-worker Prometheus metric files, merged by /metrics
+    METRICS_DIR = os.environ.get(
+        "METRICS_DIR", os.path.join(tempfile.gettempdir(), 'aistora-metrics')
+    )
\ No newline at end of file
@@ -0,0 +1,197 @@
+# engine/aggregation.py
+import re
+from collections.abc import Mapping
+from . import execution
+
+SUPPORTED_FUNCS = ('count', 'sum', 'avg', 'min', 'max')
+
+# groupby(col, bucket=...) groups ISO dates ('YYYY-MM-DD...') by their prefix
+DATE_BUCKETS = {'day': 10, 'month': 7, 'year': 4}
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def bucket_key(value, bucket):
+    """The 'day', 'month' or 'year' bucket of a date value, or None if it is not a date."""
+    if not isinstance(value, str) or not _DATE_RE.match(value):
+        return None
+    return value[:DATE_BUCKETS[bucket]]
+
+
+def key_columns(columns):
+    """
+    Normalizes a groupby/join key: a column name, or a tuple of two or
+    more names for a composite key (a one-column list is the column).
+    """
+    if isinstance(columns, str):
+        return columns
+    columns = tuple(columns)
+    if not columns or not all(isinstance(c, str) for c in columns):
+        raise ValueError("Key columns must be a column name or a list of column names")
+    return columns[0] if len(columns) == 1 else columns
+
+
+def group_key(column_name, bucket=None):
+    """
+    Function returning the group key of a row, as groupby(column_name, bucket)
+    defines it. A composite key is a tuple of values, None if any is None;
+    its bucket applies to the last column.
+    """
+    if isinstance(column_name, tuple):
+        columns = column_name
+        if bucket is None:
+            def composite(row):
+                values = tuple([row.get(c) for c in columns])
+                return None if None in values else values
+            return composite
+        head, last = columns[:-1], columns[-1]
+
+        def composite_bucketed(row):
+            values = tuple([row.get(c) for c in head]) + (bucket_key(row.get(last), bucket),)
+            return None if None in values else values
+        return composite_bucketed
+    if bucket is None:
+        return lambda row: row.get(column_name)
+    return lambda row: bucket_key(row.get(column_name), bucket)
+
+
+class GroupBy(Mapping):
+    """
+    Result of DataFrame.groupby().
+
+    Behaves like the {key: [rows]} dictionary groupby() has always returned,
+    but the rows are only materialized on first access. That lets
+    DataFrame.aggregate() recognize an untouched GroupBy and compute the
+    aggregates straight from the source in one streaming pass (possibly
+    partitioned across cores) without ever building the row lists.
+    """
+
+    def __init__(self, source, column_name, bucket=None):
+        self.source = source
+        self.column_name = column_name
+        self.bucket = bucket
+        self._groups = None
+
+    @property
+    def materialized(self):
+        return self._groups is not None
+
+    def _load(self):
+        if self._groups is None:
+            self._groups = self.source._group_rows(self.column_name, self.bucket)
+        return self._groups
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return repr(self._load())
+
+
+# ---------- Partial aggregate states ----------
+#
+# A group's state is a dict: {'__rows__': n, col: per-function state}.
+# States from different partitions can be merged, so every function is
+# stored in a decomposable form (avg as [sum, count]).
+
+def new_state(agg_func_map):
+    state = {'__rows__': 0}
+    for col, func in agg_func_map.items():
+        if func == 'sum':
+            state[col] = 0
+        elif func == 'avg':
+            state[col] = [0, 0]
+        elif func in ('min', 'max'):
+            state[col] = None
+    return state
+
+
+def update_state(state, row, agg_func_map):
+    """Folds one row into a group's state (same casting rules as aggregate())."""
+    state['__rows__'] += 1
+    for col, func in agg_func_map.items():
+        if func == 'count' or func not in SUPPORTED_FUNCS:
+            continue
+        try:
+            val = float(row[col])
+        except (ValueError, TypeError):
+            continue
+
+        if func == 'sum':
+            state[col] += val
+        elif func == 'avg':
+            acc = state[col]
+            acc[0] += val
+            acc[1] += 1
+        elif func == 'min':
+            if state[col] is None or val < state[col]:
+                state[col] = val
+        elif func == 'max':
+            if state[col] is None or val > state[col]:
+                state[col] = val
+
+
+def merge_state(into, other, agg_func_map):
+    """Merges `other` into `into`; both are states of the same group."""
+    into['__rows__'] += other['__rows__']
+    for col, func in agg_func_map.items():
+        if func == 'sum':
+            into[col] += other[col]
+        elif func == 'avg':
+            into[col][0] += other[col][0]
+            into[col][1] += other[col][1]
+        elif func == 'min':
+            if other[col] is not None and (into[col] is None or other[col] < into[col]):
+                into[col] = other[col]
+        elif func == 'max':
+            if other[col] is not None and (into[col] is None or other[col] > into[col]):
+                into[col] = other[col]
+
+
+def finalize_state(state, agg_func_map):
+    """Turns a state into the result dict aggregate() returns for a group."""
+    result = {}
+    for col, func in agg_func_map.items():
+        if func == 'count':
+            result[col] = state['__rows__']
+        elif func == 'avg':
+            total, count = state[col]
+            result[col] = total / count if count > 0 else 0
+        elif func in SUPPORTED_FUNCS:
+            result[col] = state[col]
+    return result
+
+
+def aggregate_rows(rows, key_func, agg_func_map):
+    """
+    Streams rows into {group_key: state}. Rows whose key is None are
+    skipped, as in groupby(). Key order is first appearance.
+    """
+    states = {}
+    for row in rows:
+        key = key_func(row)
+        if key is None:
+            continue
+        state = states.get(key)
+        if state is None:
+            state = states[key] = new_state(agg_func_map)
+        update_state(state, row, agg_func_map)
+    return states
+
+
+def merge_states(partials, agg_func_map):
+    """Merges per-partition {key: state} dicts in partition order."""
+    merged = {}
+    for states in partials:
+        execution.check_cancelled()
+        for key, state in states.items():
+            if key in merged:
+                merge_state(merged[key], state, agg_func_map)
+            else:
+                merged[key] = state
+    return merged
@@ -0,0 +1,400 @@
+# engine/column_stats.py
+"""
+Per-column statistics collected in one pass at ingest time.
+
+For every column:
+  - nulls:     number of missing values
+  - min / max: over the values of the column's type
+  - distinct:  approximate distinct count (exact up to DISTINCT_SKETCH_SIZE)
+  - sorted:    'asc' / 'desc' if the non-null values are monotonic, else None
+  - histogram: equi-depth bucket bounds from a deterministic sample
+  - top:       most frequent values as [value, approximate count]
+  - mixed:     True if some values do not have the column's type
+
+Rows are processed in batches so most of the work happens in C
+(min/max/sorted/Counter over lists) rather than per value in Python.
+
+The helpers at the bottom turn statistics into selectivity estimates
+(used by engine.planner) and into "can this predicate match at all"
+answers (used by DataFrame.filter to skip scans).
+"""
+import bisect
+import heapq
+import operator
+import os
+import random
+from collections import Counter
+
+BATCH_SIZE = 4096
+DISTINCT_SKETCH_SIZE = 2048
+HISTOGRAM_BUCKETS = 16
+SAMPLE_PER_BATCH = 128
+SAMPLE_CAPACITY = 8192
+TOP_N = 10
+_TOP_TRACKED = 1024
+_NUMBER_TYPES = {int, float}
+_HASH_SPACE = 2 ** 64
+_HASH_OFFSET = 2 ** 63  # hash() is signed
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'str'
+    return None
+
+
+class ColumnStatsBuilder:
+    """Accumulates the statistics of one column, one batch of values at a time."""
+
+    def __init__(self, column_type, seed=0):
+        self.kind = 'number' if column_type in ('int', 'float') else 'str'
+        self.count = 0
+        self.nulls = 0
+        self.mixed = False
+        self.min = None
+        self.max = None
+        self.ascending = True
+        self.descending = True
+        self._last = None
+        self._hashes = set()        # the smallest hashes seen (KMV sketch)
+        self._threshold = None
+        self._top = Counter()
+        self._sample = []
+        self._rng = random.Random(seed)
+
+    def add_batch(self, values):
+        self.count += len(values)
+        present = [v for v in values if v is not None]
+        self.nulls += len(values) - len(present)
+        if not present:
+            return
+
+        # Checking the set of types is much cheaper than isinstance per value
+        expected = _NUMBER_TYPES if self.kind == 'number' else {str}
+        if set(map(type, present)) <= expected:
+            typed = present
+        else:
+            self.mixed = True
+            typed = [v for v in present if type(v) in expected]
+
+        if typed:
+            self._add_ordered(typed)
+
+        self._add_distinct(present)
+        self._add_frequent(present)
+
+    def _add_ordered(self, typed):
+        low, high = min(typed), max(typed)
+        self.min = low if self.min is None or low < self.min else self.min
+        self.max = high if self.max is None or high > self.max else self.max
+
+        if self.ascending:
+            self.ascending = ((self._last is None or self._last <= typed[0])
+                              and typed == sorted(typed))
+        if self.descending:
+            self.descending = ((self._last is None or self._last >= typed[0])
+                               and typed == sorted(typed, reverse=True))
+        self._last = typed[-1]
+
+        take = min(len(typed), SAMPLE_PER_BATCH)
+        self._sample.extend(self._rng.sample(typed, take))
+        if len(self._sample) > SAMPLE_CAPACITY:
+            self._sample = self._rng.sample(self._sample, SAMPLE_CAPACITY // 2)
+
+    def _add_distinct(self, present):
+        # K minimum values: keep the DISTINCT_SKETCH_SIZE smallest hashes.
+        # Hashing 1-tuples mixes the bits of int hashes (hash(n) == n).
+        fresh = set(map(hash, zip(present)))
+        if self._threshold is not None:
+            fresh = filter(self._threshold.__ge__, fresh)
+        self._hashes.update(fresh)
+        if len(self._hashes) > DISTINCT_SKETCH_SIZE:
+            self._hashes = set(heapq.nsmallest(DISTINCT_SKETCH_SIZE, self._hashes))
+            self._threshold = max(self._hashes)
+
+    def _add_frequent(self, present):
+        try:
+            self._top.update(present)
+        except TypeError:  # unhashable values (not produced by the parser)
+            return
+        if len(self._top) > 2 * _TOP_TRACKED:
+            self._top = Counter(dict(self._top.most_common(_TOP_TRACKED)))
+
+    def distinct(self):
+        if self._threshold is None:
+            return len(self._hashes)
+        fraction = (self._threshold + _HASH_OFFSET + 1) / _HASH_SPACE
+        return int((DISTINCT_SKETCH_SIZE - 1) / fraction)
+
+    def histogram(self):
+        if not self._sample:
+            return []
+        ordered = sorted(self._sample)
+        n = len(ordered)
+        buckets = min(HISTOGRAM_BUCKETS, n)
+        return [ordered[min(n - 1, (i * n) // buckets)] for i in range(buckets)] + [ordered[-1]]
+
+    def result(self):
+        non_null = self.count - self.nulls
+        sortedness = None
+        if self.min is not None and not self.mixed:
+            if self.ascending:
+                sortedness = 'asc'
+            elif self.descending:
+                sortedness = 'desc'
+        return {
+            'nulls': self.nulls,
+            'min': self.min,
+            'max': self.max,
+            'distinct': min(self.distinct(), non_null),
+            'sorted': sortedness,
+            'histogram': self.histogram(),
+            'top': [[value, count] for value, count in self._top.most_common(TOP_N)],
+            'mixed': self.mixed,
+        }
+
+
+def collect_stats(rows, header, column_types=None, batch_size=BATCH_SIZE):
+    """
+    Computes statistics for every column of a row stream.
+    Returns {'row_count': n, 'columns': {column: stats}}.
+    """
+    column_types = column_types or {}
+    builders = {col: ColumnStatsBuilder(column_types.get(col, 'str'), seed=i)
+                for i, col in enumerate(header)}
+    row_count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            row_count += _flush(batch, builders)
+            batch = []
+    if batch:
+        row_count += _flush(batch, builders)
+    return {
+        'row_count': row_count,
+        'columns': {col: builder.result() for col, builder in builders.items()},
+    }
+
+
+def merge_stats(old, new):
+    """
+    Statistics of a table made of the rows described by `old` followed by
+    the rows described by `new` (e.g. an appended export), without
+    re-reading either. Counts, min/max, order and the top values merge
+    exactly (top counts stay approximate); distinct counts and histograms
+    are estimated from the two summaries.
+    """
+    columns = {}
+    for col, a in old['columns'].items():
+        b = new['columns'].get(col)
+        columns[col] = a if b is None else _merge_column(a, old['row_count'], b, new['row_count'])
+    return {'row_count': old['row_count'] + new['row_count'], 'columns': columns}
+
+
+def _merge_column(a, a_rows, b, b_rows):
+    if a['min'] is None:
+        low, high = b['min'], b['max']
+    elif b['min'] is None:
+        low, high = a['min'], a['max']
+    else:
+        try:
+            low, high = min(a['min'], b['min']), max(a['max'], b['max'])
+        except TypeError:
+            low, high = a['min'], a['max']
+
+    # Disjoint value ranges share no values, and neither (most likely) do
+    # two sides of (nearly) unique values; otherwise assume the larger side
+    # already holds most of the other's values
+    a_distinct, b_distinct = a.get('distinct', 0), b.get('distinct', 0)
+    disjoint = a['min'] is None or b['min'] is None or (
+        a_distinct >= 0.9 * (a_rows - a['nulls']) and b_distinct >= 0.9 * (b_rows - b['nulls']))
+    if not disjoint:
+        try:
+            disjoint = b['min'] > a['max'] or b['max'] < a['min']
+        except TypeError:
+            disjoint = False
+    distinct = a_distinct + b_distinct if disjoint else max(a_distinct, b_distinct)
+    nulls = a['nulls'] + b['nulls']
+
+    sortedness = None
+    if a['min'] is None or b['min'] is None:
+        sortedness = a['sorted'] if b['min'] is None else b['sorted']
+    elif a['sorted'] == b['sorted'] == 'asc' and _ordered(a['max'], b['min']):
+        sortedness = 'asc'
+    elif a['sorted'] == b['sorted'] == 'desc' and _ordered(b['max'], a['min']):
+        sortedness = 'desc'
+
+    top = Counter()
+    for value, count in (a.get('top') or []) + (b.get('top') or []):
+        try:
+            top[value] += count
+        except TypeError:
+            continue
+
+    return {
+        'nulls': nulls,
+        'min': low,
+        'max': high,
+        'distinct': min(distinct, a_rows + b_rows - nulls),
+        'sorted': sortedness,
+        'histogram': _merge_histograms(a.get('histogram') or [], a_rows - a['nulls'],
+                                       b.get('histogram') or [], b_rows - b['nulls']),
+        'top': [[value, count] for value, count in top.most_common(TOP_N)],
+        'mixed': a['mixed'] or b['mixed'],
+    }
+
+
+def _ordered(low, high):
+    try:
+        return low <= high
+    except TypeError:
+        return False
+
+
+def _merge_histograms(a, a_count, b, b_count):
+    """Equi-depth bounds of the union, weighting each side's bounds by its row count."""
+    if not a or not b:
+        return a or b
+    weighted = [(v, a_count / len(a)) for v in a] + [(v, b_count / len(b)) for v in b]
+    try:
+        weighted.sort(key=operator.itemgetter(0))
+    except TypeError:
+        return a if a_count >= b_count else b
+    total = sum(w for _, w in weighted)
+    buckets = min(HISTOGRAM_BUCKETS, len(weighted) - 1)
+    bounds, seen, target = [], 0.0, 0
+    for value, weight in weighted:
+        seen += weight
+        while target < buckets and seen >= total * target / buckets:
+            bounds.append(value)
+            target += 1
+    bounds.append(weighted[-1][0])
+    return bounds
+
+
+def _flush(batch, builders):
+    for col, builder in builders.items():
+        builder.add_batch(list(map(operator.methodcaller('get', col), batch)))
+    return len(batch)
+
+
+# ---------- Using statistics ----------
+
+def _comparable(col_stats, value):
+    """True if `value` can be ordered against the column's min/max."""
+    if col_stats.get('min') is None or col_stats.get('mixed'):
+        return False
+    return _kind(value) is not None and _kind(value) == _kind(col_stats['min'])
+
+
+def may_match(col_stats, row_count, op, value):
+    """
+    False only if no row can satisfy `column <op> value`, judging from the
+    column's statistics. Anything uncertain answers True.
+    """
+    if col_stats is None:
+        return True
+    nulls = col_stats.get('nulls', 0)
+    if op == 'is' and value is None:
+        return nulls > 0
+    if op == 'is not' and value is None:
+        return nulls < row_count
+    if op == 'in' and isinstance(value, (list, tuple, set)):
+        return any(may_match(col_stats, row_count, '==', v) for v in value)
+    if not _comparable(col_stats, value):
+        return True
+
+    low, high = col_stats['min'], col_stats['max']
+    if op == '==':
+        return low <= value <= high
+    if op == '!=':
+        return nulls > 0 or not (low == high == value)
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    return True
+
+
+def _fraction_below(col_stats, value, inclusive):
+    """Fraction of non-null values below (or at) `value`, from the histogram."""
+    bounds = col_stats.get('histogram') or []
+    if len(bounds) < 2:
+        low, high = col_stats['min'], col_stats['max']
+        bounds = [low, high]
+    if value < bounds[0]:
+        return 0.0
+    if value > bounds[-1] or (inclusive and value == bounds[-1]):
+        return 1.0
+
+    buckets = len(bounds) - 1
+    find = bisect.bisect_right if inclusive else bisect.bisect_left
+    i = max(0, min(buckets - 1, find(bounds, value) - 1))
+    within = 0.5
+    lo, hi = bounds[i], bounds[i + 1]
+    if _kind(value) == 'number' and hi > lo:
+        within = min(1.0, max(0.0, (value - lo) / (hi - lo)))
+    return (i + within) / buckets
+
+
+def selectivity(col_stats, row_count, op, value):
+    """Estimated fraction of rows satisfying `column <op> value`, or None if unknown."""
+    if col_stats is None or not row_count:
+        return None
+    nulls = col_stats.get('nulls', 0)
+    non_null = max(row_count - nulls, 0) / row_count
+    if op == 'is' and value is None:
+        return nulls / row_count
+    if op == 'is not' and value is None:
+        return non_null
+    if not may_match(col_stats, row_count, op, value):
+        return 0.0
+
+    if op in ('==', '!=', 'in'):
+        values = value if op == 'in' and isinstance(value, (list, tuple, set)) else [value]
+        top = {v: c for v, c in (col_stats.get('top') or []) if not isinstance(v, list)}
+        top_total = sum(top.values())
+        others = max(col_stats.get('distinct', 0) - len(top), 1)
+        rest = max(row_count - nulls - top_total, 0) / row_count
+        equal = 0.0
+        for v in values:
+            try:
+                equal += top[v] / row_count if v in top else rest / others
+            except TypeError:
+                equal += rest / others
+        equal = min(equal, non_null)
+        return non_null - equal if op == '!=' else equal
+
+    if op in ('<', '<=', '>', '>=') and _comparable(col_stats, value):
+        below = _fraction_below(col_stats, value, inclusive=op in ('<=', '>'))
+        return non_null * (below if op in ('<', '<=') else 1 - below)
+    return None
+
+
+def file_signature(filepath):
+    """
+    What statistics and the sidecar files built from a CSV file record
+    about it: {'bytes': size, 'mtime_ns': modification time}.
+    """
+    stat = os.stat(filepath)
+    return {'bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def stats_match_file(stats, signature):
+    """
+    True if stats (or a sidecar) were computed for the file as
+    `signature` (see file_signature()) describes it now, i.e. are still
+    current. The modification time catches a rewrite of the same size;
+    records without one are out of date.
+    """
+    return bool(stats) and stats.get('bytes') == signature['bytes'] \
+        and stats.get('mtime_ns') == signature['mtime_ns']
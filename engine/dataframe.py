@@ -1,28 +1,218 @@
 # engine/dataframe.py
+import itertools
+import os
+import shutil
+import tempfile
 from .parser import CsvParser
+from . import execution
+from . import parallel
+from . import profiling
+from .profiling import operator
+from .aggregation import (GroupBy, DATE_BUCKETS, SUPPORTED_FUNCS, aggregate_rows, group_key, key_columns,
+                          merge_states, finalize_state)
+from .column_stats import collect_stats, file_signature, merge_stats, may_match, stats_match_file
+from . import zone_maps
+from . import indexes
+from . import rollups
+from . import partitions
+from . import window
 import types
 
+
+# ---------- Per-partition tasks ----------
+# Module-level so the serial path and the parallel path (engine.parallel)
+# run exactly the same code over a stream of rows.
+
+def _filter_rows(rows, condition_func):
+    return [row for row in rows if condition_func(row)]
+
+
+def _filter_rows_pushed(rows, condition_func):
+    """Like _filter_rows, but keeps the rows whose condition raises."""
+    kept = []
+    for row in rows:
+        try:
+            if not condition_func(row):
+                continue
+        except Exception:
+            pass
+        kept.append(row)
+    return kept
+
+
+def _count_rows(rows):
+    count = 0
+    for _ in rows:
+        count += 1
+    return count
+
+
+def _extreme_row(rows, column_name, want_max):
+    """Returns (value, row) of the first row with the max (or min) value, or None."""
+    best_row = None
+    best_val = float("-inf") if want_max else float("inf")
+    for row in rows:
+        val = row.get(column_name)
+        if val is None:
+            continue
+        try:
+            v = float(val)
+        except (ValueError, TypeError):
+            continue
+        if (v > best_val) if want_max else (v < best_val):
+            best_val = v
+            best_row = row
+    return None if best_row is None else (best_val, best_row)
+
+
+def _top_k_rows(rows, column_name, k):
+    """Returns the k (value, row) pairs with the largest values, stable on ties."""
+    buffer = []
+    for row in rows:
+        val = row.get(column_name)
+        if val is None:
+            continue
+        try:
+            v = float(val)
+        except Exception:
+            continue
+        buffer.append((v, row))
+    buffer.sort(key=lambda x: x[0], reverse=True)
+    return buffer[:k]
+
+
+def _join_key(on):
+    """Function returning a row's join key: a value, or a tuple of values for a composite key."""
+    if isinstance(on, tuple):
+        return lambda row: tuple([row.get(c) for c in on])
+    return lambda row: row.get(on)
+
+
+def _merge_rows(left_row, right_row, right_columns, filepath_tag):
+    # right_columns: the right key column(s), as a tuple
+    new_row = left_row.copy()
+    for key, value in right_row.items():
+        if key in right_columns:
+            continue
+        if key not in new_row:
+            new_row[key] = value
+        else:
+            new_row[f"{filepath_tag}.{key}"] = value
+    return new_row
+
+
+def _probe_rows(left_rows, right_rows_by_key, left_on, right_on, filepath_tag):
+    """Streams left rows against the build-side hash table of an inner join."""
+    joined_data = []
+    left_key = _join_key(left_on)
+    right_columns = right_on if isinstance(right_on, tuple) else (right_on,)
+    for left_row in left_rows:
+        key = left_key(left_row)
+        if key in right_rows_by_key:
+            for right_row in right_rows_by_key[key]:
+                joined_data.append(_merge_rows(left_row, right_row, right_columns, filepath_tag))
+    return joined_data
+
+
+def _probe_rows_build_left(right_rows, left_rows_by_key, right_on, filepath_tag):
+    """
+    Streams right rows against a hash table built from the left side.
+    Returns (left position, joined row) pairs; sorting them by position
+    restores the order of the left-build join.
+    """
+    matches = []
+    right_key = _join_key(right_on)
+    right_columns = right_on if isinstance(right_on, tuple) else (right_on,)
+    for right_row in right_rows:
+        key = right_key(right_row)
+        if key in left_rows_by_key:
+            for position, left_row in left_rows_by_key[key]:
+                matches.append((position, _merge_rows(left_row, right_row, right_columns, filepath_tag)))
+    return matches
+
+
+def _intersect_parts(a, b):
+    """Scan partitions covering what two sorted lists of scan partitions both cover."""
+    parts = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, stop = max(a[i][1], b[j][1]), min(a[i][2], b[j][2])
+        if start < stop:
+            parts.append((a[i][0], start, stop))
+        if a[i][2] < b[j][2]:
+            i += 1
+        else:
+            j += 1
+    return parts
+
+
+def _key_filter(on, rows_by_key):
+    """
+    The key_filter (see CsvParser.parse_range) dropping rows whose join key
+    is not in `rows_by_key`; for a composite key, checked on the first column.
+    """
+    if isinstance(on, tuple):
+        return (on[0], {key[0] for key in rows_by_key})
+    return (on, rows_by_key)
+
+
+def _partial_aggregate(rows, column_name, agg_func_map, bucket=None):
+    return aggregate_rows(rows, group_key(column_name, bucket), agg_func_map)
+
+
+def _partial_pivot(rows, columns, agg_func_map, bucket, max_columns):
+    """aggregate_rows() by (index..., pivot column), failing once the pivot column has too many values."""
+    key_func = group_key(columns, bucket)
+    seen = set()
+
+    def capped_key(row):
+        key = key_func(row)
+        if key is not None and key[-1] not in seen:
+            seen.add(key[-1])
+            if len(seen) > max_columns:
+                raise ValueError(f"pivot: '{columns[-1]}' has more than {max_columns} distinct values; "
+                                 f"filter the rows or use a coarser bucket")
+        return key
+    return aggregate_rows(rows, capped_key, agg_func_map)
+
+
 class DataFrame:
     """
     A custom DataFrame structure that can be sourced from a file (via CsvParser)
     or from an in-memory list of dicts (for example, from a join).
+
+    A file-backed DataFrame may also be given a shared-memory `segment`
+    (see engine.segments); scans then read the columnar copy instead of
+    re-parsing the CSV, and the column `stats` computed at ingest (see
+    engine.column_stats), used for row counts, filter pruning and join
+    build-side choice as long as the file has not changed.
     """
 
-    def __init__(self, source):
+    # A join builds its hash table on the left side instead of the right
+    # when the right side is estimated to be this many times larger
+    BUILD_SIDE_RATIO = 4
+    # pivot() refuses grids wider than this many columns
+    PIVOT_MAX_COLUMNS = 100
+
+    def __init__(self, source, column_types=None, segment=None, stats=None):
         self.source_type = 'list'
         self.data = []
         self.header = []
         self.parser = None
         self.filepath = None
         self.column_types = {}
+        self.segment = None
+        self.stats = None
 
         if isinstance(source, str):  # Source is a filepath
             self.source_type = 'file'
-            self.parser = CsvParser(source)
+            self.parser = CsvParser(source, column_types=column_types)
             self.header = self.parser.get_header()
             self.filepath = source
             # Get types from the parser
             self.column_types = self.parser.get_column_types()
+            self.segment = segment
+            self.stats = stats
 
         elif isinstance(source, list):  # Source is in-memory data
             self.source_type = 'list'
@@ -47,24 +237,182 @@ class DataFrame:
         """Public method to access the column types."""
         return self.column_types
 
-    def _get_data(self):
+    def current_stats(self):
+        """Returns the ingest statistics if they still describe the file, else None."""
+        if self.stats is None or self.source_type != 'file':
+            return None
+        try:
+            return self.stats if stats_match_file(self.stats, file_signature(self.filepath)) else None
+        except OSError:
+            return None
+
+    def compute_stats(self, zone_map=False, rollups_to_build=None):
+        """
+        One pass over the data computing per-column statistics (see
+        engine.column_stats). With zone_map=True a file-backed DataFrame
+        also builds its block zone map (see engine.zone_maps) in the same
+        pass and stores it next to the file, and likewise the rollups
+        listed in `rollups_to_build` (see engine.rollups.choose).
+        """
+        if self.source_type != 'file':
+            return collect_stats(self._get_data(), self.header, self.column_types)
+
+        signature = file_signature(self.filepath)
+        zone_builder = zone_maps.ZoneMapBuilder(self.header, self.column_types) if zone_map else None
+        rollup_builder = rollups.RollupBuilder(rollups_to_build) if rollups_to_build else None
+        if zone_builder is None:
+            rows = self._get_data()
+        else:
+            located = self.parser.parse_range(self.parser.data_start(), offsets=True)
+            rows = execution.guard(zone_builder.track(located))
+        if rollup_builder is not None:
+            rows = rollup_builder.track(rows)
+        stats = collect_stats(rows, self.header, self.column_types)
+        if zone_builder is not None:
+            zone_maps.write_zone_map(self.filepath, zone_builder.result(signature['bytes'], signature['mtime_ns']))
+        if rollup_builder is not None:
+            rollups.write_rollups(self.filepath, rollup_builder.result(signature['bytes'], signature['mtime_ns']))
+        stats.update(signature)
+        return stats
+
+    def append_csv(self, filepath, rollups_to_build=None):
+        """
+        Appends the data rows of another CSV file with the same header to
+        this file-backed DataFrame's file, as one more segment of the table.
+
+        Only the appended rows are read: their statistics are merged into
+        the current ones (see engine.column_stats.merge_stats) and they are
+        added to the zone map, the indexes, the rollups and, clustered by
+        partition, to the partition map (see engine.partitions). If the table's
+        statistics are not current, the whole file is analyzed again
+        instead, building `rollups_to_build`. Returns the new statistics.
+        """
+        if self.source_type != 'file':
+            raise ValueError("Only file-backed DataFrames can be appended to")
+        incoming = CsvParser(filepath, column_types=self.column_types)
+        if incoming.get_header() != self.header:
+            raise ValueError(f"Appended file must have the columns {self.header}, "
+                             f"got {incoming.get_header()}")
+
+        # Sidecars describe the file as it is now: load them before it grows
+        stats = self.current_stats()
+        previous = file_signature(self.filepath)
+        zone_map = zone_maps.load(self.filepath)
+        existing_rollups = rollups.load(self.filepath)
+        partition_map = partitions.load(self.filepath)
+
+        # A partitioned table gets the new rows clustered by partition too
+        clustered = clustered_path = None
+        if partition_map is not None:
+            fd, clustered_path = tempfile.mkstemp(dir=os.path.dirname(self.filepath) or '.', suffix='.csv')
+            os.close(fd)
+            shutil.copyfile(filepath, clustered_path)
+            clustered = partitions.cluster(clustered_path, partition_map.column, partition_map.scheme,
+                                           partition_map.buckets, self.column_types)
+        else:
+            partitions.remove(self.filepath)
+        try:
+            with open(self.filepath, 'rb+') as out, open(clustered_path or filepath, 'rb') as source:
+                out.seek(0, os.SEEK_END)
+                if previous['bytes']:
+                    out.seek(previous['bytes'] - 1)
+                    if out.read(1) not in (b'\n', b'\r'):
+                        out.write(b'\n')
+                start = out.tell()
+                source.seek(incoming.data_start())
+                shutil.copyfileobj(source, out)
+                if out.tell() > start:
+                    out.seek(out.tell() - 1)
+                    if out.read(1) != b'\n':
+                        out.write(b'\n')
+        finally:
+            if clustered_path is not None:
+                os.remove(clustered_path)
+        signature = file_signature(self.filepath)
+
+        if stats is None:
+            # Nothing current to extend: analyze the whole table again
+            indexed = indexes.indexed_columns(self.filepath)
+            rollups.remove(self.filepath)
+            if partition_map is not None:
+                partitions.partition_file(self.filepath, partition_map.column, partition_map.scheme,
+                                          partition_map.buckets, self.column_types)
+            stats = self.compute_stats(zone_map=True, rollups_to_build=rollups_to_build)
+            indexes.create_indexes(self.parser, indexed)
+            self.stats = stats
+            return stats
+
+        first_row = stats['row_count']
+        located = self.parser.parse_range(start, offsets=True)
+        zone_builder = zone_maps.ZoneMapBuilder(self.header, self.column_types,
+                                                block_rows=zone_map.block_rows if zone_map else None,
+                                                first_row=first_row)
+        rows = execution.guard(zone_builder.track(located))
+        rollup_builder = None
+        if existing_rollups is not None:
+            rollup_builder = rollups.RollupBuilder(existing_rollups.chosen(), extending=True)
+            rows = rollup_builder.track(rows)
+        appended = collect_stats(rows, self.header, self.column_types)
+
+        if zone_map is not None:
+            zone_maps.extend_zone_map(self.filepath, zone_map,
+                                      zone_builder.result(signature['bytes'], signature['mtime_ns']))
+        else:
+            zone_maps.remove(self.filepath)
+        if rollup_builder is not None:
+            rollups.extend_rollups(self.filepath, existing_rollups,
+                                   rollup_builder.result(signature['bytes'], signature['mtime_ns']))
+        else:
+            rollups.remove(self.filepath)
+        indexes.extend_indexes(self.parser, start, first_row, previous=previous)
+        if partition_map is not None:
+            partitions.extend_partition_map(self.filepath, partition_map, clustered, start, first_row)
+
+        stats = merge_stats(stats, appended)
+        stats.update(signature)
+        self.stats = stats
+        return stats
+
+    def estimated_rows(self):
+        """Row count if it is known without scanning, else None."""
+        if self.source_type == 'list':
+            return len(self.data)
+        if self.segment is not None:
+            return self.segment.row_count
+        stats = self.current_stats()
+        return stats['row_count'] if stats else None
+
+    def _get_data(self, key_filter=None):
         """
         Internal helper to get a fresh iterator of all data.
+        A file-backed scan can be limited to the rows whose key passes a
+        (column, keys) semi-join filter (see CsvParser.parse_range).
         """
         if self.source_type == 'file':
-            return self.parser.parse()
+            if self.segment is not None:
+                profiling.add_bytes_read(self.segment.nbytes)
+                return execution.guard(self.segment.rows(key_filter=key_filter))
+            if profiling.active() is not None:
+                profiling.add_bytes_read(os.path.getsize(self.filepath))
+            if key_filter is not None:
+                return execution.guard(self.parser.parse_range(self.parser.data_start(),
+                                                               key_filter=key_filter))
+            return execution.guard(self.parser.parse())
         else:  # 'list'
-            return iter(self.data)  # Return an iterator for consistency
+            return execution.guard(iter(self.data))  # Return an iterator for consistency
 
+    @operator('len')
     def __len__(self):
         """
         Allows len(df) to work.
         """
         if self.source_type == 'file':
-            count = 0
-            for _ in self.parser.parse():  # Use a fresh generator
-                count += 1
-            return count
+            known = self.estimated_rows()
+            if known is not None:
+                return known
+            if parallel.should_parallelize(self):
+                return sum(parallel.map_partitions(self, _count_rows))
+            return _count_rows(self._get_data())  # Use a fresh generator
         else:  # 'list'
             return len(self.data)
 
@@ -114,14 +462,179 @@ class DataFrame:
             sample_count += 1
         return types
 
-    def filter(self, condition_func):
+    @operator('filter')
+    def filter(self, condition_func, predicates=None, pushed=False):
         """
         Implements the selection operation.
         Returns a new DataFrame with the filtered data.
+
+        `predicates` optionally lists conjuncts implied by condition_func as
+        (column, op, value) tuples (see engine.planner.annotate). They never
+        change the result: the scan is skipped only when the column
+        statistics prove that no row can match.
+
+        `pushed` marks a copy of a filter that engine.optimizer moved below
+        a join. Rows whose condition raises are kept: the original filter,
+        still applied above the join, decides what happens to them.
         """
-        filtered_data = [row for row in self._get_data() if condition_func(row)]
+        if predicates and self._cannot_match(predicates):
+            return DataFrame(source=[])
+
+        filter_rows = _filter_rows_pushed if pushed else _filter_rows
+        located = self._index_lookup(predicates) if predicates else None
+        if located is not None:
+            return DataFrame(source=filter_rows(self._rows_at(located), condition_func))
+        blocks = self._matching_blocks(predicates) if predicates else None
+        if blocks == []:
+            return DataFrame(source=[])
+        if parallel.should_parallelize(self):
+            parts = parallel.map_partitions(self, filter_rows, condition_func, parts=blocks)
+            filtered_data = [row for part in parts for row in part]
+        elif blocks is not None:
+            rows = itertools.chain.from_iterable(parallel.scan_partition(self, block) for block in blocks)
+            filtered_data = filter_rows(rows, condition_func)
+        else:
+            filtered_data = filter_rows(self._get_data(), condition_func)
         return DataFrame(source=filtered_data)
 
+    def iter_rows(self):
+        """Yields the rows one at a time, without materializing them."""
+        return self._get_data()
+
+    def iter_filter(self, condition_func, predicates=None):
+        """
+        Lazy filter(): yields the matching rows one at a time, reading the
+        table serially with the same index and zone map pruning, so memory
+        stays constant however many rows match. Used to stream exports.
+        """
+        if predicates and self._cannot_match(predicates):
+            return
+        located = self._index_lookup(predicates) if predicates else None
+        if located is not None:
+            rows = self._rows_at(located)
+        else:
+            blocks = self._matching_blocks(predicates) if predicates else None
+            if blocks is None:
+                rows = self._get_data()
+            else:
+                rows = itertools.chain.from_iterable(parallel.scan_partition(self, block) for block in blocks)
+        for row in rows:
+            if condition_func(row):
+                yield row
+
+    def iter_join(self, right_dataframe, left_on, right_on):
+        """
+        Lazy join(): hashes the right side and yields the joined rows while
+        the left side is scanned, so only the right table is held in
+        memory. Same rows in the same order as join(). Used to stream
+        exports.
+        """
+        filepath_tag = right_dataframe.filepath if right_dataframe.filepath else 'joined'
+        left_on, right_on = key_columns(left_on), key_columns(right_on)
+        if isinstance(left_on, tuple) != isinstance(right_on, tuple) \
+                or isinstance(left_on, tuple) and len(left_on) != len(right_on):
+            raise ValueError("Join keys must have the same number of columns on both sides")
+
+        right_rows_by_key = {}
+        right_key = _join_key(right_on)
+        for right_row in right_dataframe._get_data():
+            right_rows_by_key.setdefault(right_key(right_row), []).append(right_row)
+
+        left_key = _join_key(left_on)
+        right_columns = right_on if isinstance(right_on, tuple) else (right_on,)
+        for left_row in self._get_data(_key_filter(left_on, right_rows_by_key)):
+            for right_row in right_rows_by_key.get(left_key(left_row), ()):
+                yield _merge_rows(left_row, right_row, right_columns, filepath_tag)
+
+    def _index_lookup(self, predicates):
+        """
+        (row number, byte offset) pairs of the candidate rows of the most
+        selective indexed predicate, or None to scan instead.
+        """
+        if self.source_type != 'file':
+            return None
+        best = None
+        for column, op, value in predicates:
+            if op not in ('==', 'in', '<', '<=', '>', '>='):
+                continue
+            index = indexes.load(self.filepath, column)
+            if index is None or index.mixed \
+                    or not self._index_accepts(column, value if op == 'in' else [value]):
+                continue
+            if op in ('==', 'in'):
+                count = index.count(value if op == 'in' else [value])
+            else:
+                count = index.range_count(op, value)
+            if best is None or count < best[0]:
+                best = (count, index, op, value)
+        if best is None:
+            return None
+        count, index, op, value = best
+        if count > indexes.MAX_FRACTION * max(self.estimated_rows() or 0, len(index)):
+            return None
+        if op in ('==', 'in'):
+            return index.lookup(value if op == 'in' else [value])
+        return index.range_lookup(op, value)
+
+    def _index_accepts(self, column, values):
+        """True if the values compare with the column's values the way the index orders them."""
+        if not isinstance(values, (list, tuple, set)):
+            return False
+        want_str = self.column_types.get(column) == 'str'
+        return all(not isinstance(v, bool) and isinstance(v, (int, float, str))
+                   and isinstance(v, str) == want_str for v in values)
+
+    def _rows_at(self, located):
+        """Rows at (row number, byte offset) pairs given in row order."""
+        if self.segment is not None:
+            return execution.guard(self.segment.take(row for row, _ in located))
+        return execution.guard(self.parser.parse_at(offset for _, offset in located))
+
+    def create_index(self, column):
+        """
+        Builds and stores a persistent index on a column of a file-backed
+        DataFrame (see engine.indexes). filter() and join() use it from then on.
+        """
+        if self.source_type != 'file':
+            raise ValueError("Only file-backed DataFrames can be indexed")
+        if column not in self.header:
+            raise KeyError(f"Column '{column}' not found")
+        return indexes.create_index(self.parser, column)
+
+    def _matching_blocks(self, predicates):
+        """
+        Scan partitions covering only the table partitions (see
+        engine.partitions) and zone map blocks the predicates cannot rule
+        out, or None to scan everything.
+        """
+        if self.source_type != 'file':
+            return None
+        by_rows = self.segment is not None
+        parts = None
+        partition_map = partitions.load(self.filepath)
+        if partition_map is not None:
+            kept = partition_map.matching(predicates)
+            if len(kept) < len(partition_map):
+                parts = partition_map.scan_parts(kept, by_rows)
+        zone_map = zone_maps.load(self.filepath)
+        if zone_map is not None:
+            blocks = zone_map.matching_blocks(predicates)
+            if len(blocks) < len(zone_map):
+                block_parts = zone_map.partitions(blocks, by_rows)
+                parts = block_parts if parts is None else _intersect_parts(parts, block_parts)
+        return parts
+
+    def _cannot_match(self, predicates):
+        stats = self.current_stats()
+        if stats is None:
+            return False
+        columns = stats.get('columns', {})
+        for column, op, value in predicates:
+            if not may_match(columns.get(column), stats['row_count'], op, value):
+                return True
+        return False
+
+    @operator('project')
     def project(self, columns):
         """
         Implements the projection (column selection) operation.
@@ -133,21 +646,46 @@ class DataFrame:
             projected_data.append(new_row)
         return projected_data
 
-    def groupby(self, column_name):
+    def groupby(self, column_name, bucket=None):
         """
         Implements the group-by operation.
-        Returns a dictionary where keys are group values
-        and values are lists of rows.
+        Returns a mapping where keys are group values
+        and values are lists of rows (materialized on first access).
+
+        `column_name` may be a list of columns: groups are then keyed by
+        the tuple of their values, and rows with a None in any of them are
+        skipped. `bucket` ('day', 'month' or 'year') groups a date column
+        (the last one of a list) by the date's prefix, e.g. '2024-03' by
+        month; non-date values are skipped.
         """
+        if bucket is not None and bucket not in DATE_BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {', '.join(DATE_BUCKETS)}")
+        return GroupBy(self, key_columns(column_name), bucket)
+
+    @operator('groupby')
+    def _group_rows(self, column_name, bucket=None):
         groups = {}
+        key_func = group_key(column_name, bucket)
         for row in self._get_data():
-            key = row.get(column_name)
+            key = key_func(row)
             if key is not None:
                 if key not in groups:
                     groups[key] = []
                 groups[key].append(row)
         return groups
 
+    @operator('aggregate_scan')
+    def _aggregate_states(self, column_name, agg_func_map, bucket=None):
+        """
+        One streaming pass computing partial aggregate states per group,
+        split across partitions when the table is large enough.
+        """
+        if parallel.should_parallelize(self):
+            partials = parallel.map_partitions(self, _partial_aggregate, column_name, agg_func_map, bucket)
+            return merge_states(partials, agg_func_map)
+        return _partial_aggregate(self._get_data(), column_name, agg_func_map, bucket)
+
+    @operator('aggregate')
     def aggregate(self, groups, agg_func_map):
         """
         Implements the aggregation operation.
@@ -155,8 +693,22 @@ class DataFrame:
         Returns a dictionary (not a DataFrame).
         Supported functions: count, sum, avg, min, max.
         """
+        if isinstance(groups, GroupBy) and not groups.materialized:
+            # A rollup built at ingest answers it without reading the table
+            source = groups.source
+            if source.source_type == 'file':
+                available = rollups.load(source.filepath)
+                if available is not None:
+                    answer = available.answer(groups.column_name, groups.bucket, agg_func_map)
+                    if answer is not None:
+                        return answer
+            # Aggregate straight from the source, without building row lists
+            states = source._aggregate_states(groups.column_name, agg_func_map, groups.bucket)
+            return {key: finalize_state(state, agg_func_map) for key, state in states.items()}
+
         results = {}
         for key, rows in groups.items():
+            execution.check_cancelled()
             agg_result = {}
             for col, func in agg_func_map.items():
 
@@ -208,108 +760,292 @@ class DataFrame:
             results[key] = agg_result
         return results
 
-    def max_by(self, column_name):
+    @operator('pivot')
+    def pivot(self, index, columns, values=None, agg='sum', bucket=None, max_columns=None):
         """
-        Returns a list containing the single row with the maximum value
-        in column_name. Fully streamed; only one pass through the data.
+        Builds a grid in one aggregation pass: a row per `index` value (or
+        combination of values, for a list), a column per `columns` value,
+        each cell aggregating `values` with `agg` (one of count, sum, avg,
+        min, max; None for a missing combination). `bucket` groups a date
+        `columns` by day, month or year.
+        Returns a list of dicts, rows in first-appearance order and the
+        pivoted columns sorted.
         """
-        max_row = None
-        max_val = float("-inf")
+        if agg not in SUPPORTED_FUNCS:
+            raise ValueError(f"Unknown aggregate '{agg}', expected one of {', '.join(SUPPORTED_FUNCS)}")
+        if values is None and agg != 'count':
+            raise ValueError(f"pivot: '{agg}' needs a values column")
+        if bucket is not None and bucket not in DATE_BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {', '.join(DATE_BUCKETS)}")
+        index = key_columns(index)
+        index_columns = index if isinstance(index, tuple) else (index,)
+        if not isinstance(columns, str):
+            raise ValueError("pivot: columns must be a single column name")
+        max_columns = max_columns or self.PIVOT_MAX_COLUMNS
+        agg_func_map = {values or columns: agg}
 
-        for row in self._get_data():
-            val = row.get(column_name)
-            if val is None:
-                continue
+        key = index_columns + (columns,)
+        if parallel.should_parallelize(self):
+            # Each partition checks the cap on its own; the merged grid is checked below
+            partials = parallel.map_partitions(self, _partial_pivot, key, agg_func_map, bucket, max_columns)
+            states = merge_states(partials, agg_func_map)
+        else:
+            states = _partial_pivot(self._get_data(), key, agg_func_map, bucket, max_columns)
 
-            try:
-                v = float(val)
-            except (ValueError, TypeError):
-                continue
+        cells_by_index = {}
+        pivoted = {}
+        for group, state in states.items():
+            cells_by_index.setdefault(group[:-1], {})[group[-1]] = \
+                finalize_state(state, agg_func_map)[values or columns]
+            pivoted[group[-1]] = None
+        if len(pivoted) > max_columns:
+            raise ValueError(f"pivot: '{columns}' has more than {max_columns} distinct values; "
+                             f"filter the rows or use a coarser bucket")
+        try:
+            pivoted = sorted(pivoted)
+        except TypeError:
+            pivoted = sorted(pivoted, key=str)
 
-            if v > max_val:
-                max_val = v
-                max_row = row
+        # Grid columns are named by value, qualified if that clashes with an index column
+        names = [(value, f"{columns}={value}" if str(value) in index_columns else str(value))
+                 for value in pivoted]
+        result = []
+        for index_values, cells in cells_by_index.items():
+            row = dict(zip(index_columns, index_values))
+            for value, name in names:
+                row[name] = cells.get(value)
+            result.append(row)
+        return result
 
-        if max_row is None:
-            return []
-        return [max_row]
+    def _extreme_by(self, column_name, want_max):
+        if parallel.should_parallelize(self):
+            best = None
+            for part in parallel.map_partitions(self, _extreme_row, column_name, want_max):
+                # Strict comparison keeps the first occurrence, as in a serial scan
+                if part is not None and (best is None or
+                                         (part[0] > best[0] if want_max else part[0] < best[0])):
+                    best = part
+        else:
+            best = _extreme_row(self._get_data(), column_name, want_max)
+        return [] if best is None else [best[1]]
 
+    @operator('max_by')
+    def max_by(self, column_name):
+        """
+        Returns a list containing the single row with the maximum value
+        in column_name. Fully streamed; only one pass through the data.
+        """
+        return self._extreme_by(column_name, want_max=True)
+
+    @operator('min_by')
     def min_by(self, column_name):
         """
         Returns a list containing the single row with the minimum value
         in column_name. Fully streamed, one pass.
         """
-        min_row = None
-        min_val = float("inf")
+        return self._extreme_by(column_name, want_max=False)
 
-        for row in self._get_data():
-            val = row.get(column_name)
-            if val is None:
-                continue
+    @operator('top_k_by')
+    def top_k_by(self, column_name, k=5):
+        """
+        Returns top K rows sorted by a numeric column.
+        Loads data only once.
+        """
+        if parallel.should_parallelize(self):
+            # Each partition keeps its own top K; the stable sort over the
+            # concatenation (in partition order) matches the serial result.
+            buffer = []
+            for part in parallel.map_partitions(self, _top_k_rows, column_name, k):
+                buffer.extend(part)
+            buffer.sort(key=lambda x: x[0], reverse=True)
+            buffer = buffer[:k]
+        else:
+            buffer = _top_k_rows(self._get_data(), column_name, k)
+        return [r for _, r in buffer]
 
-            try:
-                v = float(val)
-            except (ValueError, TypeError):
-                continue
+    # ---------- Window operators (see engine.window) ----------
 
-            if v < min_val:
-                min_val = v
-                min_row = row
+    @operator('cumsum')
+    def cumsum(self, column_name, order_by=None, partition_by=None, name=None):
+        """
+        Running total of a numeric column, restarting for every partition.
+        Returns a new DataFrame with the total in `name` (default
+        '<column>_cumsum').
+        """
+        return self._window('cumsum', column_name, 1, order_by, partition_by, name)
 
-        if min_row is None:
-            return []
-        return [min_row]
+    @operator('lag')
+    def lag(self, column_name, n=1, order_by=None, partition_by=None, name=None):
+        """
+        The value of a column n rows earlier in the partition (None for its
+        first n rows), in `name` (default '<column>_lag').
+        """
+        return self._window('lag', column_name, n, order_by, partition_by, name)
 
-    def top_k_by(self, column_name, k=5):
+    @operator('lead')
+    def lead(self, column_name, n=1, order_by=None, partition_by=None, name=None):
         """
-        Returns top K rows sorted by a numeric column.
-        Loads data only once.
+        The value of a column n rows later in the partition (None for its
+        last n rows), in `name` (default '<column>_lead').
         """
-        buffer = []
+        return self._window('lead', column_name, n, order_by, partition_by, name)
 
-        for row in self._get_data():
-            val = row.get(column_name)
-            if val is None:
-                continue
-            try:
-                v = float(val)
-            except Exception:
-                continue
+    @operator('rolling_mean')
+    def rolling_mean(self, column_name, window_size=3, order_by=None, partition_by=None, name=None):
+        """
+        Mean of a numeric column over the current row and the rows before
+        it in the partition, window_size rows in all, in `name` (default
+        '<column>_rolling_mean').
+        """
+        return self._window('rolling_mean', column_name, window_size, order_by, partition_by, name)
 
-            buffer.append((v, row))
+    def _window(self, op, column_name, n, order_by, partition_by, name):
+        """
+        Runs a window operator in one pass. Rows are sorted by `order_by`
+        first unless the column statistics show the table already is;
+        without `order_by` the table's own row order is used.
+        """
+        if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+            raise ValueError(f"{op}: the offset or window size must be a positive integer, got {n!r}")
+        if partition_by is None:
+            partition_key = lambda row: None
+        else:
+            partition_key = _join_key(key_columns(partition_by))
+        rows = self._get_data()
+        if order_by is not None:
+            order_by = key_columns(order_by)
+            if not self._sorted_by(order_by):
+                rows = sorted(rows, key=window.sort_key(order_by))
+        return DataFrame(source=window.apply(rows, op, column_name, name or f"{column_name}_{op}",
+                                             partition_key, n))
 
-        buffer.sort(key=lambda x: x[0], reverse=True)
-        return [r for _, r in buffer[:k]]
+    def _sorted_by(self, column_name):
+        """True if the current statistics show the rows ascending by column_name, without nulls."""
+        stats = self.current_stats()
+        if not stats or not isinstance(column_name, str):
+            return False
+        column = stats['columns'].get(column_name) or {}
+        return column.get('sorted') == 'asc' and column.get('nulls') == 0
 
+    @operator('join')
     def join(self, right_dataframe, left_on, right_on):
         """
         Implements an inner join operation.
         Returns a new DataFrame with the joined data.
+
+        `left_on` and `right_on` may be lists of columns of the same length
+        for a composite key; rows match when all of them are equal.
         """
-        joined_data = []
+        filepath_tag = right_dataframe.filepath if right_dataframe.filepath else 'joined'
+        left_on, right_on = key_columns(left_on), key_columns(right_on)
+        if isinstance(left_on, tuple) != isinstance(right_on, tuple) \
+                or isinstance(left_on, tuple) and len(left_on) != len(right_on):
+            raise ValueError("Join keys must have the same number of columns on both sides")
+
+        joined = self._index_join(right_dataframe, left_on, right_on, filepath_tag)
+        if joined is not None:
+            return joined
+
+        left_rows = self.estimated_rows()
+        right_rows = right_dataframe.estimated_rows()
+        if left_rows is not None and right_rows is not None \
+                and right_rows > self.BUILD_SIDE_RATIO * max(left_rows, 1):
+            return self._join_build_left(right_dataframe, left_on, right_on, filepath_tag)
 
         # Build the hash table (dictionary) from the right table
         right_rows_by_key = {}
+        right_key = _join_key(right_on)
         for right_row in right_dataframe._get_data():
-            key = right_row.get(right_on)
+            key = right_key(right_row)
             if key not in right_rows_by_key:
                 right_rows_by_key[key] = []
             right_rows_by_key[key].append(right_row)
 
-        # Now stream the left table and perform the join
-        for left_row in self._get_data():
-            left_key = left_row.get(left_on)
-            if left_key in right_rows_by_key:
-                for right_row in right_rows_by_key[left_key]:
-                    new_row = left_row.copy()
-                    for key, value in right_row.items():
-                        if key == right_on:
-                            continue
-                        if key not in new_row:
-                            new_row[key] = value
-                        else:
-                            filepath_tag = right_dataframe.filepath if right_dataframe.filepath else 'joined'
-                            new_row[f"{filepath_tag}.{key}"] = value
-                    joined_data.append(new_row)
+        # Now stream the left table and perform the join. Left rows whose
+        # key has no match are dropped by the scan before they are built
+        key_filter = _key_filter(left_on, right_rows_by_key)
+        if parallel.should_parallelize(self):
+            parts = parallel.map_partitions(
+                self, _probe_rows, right_rows_by_key, left_on, right_on, filepath_tag,
+                key_filter=key_filter
+            )
+            joined_data = [row for part in parts for row in part]
+        else:
+            joined_data = _probe_rows(self._get_data(key_filter), right_rows_by_key,
+                                      left_on, right_on, filepath_tag)
 
         return DataFrame(source=joined_data)
+
+    def _index_join(self, right_dataframe, left_on, right_on, filepath_tag):
+        """
+        Index nested-loop join: when one side is small and the other has an
+        index on its join column, only the matching rows of the indexed side
+        are read. Returns None if no index applies; the result is the same
+        as the hash join's, row order included. A composite key uses the
+        index of its first column.
+        """
+        left_rows = self.estimated_rows()
+        right_rows = right_dataframe.estimated_rows()
+        composite = isinstance(left_on, tuple)
+        left_indexed = left_on[0] if composite else left_on
+        right_indexed = right_on[0] if composite else right_on
+
+        # Small left side, indexed right side: probe the index with the left keys
+        right_index = (indexes.load(right_dataframe.filepath, right_indexed)
+                       if right_dataframe.source_type == 'file' else None)
+        if right_index is not None and left_rows is not None \
+                and left_rows <= indexes.MAX_FRACTION * max(right_rows or 0, len(right_index)):
+            left_data = list(self._get_data())
+            try:
+                keys = {row.get(left_indexed) for row in left_data}
+            except TypeError:
+                keys = {None}
+            if None not in keys and right_index.count(keys) <= \
+                    indexes.MAX_FRACTION * max(right_rows or 0, len(right_index)):
+                right_rows_by_key = {}
+                right_key = _join_key(right_on)
+                for right_row in right_dataframe._rows_at(right_index.lookup(keys)):
+                    right_rows_by_key.setdefault(right_key(right_row), []).append(right_row)
+                return DataFrame(source=_probe_rows(left_data, right_rows_by_key,
+                                                    left_on, right_on, filepath_tag))
+
+        # Small right side, indexed left side: read only the left rows that match
+        left_index = indexes.load(self.filepath, left_indexed) if self.source_type == 'file' else None
+        if left_index is not None and right_rows is not None \
+                and right_rows <= indexes.MAX_FRACTION * max(left_rows or 0, len(left_index)):
+            right_rows_by_key = {}
+            right_key = _join_key(right_on)
+            for right_row in right_dataframe._get_data():
+                right_rows_by_key.setdefault(right_key(right_row), []).append(right_row)
+            keys = {key[0] for key in right_rows_by_key} if composite else right_rows_by_key
+            if None not in keys and left_index.count(keys) <= \
+                    indexes.MAX_FRACTION * max(left_rows or 0, len(left_index)):
+                located = left_index.lookup(keys)
+                return DataFrame(source=_probe_rows(self._rows_at(located), right_rows_by_key,
+                                                    left_on, right_on, filepath_tag))
+        return None
+
+    def _join_build_left(self, right_dataframe, left_on, right_on, filepath_tag):
+        """
+        Same result as join(), but hashes the (smaller) left side and streams
+        the right side, so only the small table is held in memory.
+        """
+        left_rows_by_key = {}
+        left_key = _join_key(left_on)
+        for position, left_row in enumerate(self._get_data()):
+            left_rows_by_key.setdefault(left_key(left_row), []).append((position, left_row))
+
+        key_filter = _key_filter(right_on, left_rows_by_key)
+        if parallel.should_parallelize(right_dataframe):
+            parts = parallel.map_partitions(
+                right_dataframe, _probe_rows_build_left, left_rows_by_key, right_on, filepath_tag,
+                key_filter=key_filter
+            )
+            matches = [match for part in parts for match in part]
+        else:
+            matches = _probe_rows_build_left(right_dataframe._get_data(key_filter), left_rows_by_key,
+                                             right_on, filepath_tag)
+
+        # Stable sort: rows of one left row keep the right table's order
+        matches.sort(key=lambda match: match[0])
+        return DataFrame(source=[row for _, row in matches])
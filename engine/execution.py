@@ -0,0 +1,63 @@
+# engine/execution.py
+"""
+Execution hooks shared by all DataFrame operators.
+
+The engine itself never decides to stop a query; a host process (for
+example the query executor) installs a cancel check and every table scan
+polls it, so a long-running expression stops at the next batch of rows.
+The check is tracked per thread (a context variable), so a check installed
+for one query never stops another running concurrently in the process.
+Scans also report the rows they read to the active profile, if any
+(see engine.profiling).
+"""
+import contextvars
+from . import profiling
+
+# How many rows a scan reads between two cancel checks
+CHECK_EVERY = 4096
+
+_cancel_check = contextvars.ContextVar('cancel_check', default=None)
+
+
+class QueryCancelled(Exception):
+    """Raised inside a scan once the installed cancel check returns True."""
+    pass
+
+
+def set_cancel_check(check):
+    """
+    Installs a zero-argument callable that returns True when the running
+    query should stop. Pass None to remove it.
+    """
+    _cancel_check.set(check)
+
+
+def check_cancelled():
+    """Raises QueryCancelled if the current query has been cancelled."""
+    check = _cancel_check.get()
+    if check is not None and check():
+        raise QueryCancelled("Query was cancelled")
+
+
+def guard(rows):
+    """
+    Wraps a row iterator so it polls the cancel check every CHECK_EVERY rows
+    and counts the rows for the active profile. Returns the iterator
+    unchanged when there is neither a check nor a profile.
+    """
+    check = _cancel_check.get()
+    if check is None and profiling.active() is None:
+        return rows
+    return _guarded(rows, check)
+
+
+def _guarded(rows, check):
+    count = 0
+    try:
+        for row in rows:
+            if check is not None and count % CHECK_EVERY == 0 and check():
+                raise QueryCancelled("Query was cancelled")
+            count += 1
+            yield row
+    finally:
+        profiling.add_rows_read(count)
@@ -0,0 +1,336 @@
+# engine/indexes.py
+"""
+Persistent secondary indexes on table columns.
+
+An index maps every value of one column to the rows holding it, both as
+row numbers (for scans of the shared segment) and as byte offsets of the
+lines in the CSV file. Keys are kept sorted, so the same index answers
+equality lookups (through a hash of the keys built on load) and range
+lookups (by binary search).
+
+DataFrame.filter uses an index for equality, `in` and range predicates
+that select few rows, and DataFrame.join for index nested-loop joins
+against the indexed side.
+
+Index file layout (`<file>.<column>.idx`, next to the CSV):
+    MAGIC | u64 header length | u64 row count | header JSON | starts | rows | offsets
+where the header holds the column, the CSV size and modification time
+it describes and the sorted keys; the rows of key i are rows[starts[i]:starts[i + 1]].
+"""
+import bisect
+import glob
+import json
+import os
+import struct
+import tempfile
+from array import array
+from .column_stats import file_signature, stats_match_file
+
+MAGIC = b'AISTIDX1'
+# Columns of these types can be indexed
+INDEXED_TYPES = ('int', 'str')
+# A column is a key if (almost) every row has a distinct value
+KEY_DISTINCT_RATIO = 0.9
+# Lookups returning more than this fraction of a table scan it instead
+MAX_FRACTION = 0.05
+
+_cache = {}  # path -> (file signature, index file mtime, Index)
+
+
+def path_for(filepath, column):
+    """Where the index of one column of a CSV file is stored."""
+    return f"{filepath}.{column}.idx"
+
+
+def _sort_key(value):
+    # Numbers before strings; mixed columns keep str values the cast left behind
+    return (isinstance(value, str), value)
+
+
+class Index:
+    def __init__(self, column, size, keys, starts, rows, offsets, mixed=False, mtime_ns=None):
+        self.column = column
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # True if the keys mix numbers and strings (values a cast left as str)
+        self.mixed = mixed
+        self.keys = keys
+        self.starts = starts
+        self.rows = rows
+        self.offsets = offsets
+        self._positions = None
+        self._sort_keys = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def matches(self, signature):
+        """True if the index describes the file as `signature` (see column_stats.file_signature) does."""
+        return stats_match_file({'bytes': self.size, 'mtime_ns': self.mtime_ns}, signature)
+
+    def _position(self, value):
+        if self._positions is None:
+            self._positions = {}
+            for i, key in enumerate(self.keys):
+                self._positions.setdefault(key, i)
+        try:
+            return self._positions.get(value)
+        except TypeError:  # unhashable
+            return None
+
+    def count(self, values):
+        """Number of rows equal to any of `values`."""
+        total = 0
+        for value in values:
+            i = self._position(value)
+            if i is not None:
+                total += self.starts[i + 1] - self.starts[i]
+        return total
+
+    def lookup(self, values):
+        """(row number, byte offset) pairs of the rows equal to any of `values`, in row order."""
+        found = []
+        for value in values:
+            i = self._position(value)
+            if i is not None:
+                start, stop = self.starts[i], self.starts[i + 1]
+                found.extend(zip(self.rows[start:stop], self.offsets[start:stop]))
+        found.sort()
+        return found
+
+    def key_range(self, op, value):
+        """Key index range [lo, hi) of the keys satisfying `key <op> value`."""
+        if self._sort_keys is None:
+            self._sort_keys = [_sort_key(k) for k in self.keys]
+        kind = isinstance(value, str)
+        # Only keys of the value's kind compare with it
+        lo = bisect.bisect_left(self._sort_keys, (kind,), key=lambda k: k[:1])
+        hi = bisect.bisect_right(self._sort_keys, (kind,), key=lambda k: k[:1])
+        probe = (kind, value)
+        if op == '<':
+            hi = bisect.bisect_left(self._sort_keys, probe, lo, hi)
+        elif op == '<=':
+            hi = bisect.bisect_right(self._sort_keys, probe, lo, hi)
+        elif op == '>':
+            lo = bisect.bisect_right(self._sort_keys, probe, lo, hi)
+        elif op == '>=':
+            lo = bisect.bisect_left(self._sort_keys, probe, lo, hi)
+        return lo, max(lo, hi)
+
+    def range_count(self, op, value):
+        lo, hi = self.key_range(op, value)
+        return self.starts[hi] - self.starts[lo]
+
+    def range_lookup(self, op, value):
+        """(row number, byte offset) pairs of the rows with `column <op> value`, in row order."""
+        lo, hi = self.key_range(op, value)
+        start, stop = self.starts[lo], self.starts[hi]
+        found = list(zip(self.rows[start:stop], self.offsets[start:stop]))
+        found.sort()
+        return found
+
+
+class IndexBuilder:
+    def __init__(self, column):
+        self.column = column
+        self.postings = {}
+
+    def add(self, row_number, offset, row):
+        value = row.get(self.column)
+        if value is None:
+            return
+        try:
+            self.postings.setdefault(value, []).append((row_number, offset))
+        except TypeError:
+            pass
+
+    def build(self, size, mtime_ns=None):
+        keys = sorted(self.postings, key=_sort_key)
+        starts, rows, offsets = array('q', [0]), array('q'), array('q')
+        for key in keys:
+            for row_number, offset in self.postings[key]:
+                rows.append(row_number)
+                offsets.append(offset)
+            starts.append(len(rows))
+        mixed = len({isinstance(key, str) for key in keys}) > 1
+        return Index(self.column, size, keys, starts, rows, offsets, mixed, mtime_ns)
+
+
+def _write(filepath, index):
+    path = path_for(filepath, index.column)
+    header = json.dumps({'column': index.column, 'bytes': index.size, 'mtime_ns': index.mtime_ns,
+                         'mixed': index.mixed, 'keys': index.keys}).encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<QQ', len(header), len(index.rows)))
+            f.write(header)
+            f.write(index.starts.tobytes())
+            f.write(index.rows.tobytes())
+            f.write(index.offsets.tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _cache.pop(path, None)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"Not an index file: {path}")
+    header_len, count = struct.unpack_from('<QQ', data, len(MAGIC))
+    pos = len(MAGIC) + 16
+    header = json.loads(data[pos:pos + header_len])
+    pos += header_len
+
+    def take(n):
+        nonlocal pos
+        values = array('q')
+        values.frombytes(data[pos:pos + 8 * n])
+        pos += 8 * n
+        return values
+
+    starts = take(len(header['keys']) + 1)
+    rows = take(count)
+    offsets = take(count)
+    return Index(header['column'], header['bytes'], header['keys'], starts, rows, offsets,
+                 header.get('mixed', False), header.get('mtime_ns'))
+
+
+def create_indexes(parser, columns):
+    """
+    Builds and stores the indexes of `columns` of a CSV file in one scan.
+    Returns {column: Index}.
+    """
+    columns = [c for c in columns if c in parser.get_header()]
+    if not columns:
+        return {}
+    builders = [IndexBuilder(column) for column in columns]
+    located = parser.parse_range(parser.data_start(), offsets=True)
+    for row_number, (offset, row) in enumerate(located):
+        for builder in builders:
+            builder.add(row_number, offset, row)
+    signature = file_signature(parser.filepath)
+    built = {}
+    for builder in builders:
+        built[builder.column] = index = builder.build(signature['bytes'], signature['mtime_ns'])
+        _write(parser.filepath, index)
+    return built
+
+
+def create_index(parser, column):
+    """Builds and stores the index of one column; see create_indexes()."""
+    return create_indexes(parser, [column]).get(column)
+
+
+def load(filepath, column):
+    """
+    Returns the Index of a column, or None if it has none or the file
+    changed since it was built. Loaded indexes are cached per process.
+    """
+    path = path_for(filepath, column)
+    try:
+        signature = file_signature(filepath)
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (signature, mtime):
+        return cached[2]
+    try:
+        index = _read(path)
+    except (OSError, ValueError):
+        return None
+    if not index.matches(signature):
+        index = None
+    _cache[path] = (signature, mtime, index)
+    return index
+
+
+def ensure_indexes(parser, columns):
+    """Creates the indexes of `columns` that are missing or out of date."""
+    missing = [c for c in columns if load(parser.filepath, c) is None]
+    return create_indexes(parser, missing)
+
+
+def extend_indexes(parser, start_offset, first_row, previous=None):
+    """
+    Adds the rows appended to a CSV file from byte `start_offset` on
+    (numbered from `first_row`) to all of its indexes that were up to
+    date before the append, i.e. built for the file as `previous` (its
+    file_signature() before the append) describes it; without one, for
+    a file of start_offset bytes. Out-of-date indexes are deleted.
+    """
+    indexes = {}
+    for column in indexed_columns(parser.filepath):
+        path = path_for(parser.filepath, column)
+        try:
+            index = _read(path)
+        except (OSError, ValueError):
+            index = None
+        if index is None:
+            current = False
+        elif previous is None:
+            current = index.size == start_offset
+        else:
+            current = index.matches(previous)
+        if current:
+            indexes[column] = index
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            _cache.pop(path, None)
+    if not indexes:
+        return
+
+    builders = {column: IndexBuilder(column) for column in indexes}
+    located = parser.parse_range(start_offset, offsets=True)
+    for row_number, (offset, row) in enumerate(located, start=first_row):
+        for builder in builders.values():
+            builder.add(row_number, offset, row)
+
+    signature = file_signature(parser.filepath)
+    for column, index in indexes.items():
+        builder = builders[column]
+        for i, key in enumerate(index.keys):
+            start, stop = index.starts[i], index.starts[i + 1]
+            postings = list(zip(index.rows[start:stop], index.offsets[start:stop]))
+            builder.postings[key] = postings + builder.postings.get(key, [])
+        _write(parser.filepath, builder.build(signature['bytes'], signature['mtime_ns']))
+
+
+def indexed_columns(filepath):
+    """Columns of a CSV file that have an index file."""
+    prefix, suffix = f"{filepath}.", '.idx'
+    return sorted(path[len(prefix):-len(suffix)]
+                  for path in glob.glob(glob.escape(filepath) + '.*.idx'))
+
+
+def remove_all(filepath):
+    """Deletes every index of a CSV file."""
+    for column in indexed_columns(filepath):
+        path = path_for(filepath, column)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        _cache.pop(path, None)
+
+
+def key_columns(stats, column_types):
+    """Columns that look like keys: no nulls and (almost) all values distinct."""
+    row_count = (stats or {}).get('row_count') or 0
+    if not row_count:
+        return []
+    keys = []
+    for column, col in stats.get('columns', {}).items():
+        if column_types.get(column) in INDEXED_TYPES and not col.get('nulls') \
+                and not col.get('mixed') and col.get('distinct', 0) >= KEY_DISTINCT_RATIO * row_count:
+            keys.append(column)
+    return keys
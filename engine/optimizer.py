@@ -0,0 +1,373 @@
+# engine/optimizer.py
+"""
+Rewrites a generated expression into a cheaper one with the same result.
+
+  - Filter pushdown: the conjuncts of a filter applied to a chain of
+    joins that only read columns of one joined table are also applied to
+    that table before the joins, as filter(..., pushed=True). The
+    original filter stays on top, so the result is exactly the same.
+  - Join ordering: a chain of three or more joins whose row order cannot
+    be observed (it is only counted) is reordered to keep the intermediate
+    results small. Grouped input is not reordered: groups come out in the
+    order their keys first appear, and float sums depend on the order
+    rows are added in. Cardinalities come from the
+    planner (row counts, column statistics, pushed filters); a column
+    that known relationships point to is treated as a key.
+  - Unused receivers: `x.aggregate(groups, ...)` never reads `x`, so a
+    join written there is replaced by one of its tables.
+
+Only left-deep chains of `a.join(b, 'col', 'col')` calls whose joined
+tables are plain tables (optionally filtered) are touched, and only when
+every column keeps its name; anything else is left as written.
+"""
+import ast
+import copy
+import itertools
+from . import planner
+
+# Join orders are only searched exhaustively up to this many tables
+MAX_REORDERED_TABLES = 6
+
+
+class _Leaf:
+    """One joined table: its expression, plan estimates and pushed filters."""
+
+    def __init__(self, index, node, plan):
+        self.index = index
+        self.node = node
+        self.plan = plan
+        self.columns = list(plan.columns)
+        self.pushed = []  # lambdas to apply with pushed=True
+
+    def expression(self):
+        node = copy.deepcopy(self.node)
+        for lam in self.pushed:
+            node = _method_call(node, 'filter', [lam], [ast.keyword(arg='pushed', value=ast.Constant(True))])
+        return node
+
+
+class _Chain:
+    """A left-deep join chain flattened into tables and equi-join edges."""
+
+    def __init__(self, leaves, joins):
+        self.leaves = leaves
+        # joins[i] = (left_on, right_on) joining leaves[i + 1]
+        self.joins = joins
+        self.owners = None
+        self.edges = []
+        self._classes = {}
+
+    def analyze(self):
+        """Resolves column ownership and join edges; False if the chain cannot be rewritten."""
+        owners = {c: self.leaves[0] for c in self.leaves[0].columns}
+        for leaf, (left_on, right_on) in zip(self.leaves[1:], self.joins):
+            if left_on not in owners or right_on not in leaf.columns:
+                return False
+            self.edges.append((owners[left_on], left_on, leaf, right_on))
+            for column in leaf.columns:
+                if column == right_on:
+                    continue
+                if column in owners:
+                    return False  # the engine would rename it
+                owners[column] = leaf
+        self.owners = owners
+
+        # Columns equated by a join hold the same value after it
+        for left, left_on, right, right_on in self.edges:
+            self._union((left.index, left_on), (right.index, right_on))
+        return True
+
+    def _find(self, item):
+        parent = self._classes.setdefault(item, item)
+        if parent != item:
+            parent = self._classes[item] = self._find(parent)
+        return parent
+
+    def _union(self, a, b):
+        self._classes[self._find(a)] = self._find(b)
+
+    def same_value(self, a, b):
+        return a == b or self._find(a) == self._find(b)
+
+    def expression(self, order=None):
+        order = order or self.leaves
+        joins = self.joins if order is self.leaves else self._joins_for(order)
+        node = order[0].expression()
+        for leaf, (left_on, right_on) in zip(order[1:], joins):
+            node = _method_call(node, 'join',
+                                [leaf.expression(), ast.Constant(left_on), ast.Constant(right_on)])
+        return node
+
+    def _joins_for(self, order):
+        """Join columns for `order`, or None if it does not give the same columns."""
+        owners = {c: order[0] for c in order[0].columns}
+        joins = []
+        for leaf in order[1:]:
+            edge = self._edge_to(leaf, order[:len(joins) + 1])
+            if edge is None:
+                return None
+            other, other_on, leaf_on = edge
+            owner = owners.get(other_on)
+            if owner is None or not self.same_value((owner.index, other_on), (other.index, other_on)):
+                return None
+            joins.append((other_on, leaf_on))
+            for column in leaf.columns:
+                if column == leaf_on:
+                    continue
+                if column in owners:
+                    return None
+                owners[column] = leaf
+
+        if owners.keys() != self.owners.keys():
+            return None
+        for column, owner in owners.items():
+            if not self.same_value((owner.index, column), (self.owners[column].index, column)):
+                return None
+        return joins
+
+    def _edge_to(self, leaf, joined):
+        found = []
+        for left, left_on, right, right_on in self.edges:
+            if right is leaf and left in joined:
+                found.append((left, left_on, right_on))
+            elif left is leaf and right in joined:
+                found.append((right, right_on, left_on))
+        # With a tree of joins a new table connects through exactly one edge
+        return found[0] if len(found) == 1 else None
+
+
+def _method_call(receiver, name, args, keywords=None):
+    return ast.Call(func=ast.Attribute(value=receiver, attr=name, ctx=ast.Load()),
+                    args=args, keywords=keywords or [])
+
+
+def _method(node):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def _is_plain_filter(node):
+    return (_method(node) == 'filter' and len(node.args) == 1 and not node.keywords
+            and isinstance(node.args[0], ast.Lambda) and len(node.args[0].args.args) == 1)
+
+
+def _is_join(node):
+    return (_method(node) == 'join' and len(node.args) == 3 and not node.keywords
+            and all(isinstance(a, ast.Constant) and isinstance(a.value, str) for a in node.args[1:]))
+
+
+def _columns_read(node, param):
+    """Columns a lambda body reads as param['col'], or None if it uses `param` any other way."""
+    columns = set()
+    subscripts = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Subscript) and isinstance(child.value, ast.Name) \
+                and child.value.id == param:
+            if not (isinstance(child.slice, ast.Constant) and isinstance(child.slice.value, str)):
+                return None
+            columns.add(child.slice.value)
+            subscripts.add(id(child.value))
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and child.id == param and id(child) not in subscripts:
+            return None
+        if isinstance(child, ast.Lambda):
+            return None  # nested lambdas could shadow the parameter
+    return columns
+
+
+class _Optimizer:
+    def __init__(self, tables, relationships):
+        self.builder = planner._Builder(tables)
+        self.keys = {(r.get('to_table'), r.get('to_column')) for r in relationships or []}
+        self.changed = False
+
+    def rewrite(self, node, order_free=False):
+        """Rewrites `node`; order_free is True if its row order cannot be observed."""
+        method = _method(node)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id == 'len' and len(node.args) == 1:
+            node.args[0] = self.rewrite(node.args[0], order_free=True)
+            return node
+
+        if method == 'aggregate':
+            node.func.value = self._receiver(node.func.value)
+            node.args = [self.rewrite(a) for a in node.args]
+            return node
+
+        if method in ('filter', 'join'):
+            optimized = self._optimize_chain(node, order_free)
+            if optimized is not None:
+                return optimized
+            if method == 'filter':
+                # A filter keeps the order of its input and does not expose it
+                node.func.value = self.rewrite(node.func.value, order_free)
+                node.args = [self.rewrite(a) for a in node.args]
+                return node
+
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.AST):
+                setattr(node, field, self.rewrite(value))
+            elif isinstance(value, list):
+                setattr(node, field, [self.rewrite(v) if isinstance(v, ast.AST) else v for v in value])
+        return node
+
+    def _receiver(self, node):
+        """aggregate() ignores its receiver: replace a join chain by its first table."""
+        core = node
+        while _is_plain_filter(core) or _is_join(core):
+            core = core.func.value
+        if core is node or not isinstance(core, ast.Name):
+            return self.rewrite(node)
+        self.changed = True
+        return core
+
+    def _optimize_chain(self, node, order_free):
+        filters = []
+        core = node
+        while _is_plain_filter(core):
+            filters.append(core)
+            core = core.func.value
+        if not _is_join(core):
+            return None
+
+        chain = self._flatten(core)
+        if chain is None or not chain.analyze():
+            return None
+
+        for filter_call in filters:
+            self._push_down(filter_call.args[0], chain)
+
+        order = chain.leaves
+        if order_free and 3 <= len(chain.leaves) <= MAX_REORDERED_TABLES:
+            order = self._best_order(chain)
+        if order is not chain.leaves:
+            self.changed = True
+
+        result = chain.expression(order)
+        for filter_call in reversed(filters):
+            result = _method_call(result, 'filter', filter_call.args)
+        return result
+
+    def _flatten(self, node):
+        leaves, joins = [], []
+        spine = []
+        while _is_join(node):
+            spine.append(node)
+            node = node.func.value
+        for candidate in [node] + [call.args[0] for call in reversed(spine)]:
+            plan = self.builder.build(candidate)
+            if not isinstance(plan, planner.PlanNode) or plan.op not in ('Scan', 'Filter') \
+                    or not plan.columns or plan.rows is None:
+                return None
+            leaves.append(_Leaf(len(leaves), candidate, plan))
+        for call in reversed(spine):
+            joins.append((call.args[1].value, call.args[2].value))
+        return _Chain(leaves, joins)
+
+    def _push_down(self, lam, chain):
+        param = lam.args.args[0].arg
+        by_leaf = {}
+        for conjunct in planner._conjuncts(lam.body):
+            columns = _columns_read(conjunct, param)
+            if not columns:
+                continue
+            owners = {chain.owners.get(c) for c in columns}
+            if len(owners) != 1 or None in owners:
+                continue
+            owner = owners.pop()
+            targets = [owner]
+            if len(columns) == 1:
+                # A join column has the same value in every table it was joined on
+                column = next(iter(columns))
+                targets += [leaf for leaf in chain.leaves
+                            if leaf is not owner and column in leaf.columns
+                            and chain.same_value((leaf.index, column), (owner.index, column))]
+            for leaf in targets:
+                by_leaf.setdefault(leaf.index, []).append(conjunct)
+
+        for index, conjuncts in by_leaf.items():
+            body = conjuncts[0] if len(conjuncts) == 1 else ast.BoolOp(op=ast.And(), values=conjuncts)
+            chain.leaves[index].pushed.append(
+                ast.Lambda(args=copy.deepcopy(lam.args), body=copy.deepcopy(body)))
+            self.changed = True
+
+    # ---------- Join ordering ----------
+
+    def _leaf_rows(self, leaf):
+        if not leaf.pushed:
+            return leaf.plan.rows
+        plan = self.builder.build(leaf.expression())
+        return plan.rows if isinstance(plan, planner.PlanNode) else leaf.plan.rows
+
+    def _is_key(self, leaf, column):
+        return (leaf.plan.table, column) in self.keys
+
+    def _domain(self, leaf):
+        """Number of key values a foreign key can refer to: the unfiltered table size."""
+        return self.builder._scan(leaf.plan.table).rows if leaf.plan.table in self.builder.tables else None
+
+    def _distinct(self, leaf, column, rows):
+        if self._is_key(leaf, column):
+            return rows
+        distinct = planner._distinct(leaf.plan, column)
+        return None if distinct is None else min(distinct, rows)
+
+    def _cost(self, chain, order, joins, rows):
+        """Sum of the estimated intermediate result sizes of a join order."""
+        cost = 0
+        current = rows[order[0].index]
+        owners = {c: order[0] for c in order[0].columns}
+        for step, (leaf, (left_on, right_on)) in enumerate(zip(order[1:], joins)):
+            left, leaf_rows = owners[left_on], rows[leaf.index]
+            left_distinct = self._distinct(left, left_on, current)
+            right_distinct = self._distinct(leaf, right_on, leaf_rows)
+            # A foreign key without statistics is assumed to refer to every key value
+            if left_distinct is None and self._is_key(leaf, right_on):
+                left_distinct = min(self._domain(leaf) or leaf_rows, current)
+            if right_distinct is None and self._is_key(left, left_on):
+                right_distinct = min(self._domain(left) or current, leaf_rows)
+
+            distinct = max(filter(None, (left_distinct, right_distinct)), default=None)
+            if distinct:
+                current = current * leaf_rows / distinct
+            else:
+                # Without key statistics assume a key / foreign-key join
+                current = max(current, leaf_rows)
+            if step < len(joins) - 1:
+                cost += current
+            for column in leaf.columns:
+                owners.setdefault(column, leaf)
+        return cost
+
+    def _best_order(self, chain):
+        rows = {leaf.index: self._leaf_rows(leaf) for leaf in chain.leaves}
+        best = chain.leaves
+        best_cost = self._cost(chain, chain.leaves, chain.joins, rows)
+        for order in itertools.permutations(chain.leaves):
+            joins = chain._joins_for(order)
+            if joins is None:
+                continue
+            cost = self._cost(chain, order, joins, rows)
+            if cost < best_cost:
+                best, best_cost = list(order), cost
+        return best
+
+
+def optimize(code, tables, relationships=None):
+    """
+    Returns an equivalent, cheaper version of a generated expression (see
+    the module docstring). `tables` is what engine.planner.explain takes;
+    `relationships` the detected foreign keys as
+    {'from_table', 'from_column', 'to_table', 'to_column'} dicts.
+    Code that does not parse, or that cannot be improved, is returned unchanged.
+    """
+    try:
+        tree = ast.parse(code.strip(), mode='eval')
+    except SyntaxError:
+        return code
+    optimizer = _Optimizer(tables, relationships)
+    tree.body = optimizer.rewrite(tree.body)
+    if not optimizer.changed:
+        return code
+    return ast.unparse(ast.fix_missing_locations(tree))
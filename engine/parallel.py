@@ -0,0 +1,115 @@
+# engine/parallel.py
+"""
+Partitioned execution of scan-heavy operators across cores.
+
+A file-backed DataFrame is split into partitions (byte ranges of the CSV,
+or row ranges of its shared segment) and a per-partition task runs in a
+forked process pool. Tasks, predicates and build-side hash tables are
+handed to the children through fork inheritance, so lambdas produced by
+eval() never need to be pickled; only partial results travel back. Each
+call hands its job to its own pool's initializer, so concurrent calls from
+several threads never see each other's tasks.
+
+Partial results are always combined in partition order, so the output is
+identical from run to run.
+"""
+import multiprocessing
+import os
+from . import execution
+from . import profiling
+
+_settings = {
+    'workers': 0,                  # 0 or 1 disables parallel execution
+    'min_bytes': 32 * 1024 * 1024, # smaller tables are scanned serially
+}
+
+# The job a forked child executes: (task, source, partitions, args, key_filter,
+# profiled). Only ever set inside pool children, by _init_child().
+_job = None
+
+
+def configure(workers=None, min_bytes=None):
+    """Sets the pool size and the minimum table size for parallel scans."""
+    if workers is not None:
+        _settings['workers'] = workers
+    if min_bytes is not None:
+        _settings['min_bytes'] = min_bytes
+
+
+def workers():
+    return _settings['workers']
+
+
+def _can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def should_parallelize(df):
+    """True if `df` is large enough and parallel execution is enabled."""
+    if _settings['workers'] <= 1 or df.source_type != 'file' or not _can_fork():
+        return False
+    # Children of daemonic processes cannot fork pools of their own
+    if multiprocessing.current_process().daemon:
+        return False
+    try:
+        return os.path.getsize(df.filepath) >= _settings['min_bytes']
+    except OSError:
+        return False
+
+
+def partitions(df, n):
+    """Returns partition descriptors for a file-backed DataFrame."""
+    if df.segment is not None:
+        return [('rows', start, stop) for start, stop in df.segment.row_ranges(n)]
+    return [('bytes', start, end) for start, end in df.parser.byte_ranges(n)]
+
+
+def scan_partition(df, partition, key_filter=None):
+    """
+    Iterates the rows of one partition, optionally only those whose key
+    passes a (column, keys) semi-join filter (see CsvParser.parse_range).
+    """
+    kind, start, stop = partition
+    if kind == 'rows':
+        if df.segment.row_count:
+            profiling.add_bytes_read(df.segment.nbytes * (stop - start) // df.segment.row_count)
+        return execution.guard(df.segment.rows(start, stop, key_filter=key_filter))
+    profiling.add_bytes_read(stop - start)
+    return execution.guard(df.parser.parse_range(start, stop, key_filter=key_filter))
+
+
+def _init_child(job):
+    global _job
+    _job = job
+
+
+def _run_partition(index):
+    task, source, parts, args, key_filter, profiled = _job
+    if not profiled:
+        return task(scan_partition(source, parts[index], key_filter), *args), 0, 0
+    # Counters are collected in the child and added to the parent's profile
+    with profiling.profile() as prof:
+        result = task(scan_partition(source, parts[index], key_filter), *args)
+    return result, prof.rows_read, prof.bytes_read
+
+
+def map_partitions(df, task, *args, parts=None, key_filter=None):
+    """
+    Runs task(rows_of_partition, *args) for every partition of `df` and
+    returns the results as a list in partition order. `parts` overrides
+    the partitions, e.g. with the blocks a zone map leaves to scan, and
+    `key_filter` is passed on to scan_partition().
+    """
+    n = _settings['workers']
+    parts = parts if parts is not None else partitions(df, n)
+    if len(parts) == 1:
+        return [task(scan_partition(df, parts[0], key_filter), *args)]
+
+    # The fork context hands initargs to the children without pickling them
+    job = (task, df, parts, args, key_filter, profiling.active() is not None)
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(processes=min(n, len(parts)), initializer=_init_child, initargs=(job,)) as pool:
+        outcomes = pool.map(_run_partition, range(len(parts)), chunksize=1)
+    profiling.add_rows_read(sum(rows for _, rows, _ in outcomes))
+    profiling.add_bytes_read(sum(nbytes for _, _, nbytes in outcomes))
+    return [result for result, _, _ in outcomes]
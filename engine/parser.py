@@ -12,14 +12,18 @@ class CsvParser:
       - Optional casting of values to inferred types
       - Optional chunked iteration for batch processing
     """
-    def __init__(self, filepath, separator=',', infer_types=True, sample_size=50):
+    def __init__(self, filepath, separator=',', infer_types=True, sample_size=50,
+                 column_types=None):
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"File not found: {filepath}")
         self.filepath = filepath
         self.separator = separator
         self.header = self._get_header()
 
-        if infer_types:
+        if column_types:
+            # Types already known (e.g. stored at upload time): skip the sample scan
+            self.column_types = {col: column_types.get(col, 'str') for col in self.header}
+        elif infer_types:
             self.column_types = self._infer_types(sample_size=sample_size)
         else:
             # Default everything to str if you do not want to infer
@@ -190,6 +194,108 @@ class CsvParser:
             print(f"Error during parsing: {e}")
             return
 
+    # ---------- Byte-range parsing ----------
+
+    def data_start(self):
+        """Byte offset of the first data line (just after the header)."""
+        with open(self.filepath, 'rb') as f:
+            f.readline()
+            return f.tell()
+
+    def byte_ranges(self, n):
+        """
+        Splits the data region into `n` contiguous byte ranges of similar size.
+        Boundaries need not fall on line breaks: parse_range() aligns them.
+        """
+        start = self.data_start()
+        end = os.path.getsize(self.filepath)
+        if n <= 1 or end - start < n:
+            return [(start, end)]
+        step = (end - start) // n
+        bounds = [start + i * step for i in range(n)] + [end]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def parse_range(self, start, end=None, cast=True, offsets=False, key_filter=None):
+        """
+        Generator that yields the rows whose line *starts* in [start, end).
+
+        A range that begins mid-line skips ahead to the next line, and the last
+        line is read past `end` if needed, so consecutive ranges from
+        byte_ranges() cover every row exactly once.
+
+        With offsets=True it yields (byte offset of the line, row) pairs.
+
+        `key_filter` is an optional (column, keys) pair: only rows whose
+        (cast) value of `column` is in `keys` are yielded, and the other
+        rows are dropped before their remaining fields are cast.
+        """
+        n_cols = len(self.header)
+        sep = self.separator
+        header = self.header
+        key_pos = key_col = keys = None
+        if key_filter is not None and key_filter[0] in header:
+            key_col, keys = key_filter
+            key_pos = header.index(key_col)
+        try:
+            with open(self.filepath, 'rb') as f:
+                data_start = len(f.readline())
+                if start <= data_start:
+                    f.seek(data_start)
+                    pos = data_start
+                else:
+                    f.seek(start - 1)
+                    pos = start - 1 + len(f.readline())
+
+                for raw in f:
+                    if end is not None and pos >= end:
+                        break
+                    pos += len(raw)
+                    cleaned_line = raw.decode('utf-8').strip()
+                    if not cleaned_line:
+                        continue
+
+                    values = [v.strip() for v in cleaned_line.split(sep)]
+                    if len(values) != n_cols:
+                        print(
+                            f"Warning: Skipping malformed line at byte {pos - len(raw)}. "
+                            f"Expected {n_cols} columns, got {len(values)}: {raw!r}"
+                        )
+                        continue
+
+                    if key_pos is not None:
+                        key = self._cast_value(key_col, values[key_pos]) if cast else values[key_pos]
+                        if key not in keys:
+                            continue
+
+                    row_dict = dict(zip(header, values))
+                    if cast:
+                        for col in row_dict:
+                            row_dict[col] = self._cast_value(col, row_dict[col])
+                    yield (pos - len(raw), row_dict) if offsets else row_dict
+        except Exception as e:
+            print(f"Error during parsing: {e}")
+            return
+
+    def parse_at(self, offsets, cast=True):
+        """
+        Generator that yields the rows whose lines start at the given byte
+        offsets (e.g. from an index), in the order given.
+        """
+        n_cols = len(self.header)
+        sep = self.separator
+        header = self.header
+        with open(self.filepath, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                values = [v.strip() for v in f.readline().decode('utf-8').strip().split(sep)]
+                if len(values) != n_cols:
+                    continue
+                row_dict = dict(zip(header, values))
+                if cast:
+                    for col in row_dict:
+                        row_dict[col] = self._cast_value(col, row_dict[col])
+                yield row_dict
+
     def parse_chunks(self, chunk_size=1000, cast=True):
         """
         Generator that yields lists of rows (chunks) of size `chunk_size`.
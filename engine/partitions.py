@@ -0,0 +1,234 @@
+# engine/partitions.py
+"""
+Partitioned tables.
+
+A table can be partitioned at upload by the month of a date column or by
+a hash of a key column. Its rows are then stored clustered by partition:
+the CSV is rewritten so every partition's rows are contiguous (keeping
+their relative order), and a partition map next to the file records the
+byte and row ranges each partition occupies. Rows appended later (see
+DataFrame.append_csv) are clustered the same way and add one more range
+to each partition they touch.
+
+DataFrame.filter only scans the partitions the filter's predicates on
+the partition column (see engine.planner.annotate) do not rule out:
+ranges of months for month partitions, equality and `in` for hash
+partitions. The ranges left are scanned as separate partitions, so
+engine.parallel spreads them over the worker pool.
+
+The map lives next to the CSV as `<file>.partitions` and, like the column
+statistics, records the file size it describes.
+"""
+import json
+import os
+import tempfile
+import zlib
+from .aggregation import bucket_key
+from .column_stats import file_signature, may_match, stats_match_file
+from .parser import CsvParser
+
+SCHEMES = ('month', 'hash')
+DEFAULT_BUCKETS = 16
+# Upper bound of the strings starting with a month prefix
+_PREFIX_END = '\U0010ffff'
+
+_cache = {}  # path -> (file signature, map file mtime, PartitionMap)
+
+
+def path_for(filepath):
+    """Where the partition map of a CSV file is stored."""
+    return f"{filepath}.partitions"
+
+
+def _stable_hash(value):
+    """A hash of a cast value that is stable across processes; equal numbers hash alike."""
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+    elif isinstance(value, (int, float)) and value == value:
+        data = repr(int(value) if value == int(value) else float(value)).encode('ascii')
+    else:
+        data = repr(value).encode('utf-8')
+    return zlib.crc32(data)
+
+
+def partition_key(value, scheme, buckets=DEFAULT_BUCKETS):
+    """The partition of a column value: its 'YYYY-MM' month or its hash bucket. None for nulls and non-dates."""
+    if value is None:
+        return None
+    if scheme == 'month':
+        return bucket_key(value, 'month')
+    return _stable_hash(value) % buckets
+
+
+def _partition_order(key):
+    # Months chronologically, hash buckets by number, the null partition last
+    return (key is None, key if key is not None else 0)
+
+
+def cluster(filepath, column, scheme, buckets=DEFAULT_BUCKETS, column_types=None):
+    """
+    Rewrites a CSV file with its rows grouped by partition and returns the
+    partition map of the result (not stored; see write_partition_map).
+    Malformed lines are dropped, as every scan would skip them anyway.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown partition scheme '{scheme}', expected one of {', '.join(SCHEMES)}")
+    parser = CsvParser(filepath, column_types=column_types)
+    if column not in parser.get_header():
+        raise ValueError(f"Partition column '{column}' not found")
+    key_pos = parser.get_header().index(column)
+    sep = parser.separator
+    n_cols = len(parser.get_header())
+
+    lines = {}
+    with open(filepath, 'rb') as f:
+        header_line = f.readline()
+        for raw in f:
+            cleaned = raw.decode('utf-8').strip()
+            if not cleaned:
+                continue
+            values = cleaned.split(sep)
+            if len(values) != n_cols:
+                continue
+            value = parser._cast_value(column, values[key_pos].strip())
+            if not raw.endswith(b'\n'):
+                raw += b'\n'
+            lines.setdefault(partition_key(value, scheme, buckets), []).append(raw)
+
+    partitions = []
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(header_line if header_line.endswith(b'\n') else header_line + b'\n')
+            row = 0
+            for key in sorted(lines, key=_partition_order):
+                start = out.tell()
+                out.writelines(lines[key])
+                partitions.append({'key': key, 'ranges': [[start, out.tell(), row, row + len(lines[key])]]})
+                row += len(lines[key])
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dict(file_signature(filepath), column=column, scheme=scheme,
+                buckets=buckets, partitions=partitions)
+
+
+def write_partition_map(filepath, data):
+    """Stores a partition map next to its CSV file (atomically)."""
+    path = path_for(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _cache.pop(path, None)
+
+
+def partition_file(filepath, column, scheme, buckets=DEFAULT_BUCKETS, column_types=None):
+    """Clusters a CSV file by partition and stores its partition map."""
+    data = cluster(filepath, column, scheme, buckets, column_types)
+    write_partition_map(filepath, data)
+    return PartitionMap(data)
+
+
+def extend_partition_map(filepath, partition_map, appended, byte_offset, first_row):
+    """
+    Stores `partition_map` extended with the partitions of a clustered
+    file (`appended`, as cluster() returns it) whose data lines were
+    appended to the table at `byte_offset`, numbered from `first_row`.
+    """
+    by_key = {p['key']: {'key': p['key'], 'ranges': list(p['ranges'])} for p in partition_map.partitions}
+    shift = None
+    for partition in appended['partitions']:
+        for start, end, row_start, row_stop in partition['ranges']:
+            if shift is None:
+                shift = byte_offset - start  # the appended file's data begins at its first range
+            entry = by_key.setdefault(partition['key'], {'key': partition['key'], 'ranges': []})
+            entry['ranges'].append([start + shift, end + shift, row_start + first_row, row_stop + first_row])
+    write_partition_map(filepath, {
+        **file_signature(filepath),
+        'column': partition_map.column,
+        'scheme': partition_map.scheme,
+        'buckets': partition_map.buckets,
+        'partitions': sorted(by_key.values(), key=lambda p: _partition_order(p['key'])),
+    })
+
+
+def load(filepath):
+    """
+    Returns the PartitionMap of a CSV file, or None if the table is not
+    partitioned or the file changed since the map was written.
+    """
+    path = path_for(filepath)
+    try:
+        signature = file_signature(filepath)
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (signature, mtime):
+        return cached[2]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    partition_map = PartitionMap(data) if stats_match_file(data, signature) else None
+    _cache[path] = (signature, mtime, partition_map)
+    return partition_map
+
+
+def remove(filepath):
+    """Deletes the partition map of a CSV file, if any."""
+    try:
+        os.remove(path_for(filepath))
+    except FileNotFoundError:
+        pass
+    _cache.pop(path_for(filepath), None)
+
+
+class PartitionMap:
+    def __init__(self, data):
+        self.column = data['column']
+        self.scheme = data['scheme']
+        self.buckets = data.get('buckets', DEFAULT_BUCKETS)
+        self.partitions = data['partitions']
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def _may_match(self, key, op, value):
+        if key is None:
+            return True  # nulls and non-dates: never ruled out
+        if self.scheme == 'month':
+            # Every value of the partition lies between the month prefix and
+            # the last string starting with it
+            zone = {'nulls': 0, 'min': key, 'max': key + _PREFIX_END, 'mixed': False}
+            return may_match(zone, 1, op, value)
+        if op == '==':
+            return partition_key(value, 'hash', self.buckets) == key
+        if op == 'in' and isinstance(value, (list, tuple, set)):
+            return any(partition_key(v, 'hash', self.buckets) == key for v in value)
+        return True
+
+    def matching(self, predicates):
+        """The partitions that may hold rows satisfying every predicate on the partition column."""
+        relevant = [(op, value) for column, op, value in predicates if column == self.column]
+        return [p for p in self.partitions
+                if all(self._may_match(p['key'], op, value) for op, value in relevant)]
+
+    def scan_parts(self, partitions, by_rows=False):
+        """
+        Scan partitions (as engine.parallel uses them) covering the given
+        partitions in file order: ('bytes', start, end) or ('rows', start, stop).
+        """
+        ranges = sorted(r for p in partitions for r in p['ranges'])
+        if by_rows:
+            return [('rows', row_start, row_stop) for _, _, row_start, row_stop in ranges]
+        return [('bytes', start, end) for start, end, _, _ in ranges]
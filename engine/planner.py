@@ -0,0 +1,668 @@
+# engine/planner.py
+"""
+Static plans (EXPLAIN) for generated query expressions.
+
+explain() parses an expression such as
+
+    orders.aggregate(orders.filter(lambda row: row['total'] > 100)
+                           .groupby('country'), {'total': 'sum'})
+
+into a tree of the operators the DataFrame engine would run, without
+executing anything, and estimates for every operator the rows it emits,
+the bytes it scans from disk and the memory it materializes.
+
+Estimates come from the table information the caller passes in (row
+count, file size, column types and the column statistics collected at
+ingest, see engine.column_stats) and are deliberately rough: they exist
+to spot the expensive query before it runs, not to predict run times.
+
+annotate() rewrites an expression so every filter() also receives the
+simple conjuncts of its lambda, which lets the engine skip scans that
+the statistics prove empty.
+"""
+import ast
+import os
+from . import column_stats
+from . import rollups
+from .dataframe import DataFrame
+
+# Rough in-memory size of one row dict: dict overhead plus a boxed value
+# and a key slot per column
+_ROW_BASE_BYTES = 104
+_ROW_COLUMN_BYTES = 80
+
+# Selectivity guesses when nothing better is known
+_EQUALITY_SELECTIVITY = 0.1
+_RANGE_SELECTIVITY = 1 / 3
+_DEFAULT_SELECTIVITY = 1 / 3
+# Groups assumed for a group-by column without statistics
+_DEFAULT_GROUPS = 1000
+
+
+class PlanError(Exception):
+    """The expression cannot be planned (for example, a syntax error)."""
+    pass
+
+
+class PlanNode:
+    """One operator of a plan, with its estimates."""
+
+    def __init__(self, op, detail='', children=None, rows=None,
+                 bytes_scanned=0, memory=0, columns=None):
+        self.op = op
+        self.detail = detail
+        self.children = children or []
+        self.rows = rows
+        self.bytes_scanned = bytes_scanned
+        self.memory = memory
+        self.columns = columns or []
+        self.table = None
+        # Column statistics of the rows this node emits, if known:
+        # {'row_count', 'columns': {column: stats}}
+        self.stats = None
+        # Conjuncts of a filter(..., pushed=True), as source text
+        self.pushed = []
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self):
+        return {
+            'op': self.op,
+            'detail': self.detail,
+            'rows': self.rows,
+            'bytes_scanned': self.bytes_scanned,
+            'memory_bytes': self.memory,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class Plan:
+    """Result of explain(): the operator tree and its totals."""
+
+    def __init__(self, root, code):
+        self.root = root
+        self.code = code
+
+    @property
+    def rows(self):
+        return self.root.rows
+
+    @property
+    def bytes_scanned(self):
+        return sum(node.bytes_scanned for node in self.root.walk())
+
+    @property
+    def memory(self):
+        # Upper bound: every materialized intermediate alive at once
+        return sum(node.memory for node in self.root.walk())
+
+    @property
+    def cost(self):
+        """Single number compared against cost limits: bytes scanned plus memory."""
+        return self.bytes_scanned + self.memory
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'rows': self.rows,
+            'bytes_scanned': self.bytes_scanned,
+            'memory_bytes': self.memory,
+            'cost_bytes': self.cost,
+            'root': self.root.to_dict(),
+        }
+
+    def format(self):
+        """Human-readable plan, one operator per line."""
+        lines = []
+        self._format_node(self.root, 0, lines)
+        lines.append(
+            f"Total: scan {format_bytes(self.bytes_scanned)}, "
+            f"memory {format_bytes(self.memory)}, result ≈{_format_rows(self.rows)} rows"
+        )
+        return "\n".join(lines)
+
+    def _format_node(self, node, depth, lines):
+        prefix = "  " * (depth - 1) + "└─ " if depth else ""
+        parts = [f"rows≈{_format_rows(node.rows)}"]
+        if node.bytes_scanned:
+            parts.append(f"scan {format_bytes(node.bytes_scanned)}")
+        if node.memory:
+            parts.append(f"mem {format_bytes(node.memory)}")
+        detail = f" {node.detail}" if node.detail else ""
+        lines.append(f"{prefix}{node.op}{detail}  ({', '.join(parts)})")
+        for child in node.children:
+            self._format_node(child, depth + 1, lines)
+
+
+def format_bytes(n):
+    n = float(n or 0)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _format_rows(rows):
+    return "?" if rows is None else f"{int(round(rows)):,}"
+
+
+def row_bytes(column_count):
+    """Estimated memory of one materialized row dict."""
+    return _ROW_BASE_BYTES + _ROW_COLUMN_BYTES * max(column_count, 1)
+
+
+# ---------- Predicate analysis ----------
+
+_ALL_CASTS = ('int', 'float', 'str')
+# Casts that keep the order and equality of the values they are applied to,
+# so a predicate on the cast value can be checked against raw statistics
+_ORDER_PRESERVING_CASTS = ('float',)
+
+
+def _column_ref(node, param, casts=_ALL_CASTS):
+    """Returns the column name if `node` is row['col'] (optionally cast), else None."""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+            and node.func.id in casts and len(node.args) == 1:
+        node = node.args[0]
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) \
+            and node.value.id == param:
+        key = node.slice
+        if isinstance(key, ast.Constant) and isinstance(key.value, str):
+            return key.value
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+            and node.func.attr == 'get' and isinstance(node.func.value, ast.Name) \
+            and node.func.value.id == param and node.args \
+            and isinstance(node.args[0], ast.Constant):
+        return node.args[0].value
+    return None
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+
+
+_OPS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=',
+    ast.Gt: '>', ast.GtE: '>=', ast.In: 'in', ast.NotIn: 'not in',
+    ast.Is: 'is', ast.IsNot: 'is not',
+}
+_FLIPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+
+def predicates(lambda_node):
+    """
+    Returns the simple conjuncts of a filter lambda as (column, op, value)
+    tuples, e.g. `lambda row: row['a'] > 3 and row['b'] == 'x'` gives
+    [('a', '>', 3), ('b', '==', 'x')]. Conjuncts that are not a column
+    compared with a literal are left out, and so are comparisons through
+    int() or str(), which do not preserve the order of the raw values.
+    """
+    if not isinstance(lambda_node, ast.Lambda) or not lambda_node.args.args:
+        return []
+    param = lambda_node.args.args[0].arg
+    found = []
+    for conjunct in _conjuncts(lambda_node.body):
+        pred = _simple_predicate(conjunct, param, casts=_ORDER_PRESERVING_CASTS)
+        if pred is not None:
+            found.append(pred)
+    return found
+
+
+def _conjuncts(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        for value in node.values:
+            yield from _conjuncts(value)
+    else:
+        yield node
+
+
+def _simple_predicate(node, param, casts=_ALL_CASTS):
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        return None
+    op = _OPS.get(type(node.ops[0]))
+    if op is None:
+        return None
+    left, right = node.left, node.comparators[0]
+    column = _column_ref(left, param, casts)
+    if column is not None and _is_literal(right):
+        return (column, op, _literal(right))
+    column = _column_ref(right, param, casts)
+    if column is not None and _is_literal(left) and op in ('==', '!=', '<', '<=', '>', '>='):
+        return (column, _FLIPPED.get(op, op), _literal(left))
+    return None
+
+
+def _is_literal(node):
+    try:
+        ast.literal_eval(node)
+        return True
+    except (ValueError, SyntaxError, TypeError):
+        return False
+
+
+def estimate_selectivity(lambda_node, stats=None):
+    """Fraction of rows a filter lambda keeps."""
+    if not isinstance(lambda_node, ast.Lambda) or not lambda_node.args.args:
+        return _DEFAULT_SELECTIVITY
+    param = lambda_node.args.args[0].arg
+    return _selectivity(lambda_node.body, param, stats)
+
+
+def _selectivity(node, param, stats):
+    if isinstance(node, ast.BoolOp):
+        parts = [_selectivity(v, param, stats) for v in node.values]
+        result = parts[0]
+        for s in parts[1:]:
+            result = result * s if isinstance(node.op, ast.And) else result + s - result * s
+        return result
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return 1 - _selectivity(node.operand, param, stats)
+    pred = _simple_predicate(node, param)
+    if pred is None:
+        return _DEFAULT_SELECTIVITY
+    return _predicate_selectivity(pred, stats)
+
+
+def _predicate_selectivity(pred, stats):
+    column, op, value = pred
+    if stats:
+        estimate = column_stats.selectivity(
+            stats['columns'].get(column), stats['row_count'], op, value
+        )
+        if estimate is not None:
+            return estimate
+    if op in ('==', 'is', 'in'):
+        base = _EQUALITY_SELECTIVITY
+        if op == 'in' and isinstance(value, (list, tuple, set)):
+            base = min(1.0, base * len(value))
+        return base
+    if op in ('!=', 'is not', 'not in'):
+        return 1 - _EQUALITY_SELECTIVITY
+    return _RANGE_SELECTIVITY
+
+
+# ---------- Plan construction ----------
+
+class _Literal:
+    """A non-plan value met while walking the expression (string, dict, lambda...)."""
+
+    def __init__(self, value, node=None):
+        self.value = value
+        self.node = node
+
+
+class _Builder:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def build(self, node):
+        if isinstance(node, ast.Name):
+            if node.id in self.tables:
+                return self._scan(node.id)
+            return _Literal(None, node)
+
+        if isinstance(node, ast.Lambda):
+            return _Literal(None, node)
+
+        if isinstance(node, (ast.Constant, ast.Dict, ast.List, ast.Tuple)):
+            value = _literal(node)
+            return _Literal(value, node)
+
+        if isinstance(node, ast.Attribute):
+            target = self.build(node.value)
+            if node.attr == 'columns' and isinstance(target, PlanNode):
+                return _Literal(list(target.columns), node)
+            return _Literal(None, node)
+
+        if isinstance(node, ast.Subscript):
+            return self._subscript(node)
+
+        if isinstance(node, ast.Call):
+            return self._call(node)
+
+        return _Literal(None, node)
+
+    def _scan(self, name):
+        info = self.tables[name]
+        columns = list((info.get('types') or {}).keys())
+        size = info.get('bytes')
+        if size is None and info.get('filepath'):
+            try:
+                size = os.path.getsize(info['filepath'])
+            except OSError:
+                size = 0
+        node = PlanNode('Scan', name, rows=info.get('row_count'),
+                        bytes_scanned=size or 0, columns=columns)
+        node.table = name
+        stats = info.get('stats')
+        if stats and info.get('filepath'):
+            # Only statistics of the file as it is now
+            try:
+                current = column_stats.stats_match_file(stats, column_stats.file_signature(info['filepath']))
+            except OSError:
+                current = False
+        else:
+            current = bool(stats) and (size is None or stats.get('bytes') == size)
+        if current:
+            node.stats = stats
+            node.rows = stats['row_count']
+        return node
+
+    def _subscript(self, node):
+        target = self.build(node.value)
+        if not isinstance(target, PlanNode):
+            return _Literal(None, node)
+        key = node.slice
+        if isinstance(key, ast.Slice):
+            start = _literal(key.lower) if key.lower is not None else 0
+            stop = _literal(key.upper) if key.upper is not None else None
+            rows = target.rows
+            if rows is not None and isinstance(start, int) and (stop is None or isinstance(stop, int)):
+                rows = max(0, min(rows, stop if stop is not None else rows) - start)
+            node = PlanNode('Limit', f"[{start or ''}:{'' if stop is None else stop}]",
+                            [target], rows=rows, columns=target.columns)
+            node.stats = target.stats
+            return node
+        return PlanNode('Index', '', [target], rows=1, columns=target.columns)
+
+    def _call(self, node):
+        args = [self.build(a) for a in node.args]
+        kwargs = {kw.arg: self.build(kw.value) for kw in node.keywords}
+
+        if isinstance(node.func, ast.Name):
+            name = node.func.id
+            if name == 'get_dataframe' and args and isinstance(args[0], _Literal) \
+                    and args[0].value in self.tables:
+                return self._scan(args[0].value)
+            if name == 'len' and args and isinstance(args[0], PlanNode):
+                return PlanNode('Count', '', [args[0]], rows=1)
+            if name == 'build_chart_url' and len(args) >= 3 and isinstance(args[2], PlanNode):
+                chart_type = args[1].value if isinstance(args[1], _Literal) else ''
+                return PlanNode('Chart', str(chart_type or ''), [args[2]], rows=1)
+            plan_args = [a for a in args if isinstance(a, PlanNode)]
+            if plan_args:
+                return PlanNode(name, '', plan_args, rows=1)
+            return _Literal(None, node)
+
+        if not isinstance(node.func, ast.Attribute):
+            return _Literal(None, node)
+
+        target = self.build(node.func.value)
+        if not isinstance(target, PlanNode):
+            return _Literal(None, node)
+        method = getattr(self, f"_op_{node.func.attr}", None)
+        if method is None:
+            return PlanNode(node.func.attr, '', [target], rows=target.rows, columns=target.columns)
+        return method(target, args, kwargs, node)
+
+    # --- operators: each returns a PlanNode with its estimates ---
+
+    def _op_filter(self, source, args, kwargs, call):
+        predicate = args[0].node if args and isinstance(args[0], _Literal) else None
+        pushed = isinstance(kwargs.get('pushed'), _Literal) and kwargs['pushed'].value is True
+        selectivity = estimate_selectivity(predicate, source.stats)
+        if isinstance(predicate, ast.Lambda) and not pushed:
+            # Conjuncts engine.optimizer already applied below a join keep every row here
+            applied = {text for child in source.walk() for text in child.pushed}
+            conjuncts = list(_conjuncts(predicate.body))
+            kept = [c for c in conjuncts if ast.unparse(c) not in applied]
+            if len(kept) < len(conjuncts):
+                body = kept[0] if len(kept) == 1 else ast.BoolOp(op=ast.And(), values=kept)
+                selectivity = estimate_selectivity(ast.Lambda(args=predicate.args, body=body),
+                                                   source.stats) if kept else 1.0
+        rows = None if source.rows is None else source.rows * selectivity
+        detail = ast.unparse(predicate.body) if isinstance(predicate, ast.Lambda) else ''
+        node = PlanNode('Filter', f"{detail} (pushed)" if pushed else detail, [source], rows=rows,
+                        columns=source.columns, memory=_materialized(rows, len(source.columns)))
+        node.table = source.table
+        node.stats = _scaled_stats(source.stats, rows)
+        if pushed and isinstance(predicate, ast.Lambda):
+            node.pushed = [ast.unparse(c) for c in _conjuncts(predicate.body)]
+        return node
+
+    def _op_project(self, source, args, kwargs, call):
+        columns = args[0].value if args and isinstance(args[0], _Literal) and isinstance(args[0].value, list) else source.columns
+        rows = source.rows
+        node = PlanNode('Project', ', '.join(map(str, columns)), [source], rows=rows, columns=columns,
+                        memory=_materialized(rows, len(columns)))
+        node.stats = source.stats
+        return node
+
+    def _op_join(self, source, args, kwargs, call):
+        right = args[0] if args and isinstance(args[0], PlanNode) else None
+        left_on = args[1].value if len(args) > 1 and isinstance(args[1], _Literal) else '?'
+        right_on = args[2].value if len(args) > 2 and isinstance(args[2], _Literal) else '?'
+        if right is None:
+            return PlanNode('Join', '', [source], rows=source.rows, columns=source.columns)
+
+        columns = list(source.columns) + [c for c in right.columns if c not in source.columns]
+        rows = None
+        if source.rows is not None and right.rows is not None:
+            left_distinct = _distinct(source, left_on)
+            right_distinct = _distinct(right, right_on)
+            if left_distinct and right_distinct:
+                rows = source.rows * right.rows / max(left_distinct, right_distinct)
+            else:
+                # Without key statistics assume a key / foreign-key join
+                rows = max(source.rows, right.rows)
+
+        # Same rule as DataFrame.join: hash the left side if the right is much larger
+        build = right
+        if source.rows is not None and right.rows is not None \
+                and right.rows > DataFrame.BUILD_SIDE_RATIO * max(source.rows, 1):
+            build = source
+        build_memory = _materialized(build.rows, len(build.columns))
+        node = PlanNode('HashJoin',
+                        f"{_key_detail(left_on)} = {_key_detail(right_on)} "
+                        f"(build {'left' if build is source else 'right'})",
+                        [source, right], rows=rows, columns=columns,
+                        memory=build_memory + _materialized(rows, len(columns)))
+        node.stats = _merged_stats(source.stats, right.stats, rows)
+        return node
+
+    def _op_groupby(self, source, args, kwargs, call):
+        column = args[0].value if args and isinstance(args[0], _Literal) else '?'
+        bucket_arg = args[1] if len(args) > 1 else kwargs.get('bucket')
+        bucket = bucket_arg.value if isinstance(bucket_arg, _Literal) else None
+        groups = _estimate_groups(source, column)
+        # On its own groupby() materializes every row into its group lists
+        detail = _key_detail(column)
+        node = PlanNode('GroupBy', f"{detail} ({bucket})" if bucket else detail, [source],
+                        rows=groups, columns=source.columns,
+                        memory=_materialized(source.rows, len(source.columns)))
+        node.group_column = column
+        node.bucket = bucket
+        return node
+
+    def _op_aggregate(self, source, args, kwargs, call):
+        groups = args[0] if args and isinstance(args[0], PlanNode) else None
+        agg_map = args[1].value if len(args) > 1 and isinstance(args[1], _Literal) else {}
+        detail = ', '.join(f"{func}({col})" for col, func in (agg_map or {}).items())
+        if groups is None or groups.op != 'GroupBy':
+            return PlanNode('Aggregate', detail, [groups] if groups else [], rows=None)
+        detail = f"{detail} by {groups.detail}"
+        rollup = self._rollup_for(groups, agg_map or {})
+        if rollup is not None:
+            # Answered from the rollup built at ingest: the table is not read
+            return PlanNode('RollupScan', detail, [], rows=len(rollup), memory=0)
+        # aggregate(groupby(...)) streams the source; no row lists are built
+        state_bytes = 120 + 40 * max(len(agg_map or {}), 1)
+        memory = 0 if groups.rows is None else groups.rows * state_bytes
+        return PlanNode('HashAggregate', detail, list(groups.children), rows=groups.rows,
+                        memory=memory)
+
+    def _rollup_for(self, groups, agg_map):
+        """The groups a table's rollup would answer the aggregate with, or None."""
+        source = groups.children[0] if groups.children else None
+        if source is None or source.op != 'Scan' or not isinstance(agg_map, dict):
+            return None
+        filepath = self.tables.get(source.table, {}).get('filepath')
+        available = rollups.load(filepath) if filepath else None
+        if available is None:
+            return None
+        try:
+            return available.answer(groups.group_column, groups.bucket, agg_map)
+        except (TypeError, ValueError):
+            return None
+
+    def _op_pivot(self, source, args, kwargs, call):
+        names = ('index', 'columns', 'values', 'agg', 'bucket')
+        given = dict(zip(names, args))
+        given.update({k: v for k, v in kwargs.items() if k in names})
+        value = {k: v.value for k, v in given.items() if isinstance(v, _Literal)}
+        agg = value.get('agg') or 'sum'
+        detail = f"{agg}({value.get('values') or '*'}) by {_key_detail(value.get('index', '?'))} " \
+                 f"x {value.get('columns', '?')}"
+        if value.get('bucket'):
+            detail += f" ({value['bucket']})"
+        # One hash aggregation pass; a state per (row, column) cell
+        rows = _estimate_groups(source, value.get('index'))
+        cells = _estimate_groups(source, [value.get('index'), value.get('columns')]) \
+            if isinstance(value.get('index'), str) and isinstance(value.get('columns'), str) else rows
+        return PlanNode('Pivot', detail, [source], rows=rows,
+                        memory=0 if cells is None else cells * 160)
+
+    def _op_window(self, source, args, kwargs, call):
+        op = call.func.attr
+        column = args[0].value if args and isinstance(args[0], _Literal) else '?'
+        name = kwargs['name'].value if isinstance(kwargs.get('name'), _Literal) else None
+        detail = f"{op}({column})"
+        for keyword, label in (('partition_by', 'partition by'), ('order_by', 'order by')):
+            if isinstance(kwargs.get(keyword), _Literal) and kwargs[keyword].value is not None:
+                detail += f" {label} {_key_detail(kwargs[keyword].value)}"
+        columns = list(source.columns) + [name or f"{column}_{op}"]
+        # The rows are copied into the result (and sorted first for order_by)
+        node = PlanNode('Window', detail, [source], rows=source.rows, columns=columns,
+                        memory=_materialized(source.rows, len(columns)))
+        node.stats = source.stats
+        return node
+
+    _op_cumsum = _op_lag = _op_lead = _op_rolling_mean = _op_window
+
+    def _op_max_by(self, source, args, kwargs, call):
+        column = args[0].value if args and isinstance(args[0], _Literal) else '?'
+        return PlanNode('MaxBy', str(column), [source], rows=1 if source.rows != 0 else 0,
+                        columns=source.columns)
+
+    def _op_min_by(self, source, args, kwargs, call):
+        column = args[0].value if args and isinstance(args[0], _Literal) else '?'
+        return PlanNode('MinBy', str(column), [source], rows=1 if source.rows != 0 else 0,
+                        columns=source.columns)
+
+    def _op_top_k_by(self, source, args, kwargs, call):
+        column = args[0].value if args and isinstance(args[0], _Literal) else '?'
+        k_arg = args[1] if len(args) > 1 else kwargs.get('k')
+        k = k_arg.value if isinstance(k_arg, _Literal) and isinstance(k_arg.value, int) else 5
+        rows = k if source.rows is None else min(k, source.rows)
+        # top_k_by buffers every (value, row) pair before sorting
+        return PlanNode('TopK', f"{column} k={k}", [source], rows=rows, columns=source.columns,
+                        memory=_materialized(source.rows, len(source.columns)))
+
+
+def _key_detail(columns):
+    """A groupby/join key as shown in plans: 'col' or '(a, b)'."""
+    if isinstance(columns, (list, tuple)):
+        return f"({', '.join(map(str, columns))})"
+    return str(columns)
+
+
+def _materialized(rows, column_count):
+    if rows is None:
+        return 0
+    return int(rows * row_bytes(column_count))
+
+
+def _distinct(node, column):
+    if isinstance(column, (list, tuple)):
+        # A composite key: at most the product of its columns' distinct counts
+        product = 1
+        for part in column:
+            distinct = _distinct(node, part)
+            if distinct is None:
+                return None
+            product *= distinct
+        return min(product, node.rows) if node.rows is not None else product
+    if not isinstance(column, str):
+        return None
+    col = (node.stats or {}).get('columns', {}).get(column)
+    if not col or not col.get('distinct'):
+        return None
+    return min(col['distinct'], node.rows) if node.rows is not None else col['distinct']
+
+
+def _scaled_stats(stats, rows):
+    """Statistics of a subset of rows: same columns, new row count."""
+    if not stats or rows is None:
+        return stats
+    return {'row_count': rows, 'columns': stats['columns']}
+
+
+def _merged_stats(left, right, rows):
+    if not left and not right:
+        return None
+    columns = dict((right or {}).get('columns', {}))
+    columns.update((left or {}).get('columns', {}))
+    return {'row_count': rows or 0, 'columns': columns}
+
+
+def _estimate_groups(source, column):
+    if source.rows is None:
+        return None
+    distinct = _distinct(source, column)
+    if distinct:
+        return distinct
+    return min(source.rows, _DEFAULT_GROUPS)
+
+
+def explain(code, tables):
+    """
+    Plans a generated expression without executing it.
+
+    `tables` maps table names to what is known about them:
+    {'filepath', 'types', 'row_count'} and optionally 'bytes'.
+    Raises PlanError if the code does not parse or contains no
+    DataFrame operation.
+    """
+    try:
+        tree = ast.parse(code.strip(), mode='eval')
+    except SyntaxError as e:
+        raise PlanError(f"Cannot parse query: {e}")
+
+    root = _Builder(tables).build(tree.body)
+    if not isinstance(root, PlanNode):
+        raise PlanError("Query does not use any table")
+    return Plan(root, code)
+
+
+class _Annotator(ast.NodeTransformer):
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Attribute) and node.func.attr == 'filter' \
+                and len(node.args) == 1 and isinstance(node.args[0], ast.Lambda) \
+                and not any(kw.arg == 'predicates' for kw in node.keywords):
+            found = predicates(node.args[0])
+            if found:
+                value = ast.parse(repr(found), mode='eval').body
+                node.keywords.append(ast.keyword(arg='predicates', value=value))
+        return node
+
+
+def annotate(code):
+    """
+    Returns `code` with predicates=[(column, op, value), ...] added to every
+    filter(lambda ...) call whose lambda has simple conjuncts, so
+    DataFrame.filter can prune with column statistics. Code that does not
+    parse is returned unchanged.
+    """
+    try:
+        tree = ast.parse(code.strip(), mode='eval')
+    except SyntaxError:
+        return code
+    tree = ast.fix_missing_locations(_Annotator().visit(tree))
+    return ast.unparse(tree)
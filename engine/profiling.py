@@ -0,0 +1,149 @@
+# engine/profiling.py
+"""
+Per-query operator profiles.
+
+While a profile is active (see profile()), every DataFrame operator adds
+an entry with its wall time, the rows it read from its source, the rows
+it emitted, the bytes it read from disk and, when memory tracking is
+requested, the peak memory allocated while it ran. Rows and bytes are
+counted against the innermost running operator. Outside a profile every
+hook is a no-op. The active profile is tracked per thread (a context
+variable), so concurrent queries in one process keep separate profiles.
+"""
+import contextvars
+import functools
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_active = contextvars.ContextVar('query_profile', default=None)
+
+
+class QueryProfile:
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.operators = []
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.seconds = None
+        self.peak_memory_bytes = None
+        self._stack = []
+
+    def to_dict(self):
+        return {
+            'seconds': self.seconds,
+            'rows_read': self.rows_read,
+            'bytes_read': self.bytes_read,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'operators': self.operators,
+        }
+
+
+def active():
+    """Returns the running QueryProfile, or None."""
+    return _active.get()
+
+
+@contextmanager
+def profile(track_memory=False):
+    """Profiles every operator executed inside the block."""
+    prof = QueryProfile(track_memory)
+    token = _active.set(prof)
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if track_memory:
+        tracemalloc.reset_peak()
+        base_memory = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield prof
+    finally:
+        prof.seconds = time.perf_counter() - started
+        if track_memory:
+            prof.peak_memory_bytes = max(0, tracemalloc.get_traced_memory()[1] - base_memory)
+            if started_tracing:
+                tracemalloc.stop()
+        _active.reset(token)
+
+
+def add_rows_read(count):
+    prof = _active.get()
+    if prof is None or not count:
+        return
+    prof.rows_read += count
+    if prof._stack:
+        prof._stack[-1]['rows_read'] += count
+
+
+def add_bytes_read(count):
+    prof = _active.get()
+    if prof is None or not count:
+        return
+    prof.bytes_read += count
+    if prof._stack:
+        prof._stack[-1]['bytes_read'] += count
+
+
+def _emitted(result):
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if getattr(result, 'source_type', None) == 'list':
+        return len(result.data)
+    return 1 if result is not None else 0
+
+
+def _enter(prof, entry):
+    if prof.track_memory:
+        # tracemalloc has a single peak: fold it into the enclosing
+        # operator before resetting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        if prof._stack:
+            parent = prof._stack[-1]
+            parent['_peak'] = max(parent['_peak'], peak)
+        tracemalloc.reset_peak()
+        entry['_base'] = entry['_peak'] = current
+    prof.operators.append(entry)
+    prof._stack.append(entry)
+
+
+def _exit(prof, entry):
+    prof._stack.pop()
+    if prof.track_memory:
+        peak = max(entry.pop('_peak'), tracemalloc.get_traced_memory()[1])
+        entry['peak_memory_bytes'] = max(0, peak - entry.pop('_base'))
+        if prof._stack:
+            parent = prof._stack[-1]
+            parent['_peak'] = max(parent['_peak'], peak)
+
+
+def operator(name):
+    """Decorator recording a DataFrame method as a profiled operator."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            prof = _active.get()
+            if prof is None:
+                return method(self, *args, **kwargs)
+
+            entry = {
+                'op': name,
+                'table': os.path.basename(self.filepath) if self.filepath else None,
+                'depth': len(prof._stack),
+                'seconds': None,
+                'rows_read': 0,
+                'rows_emitted': None,
+                'bytes_read': 0,
+            }
+            _enter(prof, entry)
+            started = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+                entry['rows_emitted'] = _emitted(result)
+                return result
+            finally:
+                entry['seconds'] = time.perf_counter() - started
+                _exit(prof, entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,296 @@
+# engine/rollups.py
+"""
+Pre-aggregated rollups computed at ingest.
+
+A rollup pre-aggregates one table by one dimension column. For every
+group it stores the row count and, for each measure column, the sum,
+count, min and max of the values that cast to float. That is enough to
+answer aggregate(df.groupby(dim), {measure: func}) for every supported
+function without reading the table.
+
+Date-like dimensions ('YYYY-MM-DD...' values) are also rolled up by day.
+A day rollup answers groupby(dim, bucket='day' | 'month' | 'year') by
+merging its days into the coarser buckets.
+
+Rollups live next to the CSV as `<file>.rollups` and, like the column
+statistics, record the file size they were computed for. A dimension
+that reaches MAX_GROUPS groups while building is dropped: beyond that a
+rollup saves little over scanning.
+"""
+import json
+import os
+import tempfile
+from .aggregation import SUPPORTED_FUNCS, DATE_BUCKETS, bucket_key
+from .column_stats import file_signature, stats_match_file
+
+MAX_GROUPS = 5000
+# In 'auto' mode every int/str column is a dimension and every float column a measure
+_AUTO_DIMENSION_TYPES = ('int', 'str')
+_AUTO_MEASURE_TYPES = ('float',)
+
+_cache = {}  # path -> (file signature, rollups file mtime, Rollups)
+
+
+def path_for(filepath):
+    """Where the rollups of a CSV file are stored."""
+    return f"{filepath}.rollups"
+
+
+def choose(header, column_types, spec='auto'):
+    """
+    The rollups to build for a table, as [(column, bucket, measures)].
+
+    `spec` is 'auto' (every int/str column by every float column) or a
+    comma separated list of 'dimension:measure' pairs; pairs whose columns
+    the table lacks are ignored. Every str dimension is also tried by day,
+    kept only if its values turn out to be dates. '' or 'off' disables
+    rollups.
+    """
+    spec = (spec or '').strip()
+    if spec in ('', 'off'):
+        return []
+    if spec == 'auto':
+        measures = [c for c in header if column_types.get(c) in _AUTO_MEASURE_TYPES]
+        by_dimension = {c: measures for c in header
+                        if column_types.get(c) in _AUTO_DIMENSION_TYPES} if measures else {}
+    else:
+        by_dimension = {}
+        for pair in spec.split(','):
+            dimension, _, measure = (part.strip() for part in pair.partition(':'))
+            if dimension in header and measure in header:
+                by_dimension.setdefault(dimension, [])
+                if measure not in by_dimension[dimension]:
+                    by_dimension[dimension].append(measure)
+
+    chosen = []
+    for column, measures in by_dimension.items():
+        chosen.append((column, None, list(measures)))
+        if column_types.get(column) == 'str':
+            chosen.append((column, 'day', list(measures)))
+    return chosen
+
+
+class RollupBuilder:
+    """Folds the rows of a table into the chosen rollups, see choose()."""
+
+    def __init__(self, chosen, max_groups=None, extending=False):
+        # extending: the rollups already exist for the earlier rows of the
+        # table, so date rollups are not dropped for a leading non-date
+        self.max_groups = max_groups or MAX_GROUPS
+        # Measures are cast once per row, then shared by every rollup
+        self.measures = []
+        for _, _, measures in chosen:
+            self.measures.extend(m for m in measures if m not in self.measures)
+        self.rollups = [{'column': column, 'bucket': bucket, 'measures': measures,
+                         'slots': [self.measures.index(m) for m in measures],
+                         'groups': {}, 'checked': extending or bucket is None}
+                        for column, bucket, measures in chosen]
+
+    def track(self, rows):
+        """Yields the rows of `rows` while folding them into the rollups."""
+        for row in rows:
+            self._add(row)
+            yield row
+
+    def _add(self, row):
+        values = []
+        for measure in self.measures:
+            try:
+                values.append(float(row[measure]))
+            except (ValueError, TypeError, KeyError):
+                values.append(None)
+
+        dropped = False
+        for rollup in self.rollups:
+            value = row.get(rollup['column'])
+            if value is None:
+                continue
+            key = value if rollup['bucket'] is None else bucket_key(value, rollup['bucket'])
+            if key is None:
+                if not rollup['checked']:
+                    # The first value is not a date: no date rollup for this column
+                    rollup['groups'] = None
+                    dropped = True
+                continue
+            rollup['checked'] = True
+            groups = rollup['groups']
+            state = groups.get(key)
+            if state is None:
+                if len(groups) >= self.max_groups:
+                    rollup['groups'] = None
+                    dropped = True
+                    continue
+                state = groups[key] = [0] + [[0, 0, None, None] for _ in rollup['measures']]
+            state[0] += 1
+            for acc, slot in zip(state[1:], rollup['slots']):
+                val = values[slot]
+                if val is None:
+                    continue
+                acc[0] += val
+                acc[1] += 1
+                if acc[2] is None or val < acc[2]:
+                    acc[2] = val
+                if acc[3] is None or val > acc[3]:
+                    acc[3] = val
+        if dropped:
+            self.rollups = [r for r in self.rollups if r['groups'] is not None]
+
+    def result(self, file_size, mtime_ns=None):
+        return {
+            'bytes': file_size,
+            'mtime_ns': mtime_ns,
+            'rollups': [{'column': r['column'], 'bucket': r['bucket'], 'measures': r['measures'],
+                         'groups': [[key, state] for key, state in r['groups'].items()]}
+                        for r in self.rollups],
+        }
+
+
+def write_rollups(filepath, data):
+    """Stores the rollups of a CSV file next to it (atomically)."""
+    path = path_for(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _cache.pop(path, None)
+
+
+def extend_rollups(filepath, existing, appended, max_groups=None):
+    """
+    Stores the rollups of a table after an append: the groups of
+    `existing` (a Rollups) merged with those of `appended` (the
+    RollupBuilder result of the appended rows). A rollup either side
+    dropped, or that grows past max_groups, is dropped.
+    """
+    max_groups = max_groups or MAX_GROUPS
+    new_by_spec = {(r['column'], r['bucket']): r for r in appended['rollups']}
+    merged_rollups = []
+    for rollup in existing.rollups:
+        new = new_by_spec.get((rollup['column'], rollup['bucket']))
+        if new is None or new['measures'] != rollup['measures']:
+            continue
+        merged = {}
+        for key, state in rollup['groups'] + new['groups']:
+            _merge_into(merged, key, state)
+        if len(merged) <= max_groups:
+            merged_rollups.append(dict(rollup, groups=[[key, state] for key, state in merged.items()]))
+    write_rollups(filepath, {'bytes': appended['bytes'], 'mtime_ns': appended.get('mtime_ns'),
+                             'rollups': merged_rollups})
+
+
+def _merge_into(merged, key, state):
+    """Adds a group's state to merged[key] (a copy is stored for a new key)."""
+    into = merged.get(key)
+    if into is None:
+        merged[key] = [state[0]] + [list(acc) for acc in state[1:]]
+        return
+    into[0] += state[0]
+    for acc, other in zip(into[1:], state[1:]):
+        acc[0] += other[0]
+        acc[1] += other[1]
+        if other[2] is not None and (acc[2] is None or other[2] < acc[2]):
+            acc[2] = other[2]
+        if other[3] is not None and (acc[3] is None or other[3] > acc[3]):
+            acc[3] = other[3]
+
+
+def load(filepath):
+    """
+    Returns the Rollups of a CSV file, or None if it has none or the file
+    changed since they were built. Loaded rollups are cached per process.
+    """
+    path = path_for(filepath)
+    try:
+        signature = file_signature(filepath)
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (signature, mtime):
+        return cached[2]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    rollups = Rollups(data) if stats_match_file(data, signature) else None
+    _cache[path] = (signature, mtime, rollups)
+    return rollups
+
+
+def remove(filepath):
+    """Deletes the rollups of a CSV file, if any."""
+    try:
+        os.remove(path_for(filepath))
+    except FileNotFoundError:
+        pass
+    _cache.pop(path_for(filepath), None)
+
+
+class Rollups:
+    def __init__(self, data):
+        self.rollups = data['rollups']
+
+    def chosen(self):
+        """The rollups held, in the form choose() returns."""
+        return [(r['column'], r['bucket'], r['measures']) for r in self.rollups]
+
+    def _find(self, column, bucket, agg_func_map):
+        """The rollup answering the aggregate, preferring the one with the fewest groups."""
+        needed = [col for col, func in agg_func_map.items() if func in SUPPORTED_FUNCS and func != 'count']
+        best = None
+        for rollup in self.rollups:
+            if rollup['column'] != column or any(col not in rollup['measures'] for col in needed):
+                continue
+            # Raw values can be bucketed; days can be merged into months and years
+            if not (rollup['bucket'] is None or (rollup['bucket'] == 'day' and bucket in DATE_BUCKETS)):
+                continue
+            if best is None or len(rollup['groups']) < len(best['groups']):
+                best = rollup
+        return best
+
+    def can_answer(self, column, bucket, agg_func_map):
+        return self._find(column, bucket, agg_func_map) is not None
+
+    def answer(self, column, bucket, agg_func_map):
+        """
+        The result of aggregate(df.groupby(column, bucket), agg_func_map),
+        or None if no rollup can answer it. Groups keep the order of their
+        first appearance in the table.
+        """
+        rollup = self._find(column, bucket, agg_func_map)
+        if rollup is None:
+            return None
+        positions = {measure: i for i, measure in enumerate(rollup['measures'], start=1)}
+
+        merged = {}
+        for key, state in rollup['groups']:
+            if bucket is not None and bucket != rollup['bucket']:
+                key = bucket_key(key, bucket)
+                if key is None:
+                    continue
+            _merge_into(merged, key, state)
+
+        results = {}
+        for key, state in merged.items():
+            result = {}
+            for col, func in agg_func_map.items():
+                if func == 'count':
+                    result[col] = state[0]
+                elif func in SUPPORTED_FUNCS:
+                    total, count, low, high = state[positions[col]]
+                    if func == 'sum':
+                        result[col] = total
+                    elif func == 'avg':
+                        result[col] = total / count if count > 0 else 0
+                    elif func == 'min':
+                        result[col] = low
+                    else:
+                        result[col] = high
+            results[key] = result
+        return results
@@ -0,0 +1,527 @@
+# engine/segments.py
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+MAGIC = b'AISTSEG1'
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+# Rows a column accumulates in memory before its buffers are spilled to disk
+CHUNK_ROWS = 65536
+
+
+class _Spill:
+    """
+    One temporary file the column buffers of a segment being written are
+    appended to, a chunk at a time; chunks[(column, buffer)] lists where
+    each chunk of a buffer went, in order.
+    """
+
+    def __init__(self, directory):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.chunks = {}
+
+    def append(self, key, data):
+        # Empty chunks are recorded too, so the buffers of a column stay aligned
+        self.file.seek(0, os.SEEK_END)
+        self.chunks.setdefault(key, []).append((self.file.tell(), len(data)))
+        self.file.write(data)
+
+    def size(self, key):
+        return sum(length for _, length in self.chunks.get(key, ()))
+
+    def read(self, chunk):
+        offset, length = chunk
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+
+class _ColumnBuilder:
+    """
+    Accumulates one column in a compact binary buffer, spilled to a
+    _Spill every `chunk_rows` rows so a column never holds more than one
+    chunk in memory.
+
+    Kinds:
+      - int   -> array('q')
+      - float -> array('d')
+      - str   -> utf-8 blob + array('q') of end offsets
+      - json  -> same as str, values JSON-encoded (mixed-type columns)
+    A column starts with the kind inferred by the parser and is promoted
+    to 'json' if a value does not fit (e.g. a failed int cast).
+    """
+
+    def __init__(self, kind, spill, index, chunk_rows=CHUNK_ROWS):
+        self.kind = kind if kind in ('int', 'float') else 'str'
+        self.spill = spill
+        self.index = index
+        self.chunk_rows = chunk_rows
+        self.null_count = 0
+        self.blob_spilled = 0  # bytes of the blob already spilled; offsets count them
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self.nulls = bytearray()
+        self.values = array('q') if self.kind == 'int' else array('d') if self.kind == 'float' else None
+        self.blob = bytearray()
+        self.offsets = array('q')
+
+    def _fits(self, value):
+        if self.kind == 'int':
+            return type(value) is int and _INT64_MIN <= value <= _INT64_MAX
+        if self.kind == 'float':
+            return type(value) is float
+        if self.kind == 'str':
+            return type(value) is str
+        return True
+
+    def add(self, value):
+        if value is None:
+            self.nulls.append(1)
+            self.null_count += 1
+            if self.values is not None:
+                self.values.append(0)
+            else:
+                self.offsets.append(self.blob_spilled + len(self.blob))
+        else:
+            if not self._fits(value):
+                self._promote_to_json()
+
+            self.nulls.append(0)
+            if self.values is not None:
+                self.values.append(value)
+            else:
+                if self.kind == 'json':
+                    value = json.dumps(value)
+                self.blob += value.encode('utf-8')
+                self.offsets.append(self.blob_spilled + len(self.blob))
+
+        if len(self.nulls) >= self.chunk_rows:
+            self.flush()
+
+    def buffer_names(self):
+        return ('nulls', 'values') if self.kind in ('int', 'float') else ('nulls', 'offsets', 'blob')
+
+    def flush(self):
+        """Spills the rows held in memory."""
+        if not self.nulls:
+            return
+        chunk = {'nulls': bytes(self.nulls)}
+        if self.values is not None:
+            chunk['values'] = self.values.tobytes()
+        else:
+            chunk['offsets'] = self.offsets.tobytes()
+            chunk['blob'] = bytes(self.blob)
+            self.blob_spilled += len(self.blob)
+        for name, data in chunk.items():
+            self.spill.append((self.index, name), data)
+        self._reset_chunk()
+
+    def _spilled_values(self, kind, chunks):
+        """Yields the values a column of `kind` spilled, reading one chunk at a time."""
+        blob_start = 0
+        for i, null_chunk in enumerate(chunks['nulls']):
+            nulls = self.spill.read(null_chunk)
+            if kind in ('int', 'float'):
+                values = array('q' if kind == 'int' else 'd')
+                values.frombytes(self.spill.read(chunks['values'][i]))
+                yield from _iter_column(kind, nulls, 1, values, None, None)
+            else:
+                offsets = array('q')
+                offsets.frombytes(self.spill.read(chunks['offsets'][i]))
+                blob = self.spill.read(chunks['blob'][i])
+                yield from _iter_column(kind, nulls, 1, None, blob,
+                                        array('q', (end - blob_start for end in offsets)))
+                blob_start += len(blob)
+
+    def _promote_to_json(self):
+        self.flush()
+        kind = self.kind
+        chunks = {name: self.spill.chunks.pop((self.index, name), []) for name in self.buffer_names()}
+        self.kind = 'json'
+        self.null_count = 0
+        self.blob_spilled = 0
+        self._reset_chunk()
+        for value in self._spilled_values(kind, chunks):
+            self.add(value)
+
+
+def _iter_column(kind, nulls, null_count, values, blob, offsets, blob_start=0):
+    """Yields the Python values of a column from its buffers."""
+    if kind in ('int', 'float'):
+        source = iter(values)
+    else:
+        def _decode():
+            start = blob_start
+            for end in offsets:
+                if kind == 'json' and end > start:
+                    yield json.loads(str(blob[start:end], 'utf-8'))
+                else:
+                    yield str(blob[start:end], 'utf-8')
+                start = end
+        source = _decode()
+
+    if not null_count:
+        return source
+    return (None if is_null else v for v, is_null in zip(source, nulls))
+
+
+def write_segment(path, header, rows, column_types=None, chunk_rows=CHUNK_ROWS):
+    """
+    Encodes an iterable of row dicts into a columnar segment file.
+    Columns are spilled to a temporary file every `chunk_rows` rows and
+    copied into place once the sizes of their buffers are known, so
+    memory holds one chunk per column rather than the whole table. The
+    file is written next to `path` and atomically moved into place.
+    Returns the number of rows written.
+    """
+    column_types = column_types or {}
+    directory = os.path.dirname(path) or '.'
+    spill = _Spill(directory)
+    try:
+        builders = [_ColumnBuilder(column_types.get(col, 'str'), spill, i, chunk_rows)
+                    for i, col in enumerate(header)]
+        row_count = 0
+        for row in rows:
+            for col, builder in zip(header, builders):
+                builder.add(row.get(col))
+            row_count += 1
+        for builder in builders:
+            builder.flush()
+
+        # Lay out every buffer 8-byte aligned after the header
+        columns_meta = []
+        position = 0
+        for col, builder in zip(header, builders):
+            meta = {'name': col, 'kind': builder.kind, 'null_count': builder.null_count}
+            for name in builder.buffer_names():
+                length = spill.size((builder.index, name))
+                meta[name] = [position, length]
+                position += length + (-length) % 8
+            columns_meta.append(meta)
+
+        header_bytes = json.dumps({'rows': row_count, 'columns': columns_meta}).encode('utf-8')
+        header_bytes += b' ' * ((-(len(MAGIC) + 8 + len(header_bytes))) % 8)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<Q', len(header_bytes)))
+                f.write(header_bytes)
+                for builder in builders:
+                    for name in builder.buffer_names():
+                        key = (builder.index, name)
+                        for chunk in spill.chunks.get(key, ()):
+                            f.write(spill.read(chunk))
+                        padding = (-spill.size(key)) % 8
+                        if padding:
+                            f.write(b'\0' * padding)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        spill.close()
+    return row_count
+
+
+class Segment:
+    """
+    Read-only view of a segment file mapped into memory.
+
+    Every process that opens the same file shares the same physical pages,
+    so a table costs its size once per host rather than once per worker.
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a segment file: {path}")
+        (header_len,) = struct.unpack_from('<Q', self._mm, len(MAGIC))
+        data_start = len(MAGIC) + 8
+        meta = json.loads(self._mm[data_start:data_start + header_len])
+        self._base = data_start + header_len
+        self.row_count = meta['rows']
+        self.columns = meta['columns']
+        self.header = [c['name'] for c in self.columns]
+        self.nbytes = len(self._mm)
+
+    def _buffer(self, span, fmt=None):
+        start, length = span
+        view = memoryview(self._mm)[self._base + start:self._base + start + length]
+        return view.cast(fmt) if fmt else view
+
+    def column(self, name, start=0, stop=None):
+        """Yields the values of one column for rows [start, stop)."""
+        meta = next(c for c in self.columns if c['name'] == name)
+        return self._column_iter(meta, start, stop)
+
+    def _column_iter(self, meta, start=0, stop=None):
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+        kind = meta['kind']
+        nulls = self._buffer(meta['nulls'])[start:stop]
+        if kind in ('int', 'float'):
+            values = self._buffer(meta['values'], 'q' if kind == 'int' else 'd')[start:stop]
+            return _iter_column(kind, nulls, meta['null_count'], values, None, None)
+        offsets = self._buffer(meta['offsets'], 'q')
+        blob = self._buffer(meta['blob'])
+        blob_start = offsets[start - 1] if start > 0 else 0
+        return _iter_column(kind, nulls, meta['null_count'], None, blob,
+                            offsets[start:stop], blob_start=blob_start)
+
+    def rows(self, start=0, stop=None, key_filter=None):
+        """
+        Generator that yields one row dict at a time, like CsvParser.parse().
+        `start`/`stop` restrict the scan to a range of row numbers, and
+        `key_filter` to the rows whose key is in a set, as in
+        CsvParser.parse_range().
+        """
+        header = self.header
+        iters = [self._column_iter(meta, start, stop) for meta in self.columns]
+        if key_filter is None or key_filter[0] not in header:
+            for values in zip(*iters):
+                yield dict(zip(header, values))
+            return
+        key_pos = header.index(key_filter[0])
+        keys = key_filter[1]
+        for values in zip(*iters):
+            if values[key_pos] in keys:
+                yield dict(zip(header, values))
+
+    def take(self, row_numbers):
+        """Yields the rows with the given ascending row numbers."""
+        run_start = run_stop = None
+        for number in row_numbers:
+            if number == run_stop:
+                run_stop += 1
+                continue
+            if run_start is not None:
+                yield from self.rows(run_start, run_stop)
+            run_start, run_stop = number, number + 1
+        if run_start is not None:
+            yield from self.rows(run_start, run_stop)
+
+    def row_ranges(self, n):
+        """Splits the segment into `n` contiguous row ranges of similar size."""
+        if n <= 1 or self.row_count < n:
+            return [(0, self.row_count)]
+        step = self.row_count // n
+        bounds = [i * step for i in range(n)] + [self.row_count]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def __len__(self):
+        return self.row_count
+
+
+class SegmentStore:
+    """
+    Small local coordinator for segment files shared by all workers on a host.
+
+    State lives in `registry.json` inside `directory` and is only touched
+    while holding an exclusive flock, so any process can take part:
+      - build() writes the segment for a CSV file once; the upload route
+        starts it in the background (build_in_background()), so queries
+        do not pay for it.
+      - acquire() maps the segment for a CSV file, recording a reference
+        for the calling pid. A segment not built yet is built there, or
+        with build=False not at all: the caller reads the CSV meanwhile.
+      - release() drops that reference.
+      - Segments without live references are evicted, least recently used
+        first, whenever the total size exceeds `budget_bytes`.
+    Processes that already mapped an evicted file keep a valid mapping.
+    """
+
+    def __init__(self, directory, budget_bytes):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._registry_path = os.path.join(directory, 'registry.json')
+        self._lock_path = os.path.join(directory, '.lock')
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                registry = self._read_registry()
+                yield registry
+                self._write_registry(registry)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_registry(self):
+        try:
+            with open(self._registry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_registry(self, registry):
+        tmp_path = self._registry_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f)
+        os.replace(tmp_path, self._registry_path)
+
+    @staticmethod
+    def segment_key(filepath, mtime):
+        raw = f"{os.path.abspath(filepath)}|{mtime}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+    def _path_for(self, key):
+        return os.path.join(self.directory, f"{key}.seg")
+
+    def exists(self, filepath):
+        """True if the segment of the file as it is now has been built."""
+        return os.path.exists(self._path_for(self.segment_key(filepath, os.path.getmtime(filepath))))
+
+    def build(self, parser):
+        """Writes the segment for the parser's file unless it exists; returns its key."""
+        key = self.segment_key(parser.filepath, os.path.getmtime(parser.filepath))
+        path = self._path_for(key)
+        if not os.path.exists(path):
+            # Built outside the lock; a concurrent build of the same
+            # file produces identical bytes, so the last rename wins.
+            write_segment(path, parser.get_header(), parser.parse(),
+                          column_types=parser.get_column_types())
+        return key
+
+    def _claim_build(self, key):
+        """
+        Takes the `<key>.building` marker for this process; False if a live
+        process (this one included) is already building the segment.
+        """
+        marker = os.path.join(self.directory, f"{key}.building")
+        for _ in range(2):
+            try:
+                fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(marker, 'r', encoding='utf-8') as f:
+                        owner = f.read().strip()
+                except FileNotFoundError:
+                    continue
+                if not owner or self._pid_alive(owner):
+                    return False
+                # Left behind by a process that died mid-build
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def build_in_background(self, parser):
+        """
+        Starts build() in a daemon thread, unless the segment exists or
+        another build of it is running. Returns the thread, or None.
+        """
+        key = self.segment_key(parser.filepath, os.path.getmtime(parser.filepath))
+        if os.path.exists(self._path_for(key)) or not self._claim_build(key):
+            return None
+
+        def run():
+            try:
+                self.build(parser)
+            except Exception as e:
+                print(f"Error building segment for {parser.filepath}: {e}")
+            finally:
+                try:
+                    os.remove(os.path.join(self.directory, f"{key}.building"))
+                except FileNotFoundError:
+                    pass
+
+        thread = threading.Thread(target=run, name=f"segment-{key[:8]}", daemon=True)
+        thread.start()
+        return thread
+
+    def acquire(self, parser, build=True):
+        """
+        Returns a mapped Segment for the parser's file, building it if
+        needed; with build=False a segment not built yet gives None.
+        """
+        mtime = os.path.getmtime(parser.filepath)
+        key = self.segment_key(parser.filepath, mtime)
+        path = self._path_for(key)
+
+        if not os.path.exists(path):
+            if not build:
+                return None
+            self.build(parser)
+
+        pid = str(os.getpid())
+        with self._locked() as registry:
+            entry = registry.setdefault(key, {
+                'source': os.path.abspath(parser.filepath),
+                'size': os.path.getsize(path),
+                'refs': {},
+            })
+            entry['refs'][pid] = entry['refs'].get(pid, 0) + 1
+            entry['last_used'] = time.time()
+            self._evict(registry)
+
+        return Segment(path, key=key)
+
+    def release(self, segment):
+        """Drops this process's reference to a segment."""
+        if segment is None or segment.key is None:
+            return
+        pid = str(os.getpid())
+        with self._locked() as registry:
+            entry = registry.get(segment.key)
+            if not entry:
+                return
+            count = entry['refs'].get(pid, 0) - 1
+            if count > 0:
+                entry['refs'][pid] = count
+            else:
+                entry['refs'].pop(pid, None)
+            self._evict(registry)
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(int(pid), 0)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _evict(self, registry):
+        # References held by dead workers do not count
+        for entry in registry.values():
+            entry['refs'] = {p: n for p, n in entry['refs'].items() if self._pid_alive(p)}
+
+        total = sum(entry['size'] for entry in registry.values())
+        candidates = sorted(
+            (entry.get('last_used', 0), key)
+            for key, entry in registry.items() if not entry['refs']
+        )
+        for _, key in candidates:
+            if total <= self.budget_bytes:
+                break
+            total -= registry[key]['size']
+            del registry[key]
+            try:
+                os.remove(self._path_for(key))
+            except FileNotFoundError:
+                pass
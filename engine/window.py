@@ -0,0 +1,90 @@
+# engine/window.py
+"""
+Window operators: running totals, lag/lead and moving averages.
+
+Each operator adds one column to every row, computed from the rows of
+the same partition (rows with equal `partition_by` values) in
+`order_by` order. Rows are streamed once; every partition only keeps
+the state its operator needs (a running total, the last n values, the
+n rows waiting for their lead), so memory does not grow with the table
+beyond the rows returned.
+
+Values that do not cast to float are skipped by cumsum and rolling_mean
+(the row gets the running total, or the mean of the numeric values in
+its window); lag and lead copy values as they are.
+"""
+from collections import deque
+
+OPERATORS = ('cumsum', 'lag', 'lead', 'rolling_mean')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def sort_key(columns):
+    """Sort key ordering rows by `columns` (a name or tuple), nulls last."""
+    if isinstance(columns, tuple):
+        def composite(row):
+            values = [row.get(c) for c in columns]
+            return tuple((v is None, 0 if v is None else v) for v in values)
+        return composite
+
+    def single(row):
+        value = row.get(columns)
+        return (value is None, 0 if value is None else value)
+    return single
+
+
+def apply(rows, op, column, name, partition_key, n=1):
+    """
+    Streams `rows` (already in window order) into a list of copies
+    carrying `name`: the window value of `column` computed by `op`.
+    `partition_key` returns a row's partition; `n` is the lag/lead offset
+    or the window size.
+    """
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown window operator '{op}', expected one of {', '.join(OPERATORS)}")
+    states = {}
+    result = []
+    for row in rows:
+        key = partition_key(row)
+        out = dict(row)
+        result.append(out)
+
+        if op == 'cumsum':
+            total = states.get(key, 0)
+            value = _number(row.get(column))
+            if value is not None:
+                total = states[key] = total + value
+            out[name] = total
+
+        elif op == 'lag':
+            previous = states.get(key)
+            if previous is None:
+                previous = states[key] = deque(maxlen=n)
+            out[name] = previous[0] if len(previous) == n else None
+            previous.append(row.get(column))
+
+        elif op == 'lead':
+            # A row's lead is only known n rows later: the last n rows of
+            # each partition wait for it, already in place in the result
+            out[name] = None
+            waiting = states.get(key)
+            if waiting is None:
+                waiting = states[key] = deque()
+            waiting.append(out)
+            if len(waiting) > n:
+                waiting.popleft()[name] = row.get(column)
+
+        else:
+            window = states.get(key)
+            if window is None:
+                window = states[key] = deque(maxlen=n)
+            window.append(_number(row.get(column)))
+            values = [v for v in window if v is not None]
+            out[name] = sum(values) / len(values) if values else None
+    return result
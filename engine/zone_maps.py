@@ -0,0 +1,313 @@
+# engine/zone_maps.py
+"""
+Block-level zone maps for data skipping.
+
+At ingest the rows of a CSV file are cut into blocks of BLOCK_ROWS
+consecutive rows. For every block the zone map records where it lives
+(its byte range in the CSV and its row range, for scans of the shared
+segment) and, per column, the null count, the min/max and, for int and
+str columns, a small bloom filter of the values.
+
+DataFrame.filter only reads the blocks that the filter's predicates (see
+engine.planner.annotate) do not rule out. For a column whose blocks hold
+non-overlapping, increasing (or decreasing) ranges, range and equality
+predicates find their blocks by binary search instead of checking every
+block.
+
+Zone maps live next to the CSV as `<file>.zones` and, like the column
+statistics, record the file size they were computed for.
+"""
+import base64
+import bisect
+import json
+import os
+import tempfile
+import zlib
+from .column_stats import file_signature, may_match, stats_match_file, _comparable
+
+BLOCK_ROWS = 4096
+# Bloom filters use BLOOM_BITS_PER_VALUE bits per distinct value of the
+# block (rounded up to a power of two) and BLOOM_HASHES probes
+BLOOM_BITS_PER_VALUE = 8
+BLOOM_HASHES = 3
+_BLOOM_KINDS = ('int', 'str')
+_NUMBER_TYPES = {int, float}
+_BITS = [1 << i for i in range(8)]
+
+_cache = {}  # path -> (file signature, zone map file mtime, ZoneMap)
+
+
+def path_for(filepath):
+    """Where the zone map of a CSV file is stored."""
+    return f"{filepath}.zones"
+
+
+def _hashes(value):
+    """Two 32-bit hashes of a value, stable across processes (unlike hash(str))."""
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        return zlib.crc32(data), zlib.crc32(data, 0x9E3779B9) | 1
+    h = hash((value,))  # numbers hash by value: hash((5,)) == hash((5.0,))
+    return h & 0xFFFFFFFF, ((h >> 32) & 0xFFFFFFFF) | 1
+
+
+def _bloom(values):
+    bits = 64
+    while bits < BLOOM_BITS_PER_VALUE * len(values):
+        bits *= 2
+    mask = bits - 1
+    array = bytearray(bits // 8)
+    for value in values:
+        h1, h2 = _hashes(value)
+        for i in range(BLOOM_HASHES):
+            index = (h1 + i * h2) & mask
+            array[index >> 3] |= _BITS[index & 7]
+    return bytes(array)
+
+
+def _bloom_contains(array, value):
+    mask = len(array) * 8 - 1
+    h1, h2 = _hashes(value)
+    for i in range(BLOOM_HASHES):
+        index = (h1 + i * h2) & mask
+        if not array[index >> 3] & _BITS[index & 7]:
+            return False
+    return True
+
+
+def _column_zone(values, kind):
+    present = [v for v in values if v is not None]
+    zone = {'nulls': len(values) - len(present), 'min': None, 'max': None, 'mixed': False}
+    if not present:
+        return zone
+    expected = _NUMBER_TYPES if kind in ('int', 'float') else {str}
+    if set(map(type, present)) <= expected:
+        typed = present
+    else:
+        zone['mixed'] = True
+        typed = [v for v in present if type(v) in expected]
+    if typed:
+        zone['min'], zone['max'] = min(typed), max(typed)
+    if kind in _BLOOM_KINDS:
+        try:
+            distinct = set(present)
+        except TypeError:
+            return zone
+        zone['bloom'] = base64.b64encode(_bloom(distinct)).decode('ascii')
+    return zone
+
+
+class ZoneMapBuilder:
+    """
+    Builds a zone map from (byte offset, row) pairs, see
+    CsvParser.parse_range(offsets=True). Rows appended to a table are
+    numbered from `first_row`.
+    """
+
+    def __init__(self, header, column_types=None, block_rows=None, first_row=0):
+        self.header = header
+        self.column_types = column_types or {}
+        self.block_rows = block_rows or BLOCK_ROWS
+        self.blocks = []
+        self._rows = []
+        self._start = None
+        self._row = first_row
+
+    def track(self, located_rows):
+        """Yields the rows of `located_rows` while recording their blocks."""
+        for offset, row in located_rows:
+            if len(self._rows) >= self.block_rows:
+                self._close_block(offset)
+            if self._start is None:
+                self._start = offset
+            self._rows.append(row)
+            yield row
+
+    def _close_block(self, end):
+        rows = self._rows
+        columns = {}
+        for col in self.header:
+            values = [row.get(col) for row in rows]
+            columns[col] = _column_zone(values, self.column_types.get(col, 'str'))
+        self.blocks.append({
+            'start': self._start, 'end': end,
+            'row': self._row, 'rows': len(rows),
+            'columns': columns,
+        })
+        self._row += len(rows)
+        self._rows = []
+        self._start = None
+
+    def result(self, file_size, mtime_ns=None):
+        if self._rows:
+            self._close_block(file_size)
+        return {'bytes': file_size, 'mtime_ns': mtime_ns, 'block_rows': self.block_rows, 'blocks': self.blocks}
+
+
+def write_zone_map(filepath, zone_map):
+    """Stores a zone map next to its CSV file (atomically)."""
+    path = path_for(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(zone_map, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def extend_zone_map(filepath, zone_map, appended):
+    """
+    Stores `zone_map` followed by the blocks of `appended` (the
+    ZoneMapBuilder result of rows appended to the file) as its zone map.
+    """
+    write_zone_map(filepath, {
+        'bytes': appended['bytes'],
+        'mtime_ns': appended.get('mtime_ns'),
+        'block_rows': zone_map.block_rows,
+        'blocks': zone_map.blocks + appended['blocks'],
+    })
+
+
+def load(filepath):
+    """
+    Returns the ZoneMap of a CSV file, or None if it has none or the file
+    changed since it was built. Loaded maps are cached per process.
+    """
+    path = path_for(filepath)
+    try:
+        signature = file_signature(filepath)
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (signature, mtime):
+        return cached[2]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    zone_map = ZoneMap(data) if stats_match_file(data, signature) else None
+    _cache[path] = (signature, mtime, zone_map)
+    return zone_map
+
+
+def remove(filepath):
+    """Deletes the zone map of a CSV file, if any."""
+    try:
+        os.remove(path_for(filepath))
+    except FileNotFoundError:
+        pass
+    _cache.pop(path_for(filepath), None)
+
+
+class ZoneMap:
+    def __init__(self, data):
+        self.blocks = data['blocks']
+        self.block_rows = data.get('block_rows', BLOCK_ROWS)
+        self._blooms = {}
+        self._order = {}  # column -> ('asc' | 'desc' | None, mins, maxs)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def _sorted(self, column):
+        """Block order of a column: 'asc'/'desc' if block ranges never overlap backwards."""
+        if column in self._order:
+            return self._order[column]
+        zones = [block['columns'].get(column) for block in self.blocks]
+        order = None
+        if zones and all(z and z['min'] is not None and not z['mixed'] for z in zones):
+            mins = [z['min'] for z in zones]
+            maxs = [z['max'] for z in zones]
+            try:
+                if all(mins[i] >= maxs[i - 1] for i in range(1, len(zones))):
+                    order = 'asc'
+                elif all(maxs[i] <= mins[i - 1] for i in range(1, len(zones))):
+                    order = 'desc'
+            except TypeError:
+                order = None
+            self._order[column] = (order, mins, maxs)
+        else:
+            self._order[column] = (None, None, None)
+        return self._order[column]
+
+    def _search(self, column, op, value):
+        """Block index range [lo, hi) that can match, by binary search; None if not applicable."""
+        order, mins, maxs = self._sorted(column)
+        if order is None or op not in ('==', '<', '<=', '>', '>=') \
+                or not _comparable(self.blocks[0]['columns'][column], value):
+            return None
+        n = len(mins)
+        if order == 'desc':
+            # Search the reversed (ascending) block list, then map back
+            mins, maxs = mins[::-1], maxs[::-1]
+        lo, hi = 0, n
+        if op == '==':
+            lo, hi = bisect.bisect_left(maxs, value), bisect.bisect_right(mins, value)
+        elif op == '<':
+            hi = bisect.bisect_left(mins, value)
+        elif op == '<=':
+            hi = bisect.bisect_right(mins, value)
+        elif op == '>':
+            lo = bisect.bisect_right(maxs, value)
+        elif op == '>=':
+            lo = bisect.bisect_left(maxs, value)
+        if order == 'desc':
+            lo, hi = n - hi, n - lo
+        return lo, max(lo, hi)
+
+    def _bloom(self, index, column):
+        key = (index, column)
+        if key not in self._blooms:
+            encoded = self.blocks[index]['columns'][column].get('bloom')
+            self._blooms[key] = base64.b64decode(encoded) if encoded else None
+        return self._blooms[key]
+
+    def _block_may_match(self, index, column, op, value):
+        block = self.blocks[index]
+        zone = block['columns'].get(column)
+        if zone is None:
+            return True
+        if not may_match(zone, block['rows'], op, value):
+            return False
+        if op in ('==', 'in'):
+            bloom = self._bloom(index, column)
+            if bloom is not None:
+                values = value if op == 'in' and isinstance(value, (list, tuple, set)) else [value]
+                try:
+                    return any(_bloom_contains(bloom, v) for v in values)
+                except TypeError:
+                    return True
+        return True
+
+    def matching_blocks(self, predicates):
+        """Indexes of the blocks that may hold rows satisfying every predicate."""
+        lo, hi = 0, len(self.blocks)
+        for column, op, value in predicates:
+            found = self._search(column, op, value)
+            if found is not None:
+                lo, hi = max(lo, found[0]), min(hi, found[1])
+        candidates = range(lo, max(lo, hi))
+        return [i for i in candidates
+                if all(self._block_may_match(i, column, op, value)
+                       for column, op, value in predicates)]
+
+    def partitions(self, indexes, by_rows=False):
+        """
+        Merges block indexes into scan partitions, as engine.parallel uses
+        them: ('bytes', start, end) or, by_rows, ('rows', start, stop).
+        """
+        parts = []
+        for i in indexes:
+            block = self.blocks[i]
+            start, stop = ((block['row'], block['row'] + block['rows']) if by_rows
+                           else (block['start'], block['end']))
+            if parts and parts[-1][2] == start:
+                parts[-1] = (parts[-1][0], parts[-1][1], stop)
+            else:
+                parts.append(('rows' if by_rows else 'bytes', start, stop))
+        return parts
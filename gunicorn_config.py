@@ -1,15 +1,17 @@
 # gunicorn_config.py
 import multiprocessing
+from config import Config
 
 # Bind to all interfaces on port 5000
 bind = "0.0.0.0:5000"
 
 # Number of worker processes. 
 # Formula: (2 x CPUs) + 1. Good standard starting point.
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = Config.GUNICORN_WORKERS or multiprocessing.cpu_count() * 2 + 1
 
-# Threads per worker (good for handling I/O like AI requests)
-threads = 2
+# Threads per worker (good for handling I/O like AI requests).
+# Each worker's database pool is sized to match (Config.DB_POOL_SIZE).
+threads = Config.GUNICORN_THREADS
 
 # Timeout for requests (120s gives the AI time to "think" if needed)
 timeout = 120
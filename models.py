@@ -22,6 +22,8 @@ class Project(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     tables = db.relationship('Table', backref='project', lazy=True, cascade="all, delete-orphan")
+    schema_snapshots = db.relationship('SchemaSnapshot', backref='project', lazy=True,
+                                       cascade="all, delete-orphan")
 
 class Table(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,4 +32,25 @@ class Table(db.Model):
     filepath = db.Column(db.String(500), nullable=False)
     columns_schema = db.Column(db.JSON, nullable=True) 
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
-    row_count = db.Column(db.Integer)
\ No newline at end of file
+    row_count = db.Column(db.Integer)
+    # Per-column statistics computed at upload (see engine/column_stats.py)
+    column_stats = db.Column(db.JSON, nullable=True)
+
+class SchemaSnapshot(db.Model):
+    """A version of a project's schema and relationships (see services/schema_store.py)."""
+    __tablename__ = "schema_snapshot"
+    __table_args__ = (db.UniqueConstraint('project_id', 'version'),)
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    tables = db.Column(db.JSON, nullable=False)
+    relationships = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PlanCacheEntry(db.Model):
+    __tablename__ = "plan_cache_entry"
+    key = db.Column(db.String(64), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
\ No newline at end of file
@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify, session
 from extensions import db
 from models import User
 from services.state_manager import clear_cache_for_user
+from services import schema_store
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -49,6 +50,9 @@ def login():
 
 @auth_bp.route('/api/logout', methods=['POST'])
 def logout():
+    project_id = session.get('active_project_id')
     session.clear()
-    clear_cache_for_user() # Though now stateless, good to clear just in case
+    if project_id:
+        clear_cache_for_user(project_id)
+        schema_store.forget(project_id)
     return jsonify({'success': True})
\ No newline at end of file
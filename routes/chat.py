@@ -1,16 +1,63 @@
 # routes/chat.py
 import json
-import re
-from flask import Blueprint, request, jsonify, session
+import time
+from flask import Blueprint, Response, request, jsonify, session, g, send_file, stream_with_context
 from services.llm_service import get_model
-from services.state_manager import get_dataframe
-from services.chart_builder import build_chart_url
+from config import Config
+from services.state_manager import build_segments, get_dataframe, get_referenced_tables, \
+    get_table_specs, index_relationship_columns
+from services.chart_builder import (build_chart_url, cached_chart, chart_path, is_chart_url, plan_key,
+                                    remember_chart)
+from services import cursors, results, schema_store
 from services.security import secure_eval, SecurityViolation
+from services.plan_cache import plan_cache, schema_fingerprint
+from services.executor import get_executor, QueryTimeout, QueryCancelled
+from services.metrics import metrics
 from services.logger import get_logger
+from engine import profiling
+from engine.planner import explain, annotate, PlanError, format_bytes
+from engine.optimizer import optimize
 
 chat_bp = Blueprint('chat', __name__)
 logger = get_logger(__name__)
 
+
+def _safe_context(referenced):
+    """The names generated code may use: helpers and the referenced tables."""
+    safe_context = {
+        "get_dataframe": get_dataframe,
+        "len": len,
+        "int": int, "float": float, "str": str,
+        "build_chart_url": build_chart_url
+    }
+    for table_name in referenced:
+        safe_context[table_name] = get_dataframe(table_name)
+    return safe_context
+
+
+def _cost_limit_message(plan):
+    """Why a plan is over QUERY_COST_LIMIT_MB, or None if it is within the limit (or unknown)."""
+    if plan is None or plan.cost <= Config.QUERY_COST_LIMIT_MB * 1024 * 1024:
+        return None
+    logger.info(f"Query over cost limit: {plan.cost} bytes")
+    return (f"This query is estimated to scan {format_bytes(plan.bytes_scanned)} "
+            f"and hold {format_bytes(plan.memory)} in memory, "
+            f"above the {Config.QUERY_COST_LIMIT_MB} MB limit.")
+
+
+@chat_bp.after_request
+def add_server_timing(response):
+    """Reports where a chat request spent its time (LLM, engine, serialization)."""
+    timings = g.get('chat_timings')
+    if timings is None:
+        return response
+    if 'serialize_start' in timings:
+        timings['serialize'] = time.perf_counter() - timings.pop('serialize_start')
+    response.headers['Server-Timing'] = ', '.join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+    return response
+
 @chat_bp.route('/api/detect-relationships', methods=['POST'])
 def detect_relationships():
     if 'user_id' not in session:
@@ -20,10 +67,20 @@ def detect_relationships():
     if not model:
         return jsonify({'success': False, 'error': 'AI model not configured'}), 500
         
-    schema = session.get('db_schema', {})
+    schema = schema_store.get_schema()
     if len(schema) < 2:
         return jsonify({'success': False, 'error': 'At least two tables are required.'}), 400
 
+    fingerprint = schema_fingerprint(schema)
+    cached = plan_cache.get('relationships', fingerprint)
+    if cached is not None:
+        relationships = cached.get('relationships', [])
+        if relationships != schema_store.get_relationships():
+            schema_store.set_relationships(session['active_project_id'], relationships)
+        index_relationship_columns(relationships)
+        logger.info(f"Relationships served from plan cache: {len(relationships)}")
+        return jsonify(cached)
+
     prompt_schema = {name: details['types'] for name, details in schema.items()}
     
     prompt = f"""
@@ -45,7 +102,10 @@ def detect_relationships():
             json_str = json_str[:-3]
         
         result = json.loads(json_str.strip())
-        session['db_relationships'] = result.get('relationships', [])
+        relationships = result.get('relationships', [])
+        schema_store.set_relationships(session['active_project_id'], relationships)
+        plan_cache.put('relationships', fingerprint, '', result)
+        index_relationship_columns(relationships)
         
         logger.info(f"Relationships detected: {len(result.get('relationships', []))}")
         return jsonify(result)
@@ -64,8 +124,14 @@ def chat():
 
     data = request.get_json()
     user_query = data.get('query')
-    schema = session.get('db_schema', {})
-    relationships = session.get('db_relationships', [])
+    # debug: attach the operator profile (with peak memory) to the response
+    debug = bool(data.get('debug'))
+    # explain: return the plan instead of running the query
+    explain_only = bool(data.get('explain'))
+    # confirm: run even if the estimated cost is over QUERY_COST_LIMIT_MB
+    confirmed = bool(data.get('confirm'))
+    schema = schema_store.get_schema()
+    relationships = schema_store.get_relationships()
     
     if not schema:
         return jsonify({'type': 'error', 'data': 'No database schema found.'}), 400
@@ -93,9 +159,20 @@ def chat():
     - .filter(lambda row: condition) -> DataFrame
     - .project(list_of_cols) -> list[dict]
     - .join(other_df, left_col, right_col) -> DataFrame
+    - .join(other_df, [left_cols], [right_cols]) -> DataFrame (composite key)
     - .groupby(col_name) -> dict
+    - .groupby(date_col, bucket='month') -> dict (bucket: 'day', 'month' or 'year'; dates are 'YYYY-MM-DD...')
+    - .groupby([col_a, col_b]) -> dict (several columns; bucket applies to the last one)
     - .aggregate(groups, {{col: func}}) -> dict
         - Supported funcs: 'count', 'sum', 'avg', 'min', 'max'
+    - .pivot(index_col, columns_col, values_col, agg='sum', bucket=None) -> list[dict] (a grid: one row per
+      index value, one column per columns_col value; bucket='month' makes months the columns)
+        - Use it for "X by A by B as a grid/table"; do NOT call DataFrame methods on the result.
+    - .cumsum(col, order_by=None, partition_by=None) -> DataFrame (adds '<col>_cumsum', a running total)
+    - .lag(col, n=1, order_by=None, partition_by=None) / .lead(...) -> DataFrame (adds '<col>_lag' / '<col>_lead')
+    - .rolling_mean(col, window_size=3, order_by=None, partition_by=None) -> DataFrame (adds '<col>_rolling_mean')
+        - Window methods compute per partition_by group in order_by order; use them for running balances,
+          previous/next period values and moving averages, NEVER a filter per row.
     - .columns -> list[str] (This is a property, NOT a function)
     - build_chart_url(title, type, data) -> str
         - `data` MUST be the RAW dictionary returned by .aggregate().
@@ -127,60 +204,292 @@ def chat():
     NOW, generate the JSON for: "{user_query}"
     """
 
+    fingerprint = schema_fingerprint(schema, relationships)
+    code_to_run = 'N/A'
+    timings = g.chat_timings = {'llm': 0.0}
+
     try:
-        response = model.generate_content(prompt)
-        
-        # Clean Markdown
-        response_text = response.text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        elif response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        ai_response = json.loads(response_text.strip())
+        ai_response = plan_cache.get('chat', fingerprint, user_query)
+        if ai_response is None:
+            started = time.perf_counter()
+            response = model.generate_content(prompt)
+            timings['llm'] = time.perf_counter() - started
+            metrics.observe('aistora_llm_latency_seconds', timings['llm'])
+
+            # Clean Markdown
+            response_text = response.text.strip()
+            if response_text.startswith("```json"):
+                response_text = response_text[7:]
+            elif response_text.startswith("```"):
+                response_text = response_text[3:]
+            if response_text.endswith("```"):
+                response_text = response_text[:-3]
+
+            ai_response = json.loads(response_text.strip())
+            plan_cache.put('chat', fingerprint, user_query, {
+                'isCode': bool(ai_response.get('isCode')),
+                'content': ai_response['content']
+            })
+        else:
+            logger.info("Plan served from cache")
         
         if not ai_response.get('isCode'):
+            metrics.inc('aistora_chat_responses_total', 'text')
             return jsonify({'type': 'text', 'data': ai_response['content']})
         
         code_to_run = ai_response['content']
         logger.info(f"--- AI-Generated Code ---\n{code_to_run}") # Log the code *before* execution
 
-        # 3. Context
-        safe_context = {
-            "get_dataframe": get_dataframe,
-            "len": len,
-            "int": int, "float": float, "str": str,
-            "build_chart_url": build_chart_url
-        }
-        for table_name in schema.keys():
-            safe_context[table_name] = get_dataframe(table_name)
-        
-        result = secure_eval(code_to_run, safe_context)
+        referenced = get_referenced_tables(code_to_run, schema.keys())
+        table_specs = get_table_specs(referenced)
 
-        # 4. Response Formatting
-        if isinstance(result, str) and result.startswith("https://quickchart.io"):
-            return jsonify({'type': 'chart', 'data': result, 'query': code_to_run})
+        # A chart drawn before by the same code over the same files is
+        # served without running the aggregation again
+        chart_plan = None if explain_only else plan_key(code_to_run, fingerprint, table_specs)
+        chart_url = cached_chart(chart_plan) if chart_plan else None
+        if chart_url:
+            logger.info("Chart served from cache")
+            metrics.inc('aistora_chat_responses_total', 'chart')
+            return jsonify({'type': 'chart', 'data': chart_url, 'query': code_to_run})
+
+        # 3. Optimize (filter pushdown, join order), then plan: EXPLAIN,
+        # or stop queries estimated above the cost limit
+        optimized = optimize(code_to_run, table_specs, relationships)
+        if optimized != code_to_run:
+            logger.info(f"Optimized query: {optimized}")
+        if explain_only or (Config.QUERY_COST_LIMIT_MB and not confirmed):
+            try:
+                plan = explain(optimized, table_specs)
+            except PlanError as pe:
+                if explain_only:
+                    return jsonify({'type': 'error', 'data': str(pe), 'query': code_to_run})
+                plan = None
+
+            if explain_only:
+                return jsonify({'type': 'explain', 'data': plan.format(),
+                                'plan': plan.to_dict(), 'query': code_to_run})
+
+            message = _cost_limit_message(plan)
+            if message:
+                if Config.QUERY_COST_ACTION == 'refuse':
+                    return jsonify({'type': 'error', 'data': message, 'query': code_to_run})
+                return jsonify({'type': 'confirm', 'data': message, 'plan': plan.format(),
+                                'query': code_to_run})
+
+        # 4. Execute: only the tables the expression actually uses are opened.
+        # Filters get their simple predicates so statistics can prune scans.
+        started = time.perf_counter()
+        executable = annotate(optimized)
+        if Config.QUERY_EXECUTOR == 'process':
+            # The executors only map segments that exist (see engine.segments)
+            build_segments(table_specs)
+            query_id = data.get('queryId')
+            if query_id:
+                query_id = f"{session['user_id']}-{query_id}"
+            result, profile = get_executor().run(executable, table_specs, query_id=query_id,
+                                                 track_memory=debug, max_rows=Config.CURSOR_MAX_ROWS)
+        else:
+            safe_context = _safe_context(referenced)
+            with profiling.profile(track_memory=debug) as prof:
+                result = secure_eval(executable, safe_context)
+            profile = prof.to_dict()
+        timings['exec'] = time.perf_counter() - started
+
+        # Everything from here to the response body counts as serialization
+        timings['serialize_start'] = time.perf_counter()
+
+        # 5. Response Formatting
+        table_result = None
+        if is_chart_url(result):
+            if chart_plan:
+                remember_chart(chart_plan, result)
+            payload = {'type': 'chart', 'data': result, 'query': code_to_run}
         elif isinstance(result, list):
-            return jsonify({'type': 'table', 'data': result, 'query': code_to_run})
+            table_result = result
         elif isinstance(result, dict):
-            table_result = []
-            group_key_match = re.search(r".groupby\('([^']+)'\)", code_to_run)
-            g_key = group_key_match.group(1) if group_key_match else "group"
-            for k, v in result.items():
-                row = {g_key: k}
-                row.update(v)
-                table_result.append(row)
-            return jsonify({'type': 'table', 'data': table_result, 'query': code_to_run})
+            table_result = list(results.table_rows(result, code_to_run))
         elif isinstance(result, (int, float)):
-            return jsonify({'type': 'count', 'data': result, 'query': code_to_run})
+            payload = {'type': 'count', 'data': result, 'query': code_to_run}
         else:
-            return jsonify({'type': 'text', 'data': str(result), 'query': code_to_run})
+            payload = {'type': 'text', 'data': str(result), 'query': code_to_run}
+
+        result_rows = 1
+        if table_result is not None:
+            # The first page goes in the response; a cursor serves the rest,
+            # up to CURSOR_MAX_ROWS rows (all of them: /api/export)
+            table_result = results.limit_rows(table_result, Config.CURSOR_MAX_ROWS)
+            result_rows = getattr(table_result, 'total', len(table_result))
+            fmt = data.get('resultFormat') or Config.RESULT_FORMAT
+            fmt = fmt if fmt in results.TABLE_FORMATS else 'rows'
+            page_rows = Config.RESULT_PAGE_ROWS
+            payload = {'type': 'table', 'format': fmt, 'query': code_to_run}
+            payload.update(results.table_payload(table_result[:page_rows], fmt))
+            if result_rows > len(table_result):
+                payload['totalRows'] = result_rows
+            if len(table_result) > page_rows:
+                cursor_id = cursors.create(session['user_id'], table_result[page_rows:], fmt, page_rows)
+                payload['cursor'] = {'id': cursor_id, 'rows': len(table_result), 'page': 1,
+                                     'pages': (len(table_result) + page_rows - 1) // page_rows, 'next': 2}
 
+        metrics.observe('aistora_query_execution_seconds', timings['exec'])
+        metrics.observe('aistora_query_result_rows', result_rows)
+        metrics.inc('aistora_chat_responses_total', payload['type'])
+        logger.info("Query executed", extra={'fields': {
+            'event': 'query_profile',
+            'user_id': session['user_id'],
+            'code': code_to_run,
+            'llm_seconds': timings['llm'],
+            'exec_seconds': timings['exec'],
+            'result_rows': result_rows,
+            'profile': profile,
+        }})
+        if debug:
+            payload['profile'] = profile
+        return Response(results.encode_json(payload), mimetype='application/json')
+
+    except (QueryTimeout, QueryCancelled) as qe:
+        logger.warning(f"Query stopped: {qe}")
+        metrics.inc('aistora_chat_responses_total', 'error')
+        return jsonify({'type': 'error', 'data': str(qe), 'query': code_to_run})
     except SecurityViolation as se:
         logger.warning(f"Security Violation Attempt: {str(se)}")
+        metrics.inc('aistora_chat_responses_total', 'error')
+        plan_cache.invalidate('chat', fingerprint, user_query)
         return jsonify({'type': 'error', 'data': f"Security Block: {str(se)}", 'query': code_to_run})
     except Exception as e:
         logger.error(f"Chat processing error: {e}")
-        return jsonify({'type': 'error', 'data': f"Error: {str(e)}", 'query': 'N/A'})
\ No newline at end of file
+        metrics.inc('aistora_chat_responses_total', 'error')
+        # Never keep serving a plan that fails to execute
+        plan_cache.invalidate('chat', fingerprint, user_query)
+        return jsonify({'type': 'error', 'data': f"Error: {str(e)}", 'query': 'N/A'})
+
+@chat_bp.route('/api/chat/cursor/<cursor_id>/<int:page>', methods=['GET'])
+def cursor_page(cursor_id, page):
+    """A further page of a paged table result (see services.cursors)."""
+    if 'user_id' not in session:
+        return jsonify({'type': 'error', 'data': 'Unauthorized.'}), 401
+    body = cursors.read_page(session['user_id'], cursor_id, page)
+    if body is None:
+        return jsonify({'type': 'error', 'data': 'This result has expired; ask the question again.'}), 404
+    return Response(body, mimetype='application/json')
+
+
+@chat_bp.route('/api/charts/<key>.svg', methods=['GET'])
+def chart_image(key):
+    """A chart rendered by build_chart_url() (see services.chart_builder)."""
+    if 'user_id' not in session:
+        return jsonify({'type': 'error', 'data': 'Unauthorized.'}), 401
+    path = chart_path(key)
+    if path is None:
+        return jsonify({'type': 'error', 'data': 'Unknown chart.'}), 404
+    try:
+        return send_file(path, mimetype='image/svg+xml', max_age=Config.CHART_TTL)
+    except FileNotFoundError:
+        return jsonify({'type': 'error', 'data': 'This chart has expired; ask the question again.'}), 404
+
+
+@chat_bp.route('/api/chat/cancel', methods=['POST'])
+def cancel_chat():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    query_id = (request.get_json() or {}).get('queryId')
+    if not query_id:
+        return jsonify({'success': False, 'error': 'queryId required'}), 400
+
+    get_executor().cancel(f"{session['user_id']}-{query_id}")
+    return jsonify({'success': True})
+
+
+@chat_bp.route('/api/export', methods=['GET'])
+def export_result():
+    """
+    Streams the full result of a question already asked in the chat as a
+    CSV or NDJSON download (?format=csv|ndjson, &gzip=1 to compress).
+    The question's generated query is reused from the plan cache and run
+    without its row limit, in a query executor under EXPORT_TIMEOUT and
+    the cost limit (&confirm=1 as in the chat; &queryId= to cancel it);
+    filters over a table or a join stream from the scan.
+    """
+    if 'user_id' not in session:
+        return jsonify({'type': 'error', 'data': 'Unauthorized.'}), 401
+
+    user_query = request.args.get('query', '')
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    confirmed = request.args.get('confirm', '').lower() in ('1', 'true', 'yes')
+    if fmt not in results.FORMATS:
+        return jsonify({'type': 'error', 'data': f"Unknown format '{fmt}'"}), 400
+
+    schema = schema_store.get_schema()
+    relationships = schema_store.get_relationships()
+    ai_response = plan_cache.get('chat', schema_fingerprint(schema, relationships), user_query)
+    if not ai_response or not ai_response.get('isCode'):
+        return jsonify({'type': 'error',
+                        'data': 'Ask this question in the chat first; the export reuses its query.'}), 404
+
+    code_to_run = ai_response['content']
+    referenced = get_referenced_tables(code_to_run, schema.keys())
+    table_specs = get_table_specs(referenced)
+    try:
+        optimized = optimize(results.without_slice(code_to_run), table_specs, relationships)
+    except SyntaxError as e:
+        return jsonify({'type': 'error', 'data': str(e), 'query': code_to_run}), 400
+
+    # The same cost check as the chat, on the query without its row limit
+    if Config.QUERY_COST_LIMIT_MB and not confirmed:
+        try:
+            plan = explain(optimized, table_specs)
+        except PlanError:
+            plan = None
+        message = _cost_limit_message(plan)
+        if message:
+            kind = 'error' if Config.QUERY_COST_ACTION == 'refuse' else 'confirm'
+            return jsonify({'type': kind, 'data': message, 'query': code_to_run}), 403
+
+    executable = annotate(optimized)
+    try:
+        if Config.QUERY_EXECUTOR == 'process':
+            build_segments(table_specs)
+            query_id = request.args.get('queryId')
+            if query_id:
+                query_id = f"{session['user_id']}-{query_id}"
+            chunks = get_executor().stream(executable, table_specs, fmt, compress,
+                                           query_id=query_id, timeout=Config.EXPORT_TIMEOUT)
+        else:
+            chunks = iter(results.export_chunks(executable, _safe_context(referenced), fmt, compress))
+        # Errors before the first byte still get a proper response
+        first = next(chunks, b'')
+    except (SecurityViolation, results.NotExportable) as e:
+        return jsonify({'type': 'error', 'data': str(e), 'query': code_to_run}), 400
+    except (QueryTimeout, QueryCancelled) as e:
+        return jsonify({'type': 'error', 'data': str(e), 'query': code_to_run}), 503
+    except Exception as e:
+        logger.error(f"Export failed: {e}")
+        return jsonify({'type': 'error', 'data': f"Error: {str(e)}", 'query': code_to_run}), 500
+
+    filename = f"export.{fmt}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else results.FORMATS[fmt]
+    metrics.inc('aistora_exports_total', fmt)
+    logger.info(f"Exporting query as {filename}: {code_to_run}")
+    return Response(stream_with_context(_export_body(first, chunks)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def _export_body(first, chunks):
+    """
+    The response body of an export. A failure mid-download is logged, then
+    aborts the response; an abandoned download closes the chunk generator,
+    which stops its executor.
+    """
+    try:
+        yield first
+        yield from chunks
+    except Exception as e:
+        logger.error(f"Export failed after it started: {e}")
+        raise
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
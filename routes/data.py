@@ -1,9 +1,14 @@
 # routes/data.py
 import os
+import tempfile
 from flask import Blueprint, request, jsonify, session, current_app
 from extensions import db
 from models import Table, Project
 from engine.dataframe import DataFrame
+from engine import indexes, rollups, partitions
+from config import Config
+from services.state_manager import build_segments, clear_cache_for_user
+from services import schema_store
 
 data_bp = Blueprint('data', __name__)
 
@@ -20,40 +25,117 @@ def upload_files():
         return jsonify({'success': False, 'error': 'No files part'}), 400
 
     files = request.files.getlist('files')
-    schema_cache = session.get('db_schema', {})
+    # mode=append adds the rows of each file to the existing table of the
+    # same name (or the one named by `table`) instead of replacing it
+    append = request.form.get('mode') == 'append'
+    # partition_by=<column> stores new tables clustered by partition:
+    # partition=month (of a date column) or partition=hash (partition_buckets)
+    partition_by = request.form.get('partition_by')
+    partition_scheme = request.form.get('partition', 'month')
+    try:
+        partition_buckets = int(request.form.get('partition_buckets', partitions.DEFAULT_BUCKETS))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'partition_buckets must be a number'}), 400
+    if partition_by and (partition_scheme not in partitions.SCHEMES or partition_buckets < 1):
+        return jsonify({'success': False, 'error': 'Invalid partitioning'}), 400
 
+    changed = False
     for file in files:
+        if append:
+            table_name = request.form.get('table') or os.path.splitext(file.filename)[0]
+            table = Table.query.filter_by(project_id=active_project_id, name=table_name) \
+                .order_by(Table.id.desc()).first()
+            if not table:
+                return _upload_failed(active_project_id, changed, f"Table '{table_name}' not found", 404)
+            try:
+                _append_upload(file, table)
+            except ValueError as e:
+                return _upload_failed(active_project_id, changed, str(e), 400)
+            except Exception as e:
+                db.session.rollback()
+                return _upload_failed(active_project_id, changed, str(e), 500)
+            clear_cache_for_user(active_project_id, table_name)
+            build_segments({table_name: {'filepath': table.filepath, 'types': table.columns_schema}})
+            changed = True
+            continue
+
         try:
             filename = file.filename
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
+            if partition_by:
+                partitions.partition_file(filepath, partition_by, partition_scheme, partition_buckets)
+            else:
+                partitions.remove(filepath)
             
             df = DataFrame(source=filepath)
             column_types = df.get_column_types()
-            row_count = len(df)
+            # One pass: row count, the statistics the planner and engine use,
+            # the block zone map filters use to skip reading the file and
+            # the rollups that answer common aggregates without a scan
+            column_stats = df.compute_stats(
+                zone_map=True,
+                rollups_to_build=rollups.choose(df.header, column_types, Config.ROLLUPS),
+            )
+            row_count = column_stats['row_count']
+            # A re-upload replaces the file: rebuild its indexes, starting
+            # with the columns that look like keys
+            indexes.remove_all(filepath)
+            indexes.create_indexes(df.parser, indexes.key_columns(column_stats, column_types))
             
             table_name = os.path.splitext(filename)[0]
             
-            new_table = Table(
-                name=table_name,
-                filename=filename,
-                filepath=filepath,
-                columns_schema=column_types,
-                row_count=row_count,
-                project_id=active_project_id
-            )
-            db.session.add(new_table)
+            # Re-uploading a table replaces its file and metadata in place
+            table = Table.query.filter_by(project_id=active_project_id, name=table_name) \
+                .order_by(Table.id.desc()).first()
+            if table is None:
+                table = Table(name=table_name, project_id=active_project_id)
+                db.session.add(table)
+            table.filename = filename
+            table.filepath = filepath
+            table.columns_schema = column_types
+            table.row_count = row_count
+            table.column_stats = column_stats
             db.session.commit()
             
-            schema_cache[table_name] = {
-                'id': new_table.id,
-                'filename': filename,
-                'types': column_types,
-                'row_count': row_count
-            }
+            clear_cache_for_user(active_project_id, table_name)
+            # The columnar copy the queries read is built in the background
+            build_segments({table_name: {'filepath': filepath, 'types': column_types}})
+            changed = True
 
         except Exception as e:
-            return jsonify({'success': False, 'error': str(e)}), 500
+            db.session.rollback()
+            return _upload_failed(active_project_id, changed, str(e), 500)
+
+    # One new schema version for the whole upload
+    snapshot = schema_store.refresh(active_project_id)
+    return jsonify({'success': True, 'schema': snapshot['tables'], 'version': snapshot['version']})
+
+
+def _upload_failed(project_id, changed, error, status):
+    """Error response for an upload; files stored before the failure still get a schema version."""
+    if changed:
+        schema_store.refresh(project_id)
+    return jsonify({'success': False, 'error': error}), status
+
 
-    session['db_schema'] = schema_cache
-    return jsonify({'success': True, 'schema': schema_cache})
\ No newline at end of file
+def _append_upload(file, table):
+    """
+    Appends an uploaded export to a table's file; statistics, zone map,
+    indexes and rollups are extended from the new rows only.
+    """
+    fd, upload_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], suffix='.csv')
+    os.close(fd)
+    try:
+        file.save(upload_path)
+        df = DataFrame(source=table.filepath, column_types=table.columns_schema,
+                       stats=table.column_stats)
+        column_stats = df.append_csv(
+            upload_path,
+            rollups_to_build=rollups.choose(df.header, df.column_types, Config.ROLLUPS),
+        )
+    finally:
+        os.remove(upload_path)
+    table.row_count = column_stats['row_count']
+    table.column_stats = column_stats
+    db.session.commit()
\ No newline at end of file
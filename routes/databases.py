@@ -2,6 +2,8 @@
 from flask import Blueprint, request, jsonify, session
 from extensions import db
 from models import Project, Table
+from services.state_manager import clear_cache_for_user
+from services import catalog, schema_store
 
 databases_bp = Blueprint('databases', __name__)
 
@@ -10,10 +12,9 @@ def get_databases():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    projects = Project.query.filter_by(user_id=session['user_id']).all()
     return jsonify({
         'success': True, 
-        'databases': [{'id': p.id, 'name': p.name, 'table_count': len(p.tables)} for p in projects]
+        'databases': catalog.projects(session['user_id'])
     })
 
 @databases_bp.route('/api/databases', methods=['POST'])
@@ -59,6 +60,8 @@ def delete_database(id):
     # The `cascade` in models.py will auto-delete all tables
     db.session.delete(project)
     db.session.commit()
+    clear_cache_for_user(id)
+    schema_store.forget(id)
     
     return jsonify({'success': True})
 
@@ -76,15 +79,40 @@ def select_database():
         
     session['active_project_id'] = project.id
     
-    # Load schema for the frontend
-    schema = {}
-    for table in project.tables:
-        schema[table.name] = {
-            'id': table.id,
-            'filename': table.filename,
-            'types': table.columns_schema,
-            'row_count': table.row_count
-        }
-    
-    session['db_schema'] = schema # For chat/upload routes
-    return jsonify({'success': True, 'schema': schema, 'name': project.name})
\ No newline at end of file
+    # The schema stays on the server (see services/schema_store.py)
+    snapshot = schema_store.current(project.id)
+    return jsonify({'success': True, 'schema': snapshot['tables'], 'name': project.name,
+                    'version': snapshot['version']})
+
+@databases_bp.route('/api/schema', methods=['GET'])
+def get_schema():
+    """The active database's current schema and relationships."""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    project_id = session.get('active_project_id')
+    if not project_id:
+        return jsonify({'success': False, 'error': 'No database selected'}), 400
+
+    snapshot = schema_store.current(project_id)
+    return jsonify({'success': True, 'schema': snapshot['tables'],
+                    'relationships': snapshot['relationships'], 'version': snapshot['version']})
+
+@databases_bp.route('/api/databases/<int:id>/schema', methods=['GET'])
+def get_schema_versions(id):
+    """The kept schema versions of a database, or one of them (?version=n)."""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    project = Project.query.filter_by(id=id, user_id=session['user_id']).first()
+    if not project:
+        return jsonify({'success': False, 'error': 'Database not found'}), 404
+
+    version = request.args.get('version', type=int)
+    if version is None:
+        return jsonify({'success': True, 'versions': schema_store.versions(id)})
+    snapshot = schema_store.snapshot(id, version)
+    if snapshot is None:
+        return jsonify({'success': False, 'error': f'Version {version} is not kept'}), 404
+    return jsonify({'success': True, 'schema': snapshot['tables'],
+                    'relationships': snapshot['relationships'], 'version': snapshot['version']})
\ No newline at end of file
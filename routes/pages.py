@@ -1,5 +1,6 @@
 # routes/pages.py
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, Response
+from services.metrics import metrics
 
 pages_bp = Blueprint('pages', __name__)
 
@@ -9,4 +10,8 @@ def index():
 
 @pages_bp.route('/app')
 def app_page():
-    return render_template('app.html')
\ No newline at end of file
+    return render_template('app.html')
+
+@pages_bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
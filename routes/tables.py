@@ -3,18 +3,16 @@ import os
 from flask import Blueprint, request, jsonify, session
 from extensions import db
 from models import Table, Project
+from services.state_manager import clear_cache_for_user
+from services import catalog, schema_store
+from engine import zone_maps, indexes, rollups, partitions
+from engine.parser import CsvParser
 
 tables_bp = Blueprint('tables', __name__)
 
 def get_table_if_owner(table_id, user_id):
     """Security check: Ensures the user owns the table."""
-    table = Table.query.get(table_id)
-    if not table:
-        return None
-    project = Project.query.get(table.project_id)
-    if project.user_id != user_id:
-        return None
-    return table
+    return catalog.table_if_owner(table_id, user_id)
 
 @tables_bp.route('/api/tables/<int:id>', methods=['PUT'])
 def rename_table(id):
@@ -36,11 +34,38 @@ def rename_table(id):
     if exists:
         return jsonify({'success': False, 'error': 'A table with this name already exists'}), 409
     
+    old_name = table.name
     table.name = new_name
     db.session.commit()
+    clear_cache_for_user(table.project_id, old_name)
+    schema_store.refresh(table.project_id)
     
     return jsonify({'success': True, 'message': 'Table renamed'})
 
+@tables_bp.route('/api/tables/<int:id>/indexes', methods=['POST'])
+def create_table_index(id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    table = get_table_if_owner(id, user_id)
+    if not table:
+        return jsonify({'success': False, 'error': 'Table not found'}), 404
+
+    data = request.get_json() or {}
+    column = data.get('column')
+    if column not in (table.columns_schema or {}):
+        return jsonify({'success': False, 'error': 'Unknown column'}), 400
+    if table.columns_schema[column] not in indexes.INDEXED_TYPES:
+        return jsonify({'success': False, 'error': 'Only int and str columns can be indexed'}), 400
+
+    try:
+        parser = CsvParser(table.filepath, column_types=table.columns_schema)
+        index = indexes.create_index(parser, column)
+        return jsonify({'success': True, 'column': column, 'keys': len(index.keys) if index else 0})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @tables_bp.route('/api/tables/<int:id>', methods=['DELETE'])
 def delete_table(id):
     user_id = session.get('user_id')
@@ -55,10 +80,17 @@ def delete_table(id):
         # 1. Delete the physical file
         if os.path.exists(table.filepath):
             os.remove(table.filepath)
+        zone_maps.remove(table.filepath)
+        indexes.remove_all(table.filepath)
+        rollups.remove(table.filepath)
+        partitions.remove(table.filepath)
         
         # 2. Delete the DB record
+        project_id, table_name = table.project_id, table.name
         db.session.delete(table)
         db.session.commit()
+        clear_cache_for_user(project_id, table_name)
+        schema_store.refresh(project_id)
         
         return jsonify({'success': True, 'message': 'Table deleted'})
     except Exception as e:
@@ -0,0 +1,89 @@
+# services/catalog.py
+"""
+Metadata catalog: the project and table lookups the routes and the
+query path need, each answered with a single query.
+
+- projects(): every project of a user with its table count (one
+  grouped outer join instead of loading each project's tables);
+- table_if_owner(): a table, only if the user owns its project (one
+  join instead of two lookups);
+- table_meta(): the file, types, row count and statistics of every table
+  of a project, loaded in one query and cached per worker.
+
+table_meta() is cached by schema version (see services/schema_store.py):
+every change to a project's tables saves a new version, and the version
+is checked once per request, so a worker never serves metadata older
+than the schema the request sees, and never reloads an unchanged one.
+Like the schema cache, it keeps the SCHEMA_CACHE_MAX_PROJECTS most
+recently used projects.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from config import Config
+from extensions import db
+from models import Project, Table
+from services import schema_store
+
+# project_id -> (schema version, {table_name: metadata})
+_table_meta = OrderedDict()
+_lock = threading.Lock()
+
+
+def projects(user_id):
+    """[{'id', 'name', 'table_count'}] for the user's projects."""
+    rows = db.session.query(Project.id, Project.name, func.count(Table.id)) \
+        .outerjoin(Table, Table.project_id == Project.id) \
+        .filter(Project.user_id == user_id) \
+        .group_by(Project.id, Project.name) \
+        .order_by(Project.id) \
+        .all()
+    return [{'id': id, 'name': name, 'table_count': count} for id, name, count in rows]
+
+
+def table_if_owner(table_id, user_id):
+    """The table, or None if it does not exist or the user does not own its project."""
+    return Table.query.join(Project, Table.project_id == Project.id) \
+        .filter(Table.id == table_id, Project.user_id == user_id) \
+        .first()
+
+
+def table_meta(project_id):
+    """
+    Returns {table_name: {'filepath', 'types', 'row_count', 'stats'}} for
+    a project, current as of the project's schema version.
+    """
+    version = schema_store.current(project_id)['version']
+    with _lock:
+        cached = _table_meta.get(project_id)
+        if cached and cached[0] == version:
+            _table_meta.move_to_end(project_id)
+            return cached[1]
+
+    meta = {}
+    # Projects may still hold duplicate names from older uploads: the newest wins
+    for table in Table.query.filter_by(project_id=project_id).order_by(Table.id).all():
+        meta[table.name] = {
+            'filepath': table.filepath,
+            'types': table.columns_schema,
+            'row_count': table.row_count,
+            'stats': table.column_stats,
+        }
+
+    with _lock:
+        _table_meta[project_id] = (version, meta)
+        _table_meta.move_to_end(project_id)
+        while len(_table_meta) > Config.SCHEMA_CACHE_MAX_PROJECTS:
+            _table_meta.popitem(last=False)
+    return meta
+
+
+def forget(project_id=None):
+    """Drops this worker's cached metadata of one project, or of all of them."""
+    with _lock:
+        if project_id is None:
+            _table_meta.clear()
+        else:
+            _table_meta.pop(project_id, None)
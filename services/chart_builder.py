@@ -1,43 +1,382 @@
 # services/chart_builder.py
+"""
+Charts of aggregate() results.
+
+build_chart_url() keeps the name generated code has always used, but by
+default renders the chart locally as an SVG file and returns its
+/api/charts URL (CHART_BACKEND = "local"); "quickchart" still builds a
+QuickChart URL. Either way large series are downsampled first:
+- line charts keep CHART_MAX_POINTS points, chosen with LTTB
+  (Largest-Triangle-Three-Buckets), which preserves the visual shape;
+- bar and pie charts keep the top CHART_MAX_CATEGORIES - 1 groups and
+  sum the rest into one 'Other' bar or slice (pie charts keep at most
+  one slice per palette color).
+
+Rendered charts are cached in CHART_DIR under a hash of the chart's
+title, type and data, so the same chart is never rendered twice. The
+chat route also records which chart a query drew under plan_key() (the
+code, the schema fingerprint and the state of the files it reads), so
+asking the same question again serves the file without running the
+aggregation. Groups without a value are left out of a chart, not drawn
+as 0, and the dataset label says how many.
+"""
+import ast
+import hashlib
 import json
+import math
+import os
+import re
+import tempfile
+import time
 import urllib.parse
+from html import escape
+
+from config import Config
+
+LOCAL_PREFIX = '/api/charts/'
+QUICKCHART_PREFIX = 'https://quickchart.io/chart'
+LINE_TYPES = ('line', 'area')
+PIE_TYPES = ('pie', 'doughnut')
+
+WIDTH, HEIGHT = 640, 360
+_MARGIN = {'top': 40, 'right': 20, 'bottom': 70, 'left': 60}
+_COLORS = ('#36a2eb', '#ff6384', '#ffcd56', '#4bc0c0', '#9966ff', '#ff9f40',
+           '#c9cbcf', '#2e7d32', '#8d6e63', '#e91e63')
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_chart_url(value):
+    """True if a query result is a chart built by build_chart_url()."""
+    return isinstance(value, str) and (value.startswith(LOCAL_PREFIX) or value.startswith(QUICKCHART_PREFIX))
+
+
+# ---------- Downsampling ----------
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` of the (x, y)
+    points, always keeping the first and last, such that the line through
+    them keeps the shape of the full series.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        # Average of the next bucket, the third corner of the triangles
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / count
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / count
+
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def top_n(labels, values, n):
+    """The n - 1 largest groups (in their original order) and an 'Other' group summing the rest."""
+    if len(labels) <= n:
+        return labels, values
+    ranked = sorted(range(len(values)), key=lambda i: values[i], reverse=True)
+    kept = sorted(ranked[:n - 1])
+    rest = ranked[n - 1:]
+    return ([labels[i] for i in kept] + [f"Other ({len(rest)})"],
+            [values[i] for i in kept] + [sum(values[i] for i in rest)])
+
+
+def downsample(chart_type, labels, values):
+    """Reduces a series to what the chart can show, see the module docstring."""
+    if chart_type in LINE_TYPES:
+        if len(labels) <= Config.CHART_MAX_POINTS:
+            return labels, values
+        picked = lttb([(i, v) for i, v in enumerate(values)], Config.CHART_MAX_POINTS)
+        return [labels[i] for i, _ in picked], [v for _, v in picked]
+    limit = Config.CHART_MAX_CATEGORIES
+    if chart_type in PIE_TYPES:
+        limit = min(limit, len(_COLORS))  # one color per slice
+    return top_n(labels, values, limit)
+
+
+# ---------- SVG rendering ----------
+
+def _number(value):
+    """Short axis label for a number."""
+    magnitude = abs(value)
+    for limit, suffix in ((1e9, 'B'), (1e6, 'M'), (1e3, 'k')):
+        if magnitude >= limit:
+            return f"{value / limit:.3g}{suffix}"
+    return f"{value:.3g}"
+
+
+def _text(x, y, text, size=11, anchor='middle', extra=''):
+    return (f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}" '
+            f'font-family="sans-serif" fill="#334155"{extra}>{escape(str(text))}</text>')
+
+
+def render_svg(title, chart_type, labels, values, dataset_label):
+    """Draws a bar, line or pie chart as an SVG document."""
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+             f'viewBox="0 0 {WIDTH} {HEIGHT}">',
+             f'<rect width="{WIDTH}" height="{HEIGHT}" fill="#ffffff"/>',
+             _text(WIDTH / 2, 22, title, size=14)]
+    if chart_type in PIE_TYPES:
+        parts.extend(_pie(chart_type, labels, values))
+    else:
+        parts.extend(_axes_chart(chart_type, labels, values, dataset_label))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _axes_chart(chart_type, labels, values, dataset_label):
+    left, top = _MARGIN['left'], _MARGIN['top']
+    width = WIDTH - _MARGIN['left'] - _MARGIN['right']
+    height = HEIGHT - _MARGIN['top'] - _MARGIN['bottom']
+    low, high = min(min(values), 0), max(max(values), 0)
+    if high == low:
+        high = low + 1
+
+    def y_of(value):
+        return top + height - (value - low) / (high - low) * height
+
+    parts = []
+    for i in range(5):  # grid lines and value labels
+        value = low + (high - low) * i / 4
+        y = y_of(value)
+        parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{left + width}" y2="{y:.1f}" stroke="#e2e8f0"/>')
+        parts.append(_text(left - 6, y + 4, _number(value), size=10, anchor='end'))
+    zero = y_of(0)
+    parts.append(f'<line x1="{left}" y1="{zero:.1f}" x2="{left + width}" y2="{zero:.1f}" stroke="#94a3b8"/>')
+
+    n = len(values)
+    step = width / n
+    if chart_type in LINE_TYPES:
+        xs = [left + step * (i + 0.5) for i in range(n)]
+        points = ' '.join(f"{x:.1f},{y_of(v):.1f}" for x, v in zip(xs, values))
+        if chart_type == 'area':
+            parts.append(f'<polygon points="{xs[0]:.1f},{zero:.1f} {points} {xs[-1]:.1f},{zero:.1f}" '
+                         f'fill="{_COLORS[0]}" fill-opacity="0.3"/>')
+        parts.append(f'<polyline points="{points}" fill="none" stroke="{_COLORS[0]}" stroke-width="2"/>')
+    else:
+        bar = max(step * 0.8, 1)
+        for i, value in enumerate(values):
+            x = left + step * i + (step - bar) / 2
+            y = min(y_of(value), zero)
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar:.1f}" '
+                         f'height="{abs(zero - y_of(value)):.1f}" fill="{_COLORS[0]}" fill-opacity="0.8">'
+                         f'<title>{escape(str(labels[i]))}: {value:g}</title></rect>')
+
+    # At most ~20 category labels, rotated so long ones fit
+    every = max(1, math.ceil(n / 20))
+    for i in range(0, n, every):
+        x = left + step * (i + 0.5)
+        y = top + height + 12
+        label = str(labels[i])
+        label = label if len(label) <= 14 else label[:13] + '…'
+        parts.append(_text(x, y, label, size=10, anchor='end', extra=f' transform="rotate(-40 {x:.1f} {y:.1f})"'))
+    parts.append(_text(left + width, HEIGHT - 8, dataset_label, size=10, anchor='end'))
+    return parts
+
+
+def _pie(chart_type, labels, values):
+    cx, cy, radius = WIDTH * 0.38, HEIGHT / 2 + 12, HEIGHT / 2 - 50
+    total = sum(v for v in values if v > 0) or 1
+    parts = []
+    angle = -math.pi / 2
+    for i, (label, value) in enumerate(zip(labels, values)):
+        if value <= 0:
+            continue
+        sweep = value / total * 2 * math.pi
+        color = _COLORS[i % len(_COLORS)]
+        tip = f'<title>{escape(str(label))}: {value:g}</title>'
+        if sweep >= 2 * math.pi - 1e-9:
+            parts.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{radius:.1f}" fill="{color}">{tip}</circle>')
+        else:
+            x1, y1 = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(angle + sweep), cy + radius * math.sin(angle + sweep)
+            large = 1 if sweep > math.pi else 0
+            parts.append(f'<path d="M{cx:.1f},{cy:.1f} L{x1:.1f},{y1:.1f} A{radius:.1f},{radius:.1f} 0 {large} 1 '
+                         f'{x2:.1f},{y2:.1f} Z" fill="{color}" stroke="#ffffff">{tip}</path>')
+        angle += sweep
+    if chart_type == 'doughnut':
+        parts.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{radius * 0.5:.1f}" fill="#ffffff"/>')
+    for i, label in enumerate(labels):  # legend
+        y = 50 + i * 15
+        parts.append(f'<rect x="{WIDTH * 0.72:.1f}" y="{y - 9}" width="10" height="10" '
+                     f'fill="{_COLORS[i % len(_COLORS)]}"/>')
+        parts.append(_text(WIDTH * 0.72 + 16, y, label, size=10, anchor='start'))
+    return parts
+
+
+# ---------- Cache ----------
+
+def _is_chart_call(code):
+    try:
+        node = ast.parse(code.strip(), mode='eval').body
+    except SyntaxError:
+        return False
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'build_chart_url'
+
+
+def plan_key(code, fingerprint, table_specs):
+    """
+    Key of the chart a query draws: a hash of its code, the schema
+    fingerprint and the files (and row counts) of the tables it reads.
+    None if the query is not a build_chart_url() call or charts are not
+    rendered locally.
+    """
+    if Config.CHART_BACKEND == 'quickchart' or not _is_chart_call(code):
+        return None
+    files = []
+    for name in sorted(table_specs):
+        spec = table_specs[name]
+        try:
+            stat = os.stat(spec['filepath'])
+        except OSError:
+            return None
+        files.append([name, spec['filepath'], stat.st_mtime_ns, stat.st_size, spec.get('row_count')])
+    raw = json.dumps([code, fingerprint, files, Config.CHART_MAX_POINTS, Config.CHART_MAX_CATEGORIES],
+                     default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _plan_path(plan):
+    return os.path.join(Config.CHART_DIR, f"plan-{plan}")
+
+
+def cached_chart(plan):
+    """The URL of the chart remember_chart() recorded for a plan key, if it is still stored."""
+    try:
+        with open(_plan_path(plan), encoding='utf-8') as f:
+            key = f.read().strip()
+        path = chart_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        os.utime(path)  # both still in use: keep them past the next sweep
+        os.utime(_plan_path(plan))
+    except OSError:
+        return None
+    return f"{LOCAL_PREFIX}{key}.svg"
+
+
+def remember_chart(plan, url):
+    """Records that the query with this plan key drew the chart at `url`."""
+    if not (isinstance(url, str) and url.startswith(LOCAL_PREFIX)):
+        return
+    os.makedirs(Config.CHART_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=Config.CHART_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(url[len(LOCAL_PREFIX):-len('.svg')])
+    os.replace(tmp_path, _plan_path(plan))
+
+def chart_path(key):
+    """Where the rendered chart with this key is stored, or None for a malformed key."""
+    if not _KEY_RE.match(key or ''):
+        return None
+    return os.path.join(Config.CHART_DIR, f"{key}.svg")
+
+
+def _store(key, svg):
+    os.makedirs(Config.CHART_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=Config.CHART_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(svg)
+    os.replace(tmp_path, chart_path(key))
+    # Charts not asked for again within CHART_TTL are dropped
+    cutoff = time.time() - Config.CHART_TTL
+    for entry in os.listdir(Config.CHART_DIR):
+        path = os.path.join(Config.CHART_DIR, entry)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
+
 
 def build_chart_url(title, chart_type, data):
     """
-    Takes aggregation data and builds a QuickChart URL.
+    Takes aggregation data and returns the URL of its chart (see the
+    module docstring).
     """
     if not data:
         return None
-    
+
     try:
-        labels = list(data.keys())
+        # Composite group keys (tuples) become 'a / b' labels
+        labels = [' / '.join(map(str, key)) if isinstance(key, tuple) else key for key in data.keys()]
         # Get the first aggregation key
         first_data_row = list(data.values())[0]
         data_key = list(first_data_row.keys())[0]
         dataset_label = data_key
-        
-        # Get the data
-        chart_data = [float(row[data_key]) for row in data.values()]
-        
-        chart_config = {
-            'type': chart_type,
-            'data': {
-                'labels': labels,
-                'datasets': [{
-                    'label': dataset_label,
-                    'data': chart_data,
-                    'backgroundColor': 'rgba(54, 162, 235, 0.6)',
-                    'borderColor': 'rgba(54, 162, 235, 1)'
-                }]
-            },
-            'options': {
-                'title': { 'display': True, 'text': title }
-            }
-        }
 
-        config_json = json.dumps(chart_config)
-        encoded_config = urllib.parse.quote(config_json)
-        return f"https://quickchart.io/chart?c={encoded_config}"
+        # Get the data; groups without a value are left out, not drawn as 0
+        values = [row[data_key] for row in data.values()]
+        empty = sum(1 for value in values if value is None)
+        if empty:
+            labels = [label for label, value in zip(labels, values) if value is not None]
+            values = [value for value in values if value is not None]
+            dataset_label = f"{data_key} ({empty} without a value left out)"
+            if not values:
+                return None
+        chart_data = [float(value) for value in values]
+        if chart_type in LINE_TYPES:
+            # Line charts read left to right: order by label (dates, numbers) when possible
+            try:
+                order = sorted(range(len(labels)), key=lambda i: labels[i])
+                labels = [labels[i] for i in order]
+                chart_data = [chart_data[i] for i in order]
+            except TypeError:
+                pass
+
+        if Config.CHART_BACKEND == 'quickchart':
+            return _quickchart_url(title, chart_type, *downsample(chart_type, labels, chart_data), dataset_label)
+
+        key = hashlib.sha256(json.dumps([title, chart_type, dataset_label, labels, chart_data,
+                                         Config.CHART_MAX_POINTS, Config.CHART_MAX_CATEGORIES],
+                                        default=str).encode('utf-8')).hexdigest()
+        path = chart_path(key)
+        if os.path.exists(path):
+            os.utime(path)  # still in use: keep it past the next sweep
+        else:
+            labels, chart_data = downsample(chart_type, labels, chart_data)
+            _store(key, render_svg(title, chart_type, labels, chart_data, dataset_label))
+        return f"{LOCAL_PREFIX}{key}.svg"
     except Exception as e:
         print(f"Error building chart: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def _quickchart_url(title, chart_type, labels, chart_data, dataset_label):
+    chart_config = {
+        'type': chart_type,
+        'data': {
+            'labels': labels,
+            'datasets': [{
+                'label': dataset_label,
+                'data': chart_data,
+                'backgroundColor': 'rgba(54, 162, 235, 0.6)',
+                'borderColor': 'rgba(54, 162, 235, 1)'
+            }]
+        },
+        'options': {
+            'title': { 'display': True, 'text': title }
+        }
+    }
+
+    config_json = json.dumps(chart_config)
+    encoded_config = urllib.parse.quote(config_json)
+    return f"{QUICKCHART_PREFIX}?c={encoded_config}"
@@ -0,0 +1,122 @@
+# services/cursors.py
+"""
+Server-side cursors over large chat results.
+
+A table result longer than one page is answered with its first page and
+a cursor; the other pages are encoded once and written to
+`<CURSOR_DIR>/<user id>-<token>/<page>.json`, so any gunicorn worker can
+serve them as they are, without re-running the query. The pages are
+written by a background thread after the first page has gone out; a
+page asked for before it is written is waited for (CURSOR_WAIT).
+`cursor.json` records the page range, so a page that will never exist
+is refused at once. Cursors expire after CURSOR_TTL seconds; expired
+ones are removed whenever a new cursor is created.
+"""
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+
+from config import Config
+from services import results
+from services.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _directory(user_id, cursor_id):
+    return os.path.join(Config.CURSOR_DIR, f"{int(user_id)}-{cursor_id}")
+
+
+def _sweep():
+    """Removes the cursors older than CURSOR_TTL."""
+    try:
+        entries = os.listdir(Config.CURSOR_DIR)
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - Config.CURSOR_TTL
+    for entry in entries:
+        path = os.path.join(Config.CURSOR_DIR, entry)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def _write(directory, name, body):
+    # Written under a temporary name, so a file is never read half-written
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def _write_pages(directory, rows, fmt, page_rows, first_page, pages):
+    try:
+        for number, start in enumerate(range(0, len(rows), page_rows), start=first_page + 1):
+            payload = results.table_payload(rows[start:start + page_rows], fmt)
+            payload.update({'type': 'page', 'page': number, 'pages': pages,
+                            'next': number + 1 if number < pages else None})
+            _write(directory, f"{number}.json", results.encode_json(payload))
+    except Exception as e:
+        logger.error(f"Cursor {os.path.basename(directory)}: writing pages failed: {e}")
+        try:
+            _write(directory, 'failed', b'')
+        except OSError:
+            pass
+        return
+    logger.info(f"Cursor {os.path.basename(directory)}: {len(rows)} rows in {pages - first_page} more pages")
+
+
+def create(user_id, rows, fmt, page_rows, first_page=1):
+    """
+    Starts a cursor over `rows` (the result after its first page) and
+    returns its id. The pages, of `page_rows` rows numbered from
+    first_page + 1, are encoded and written in the background.
+    """
+    _sweep()
+    cursor_id = secrets.token_hex(16)
+    directory = _directory(user_id, cursor_id)
+    os.makedirs(directory)
+    pages = first_page + (len(rows) + page_rows - 1) // page_rows
+    _write(directory, 'cursor.json', json.dumps({'first': first_page + 1, 'pages': pages}).encode('utf-8'))
+    threading.Thread(target=_write_pages, args=(directory, rows, fmt, page_rows, first_page, pages),
+                     name=f"cursor-{cursor_id[:8]}", daemon=True).start()
+    return cursor_id
+
+
+def read_page(user_id, cursor_id, page):
+    """
+    The encoded page of a cursor, or None if it does not exist (or
+    expired, or was not written within CURSOR_WAIT seconds).
+    """
+    if not cursor_id.isalnum():
+        return None
+    directory = _directory(user_id, cursor_id)
+    try:
+        manifest_path = os.path.join(directory, 'cursor.json')
+        if time.time() - os.path.getmtime(manifest_path) > Config.CURSOR_TTL:
+            return None
+        with open(manifest_path, 'rb') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not manifest['first'] <= int(page) <= manifest['pages']:
+        return None
+
+    path = os.path.join(directory, f"{int(page)}.json")
+    deadline = time.monotonic() + Config.CURSOR_WAIT
+    while True:
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            if os.path.exists(os.path.join(directory, 'failed')) or time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+        except OSError:
+            return None
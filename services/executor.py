@@ -0,0 +1,406 @@
+# services/executor.py
+import atexit
+import math
+import multiprocessing
+import os
+import queue
+import re
+import resource
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from engine import execution, profiling
+from engine.dataframe import DataFrame
+from engine.segments import SegmentStore
+from services import results
+from services.chart_builder import build_chart_url
+from services.logger import get_logger
+from services.security import secure_eval, SecurityViolation
+
+logger = get_logger(__name__)
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class QueryError(Exception):
+    pass
+
+
+# ---------- Executor process side ----------
+
+def _portable(result, max_rows=None):
+    """
+    Converts a query result into something that can cross a process
+    boundary; a list is cut to its first max_rows rows first, so a huge
+    result is never pickled whole.
+    """
+    if isinstance(result, list):
+        return results.limit_rows(result, max_rows)
+    if isinstance(result, (dict, str, int, float)) or result is None:
+        return result
+    return str(result)
+
+
+class _WarmTables:
+    """Per-executor cache of opened tables, kept across queries."""
+
+    def __init__(self, max_handles, segment_store):
+        self.max_handles = max_handles
+        self.segment_store = segment_store
+        self._handles = OrderedDict()  # (filepath, mtime) -> DataFrame
+
+    def get(self, spec):
+        key = (spec['filepath'], os.path.getmtime(spec['filepath']))
+        df = self._handles.get(key)
+        if df is not None:
+            self._handles.move_to_end(key)
+            if df.segment is None:
+                self._attach(df)
+            return df
+
+        df = DataFrame(source=spec['filepath'], column_types=spec.get('types'),
+                       stats=spec.get('stats'))
+        self._attach(df)
+
+        for stale in [k for k in self._handles if k[0] == spec['filepath']]:
+            self._drop(self._handles.pop(stale))
+        self._handles[key] = df
+        while len(self._handles) > self.max_handles:
+            self._drop(self._handles.popitem(last=False)[1])
+        return df
+
+    def _attach(self, df):
+        # Segments are built by the web workers (at upload, or in the
+        # background there): never here, under the query's CPU limit
+        if self.segment_store is not None:
+            try:
+                df.segment = self.segment_store.acquire(df.parser, build=False)
+            except Exception as e:
+                logger.error(f"Executor could not attach segment: {e}")
+
+    def _drop(self, df):
+        if self.segment_store is not None and df.segment is not None:
+            self.segment_store.release(df.segment)
+
+
+def _on_cpu_limit(signum, frame):
+    raise QueryTimeout("Query exceeded its CPU time limit")
+
+
+def _run_with_cpu_limit(func, cpu_limit):
+    """Runs func() with RLIMIT_CPU set `cpu_limit` seconds above current usage."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = math.ceil(usage.ru_utime + usage.ru_stime)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    limit = used + cpu_limit
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        return func()
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _executor_main(conn, cancel_event, settings):
+    """Loop of one executor process: receive a query, run it, send the outcome."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    execution.set_cancel_check(cancel_event.is_set)
+
+    segment_store = None
+    if settings['shared_segments']:
+        segment_store = SegmentStore(settings['segment_dir'], settings['segment_budget'])
+    tables = _WarmTables(settings['max_handles'], segment_store)
+
+    while True:
+        try:
+            code_string, table_specs, options = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        def get_dataframe(table_name):
+            spec = table_specs.get(table_name)
+            return tables.get(spec) if spec else None
+
+        prof = None
+        try:
+            context = {
+                "get_dataframe": get_dataframe,
+                "len": len,
+                "int": int, "float": float, "str": str,
+                "build_chart_url": build_chart_url
+            }
+            for table_name in table_specs:
+                context[table_name] = get_dataframe(table_name)
+
+            export = options.get('export')
+            with profiling.profile(track_memory=options.get('track_memory', False)) as prof:
+                if export:
+                    # The file is sent in chunks while it is written; the
+                    # pipe holds the scan back when the download is slower
+                    def send_export():
+                        for chunk in results.export_chunks(code_string, context, export['format'],
+                                                           export.get('gzip', False)):
+                            conn.send(('chunk', chunk, None))
+                    _run_with_cpu_limit(send_export, options.get('cpu_limit', settings['cpu_limit']))
+                    result = None
+                else:
+                    result = _run_with_cpu_limit(
+                        lambda: secure_eval(code_string, context), settings['cpu_limit']
+                    )
+            outcome = ('ok', _portable(result, options.get('max_rows')))
+        except SecurityViolation as e:
+            outcome = ('security', str(e))
+        except results.NotExportable as e:
+            outcome = ('not_exportable', str(e))
+        except QueryTimeout as e:
+            outcome = ('timeout', str(e))
+        except execution.QueryCancelled as e:
+            outcome = ('cancelled', str(e))
+        except Exception as e:
+            outcome = ('error', str(e))
+
+        try:
+            conn.send(outcome + (prof.to_dict() if prof else None,))
+        except (BrokenPipeError, OSError):
+            break
+
+
+# ---------- Web worker side ----------
+
+class _ExecutorProcess:
+    def __init__(self, ctx, settings):
+        self.conn, child_conn = ctx.Pipe()
+        self.cancel_event = ctx.Event()
+        self.process = ctx.Process(
+            target=_executor_main,
+            args=(child_conn, self.cancel_event, settings),
+            name="aistora-executor",
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class QueryExecutor:
+    """
+    Pool of pre-started executor processes that run generated code.
+
+    Each query gets a wall-clock limit (`timeout`) and a CPU-time limit
+    (`cpu_limit`). When the deadline passes, or a cancel marker appears for
+    the query, the executor is asked to stop cooperatively; if it has not
+    answered after `grace` seconds it is killed and replaced. The request
+    thread only ever waits on a pipe, so it never holds the GIL for the
+    duration of the query.
+    """
+
+    def __init__(self, processes, timeout, cpu_limit, cancel_dir, grace=1.0):
+        self.timeout = timeout
+        self.cancel_dir = cancel_dir
+        self.grace = grace
+        self._settings = {
+            'cpu_limit': cpu_limit,
+            'max_handles': Config.CATALOG_MAX_HANDLES,
+            'shared_segments': Config.SHARED_SEGMENTS,
+            'segment_dir': Config.SEGMENT_DIR,
+            'segment_budget': Config.SEGMENT_BUDGET_MB * 1024 * 1024,
+        }
+        # fork: executors inherit the already imported engine and need no
+        # re-import of the web app's main module
+        self._ctx = multiprocessing.get_context('fork')
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+        os.makedirs(cancel_dir, exist_ok=True)
+        for _ in range(processes):
+            self._spawn()
+        atexit.register(self.shutdown)
+
+    def _spawn(self):
+        proc = _ExecutorProcess(self._ctx, self._settings)
+        with self._lock:
+            self._all.append(proc)
+        self._idle.put(proc)
+
+    def _retire(self, proc):
+        proc.kill()
+        with self._lock:
+            if proc in self._all:
+                self._all.remove(proc)
+
+    def cancel_marker(self, query_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(query_id))
+        return os.path.join(self.cancel_dir, safe_id)
+
+    def cancel(self, query_id):
+        """Requests cancellation of a query; works from any web worker."""
+        with open(self.cancel_marker(query_id), 'w'):
+            pass
+
+    def _exchange(self, code_string, table_specs, options, query_id, timeout):
+        """
+        Sends a query to an idle executor and yields what it sends back:
+        any ('chunk', data, None) messages, then ('done', outcome, reason).
+        Enforces the deadline and the cancel marker while waiting; an
+        executor that does not stop within `grace`, or whose exchange is
+        abandoned halfway (a closed download), is killed and replaced.
+        Waiting for an idle executor counts against the same deadline.
+        """
+        marker = self.cancel_marker(query_id) if query_id else None
+        deadline = time.monotonic() + timeout
+        proc = self._acquire(deadline, marker, timeout)
+        reason = None
+        stop_sent_at = None
+        finished = False
+
+        try:
+            proc.cancel_event.clear()
+            proc.conn.send((code_string, table_specs, options))
+
+            while True:
+                while not proc.conn.poll(0.1):
+                    if not proc.process.is_alive():
+                        raise QueryError("Query executor exited unexpectedly")
+                    now = time.monotonic()
+                    if reason is None:
+                        if now > deadline:
+                            reason = 'timeout'
+                        elif marker and os.path.exists(marker):
+                            reason = 'cancelled'
+                        if reason:
+                            proc.cancel_event.set()
+                            stop_sent_at = now
+                    elif now - stop_sent_at > self.grace:
+                        # Cooperative stop failed: replace the process
+                        self._replace(proc)
+                        proc = None
+                        finished = True
+                        yield ('done', (reason, None, None), reason)
+                        return
+
+                message = proc.conn.recv()
+                if message[0] == 'chunk':
+                    if reason is None:
+                        yield message
+                    continue
+                finished = True
+                yield ('done', message, reason)
+                return
+        except (EOFError, OSError) as e:
+            self._replace(proc)
+            proc = None
+            raise QueryError(f"Query executor failed: {e}")
+        finally:
+            if proc is not None:
+                if finished:
+                    self._idle.put(proc)
+                else:
+                    # Still sending: nobody will read the rest of its messages
+                    self._replace(proc)
+            if marker and os.path.exists(marker):
+                os.remove(marker)
+
+    def _acquire(self, deadline, marker, timeout):
+        """Waits for an idle executor until the deadline or a cancel marker."""
+        while True:
+            try:
+                return self._idle.get(timeout=max(0.0, min(0.1, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            if marker and os.path.exists(marker):
+                os.remove(marker)
+                raise QueryCancelled("Query was cancelled")
+            if time.monotonic() >= deadline:
+                raise QueryTimeout(f"Query exceeded the {timeout}s time limit")
+
+    def _replace(self, proc):
+        self._retire(proc)
+        self._spawn()
+
+    def _raise_for(self, outcome, reason, timeout):
+        status, payload, _ = outcome
+        if status == 'security':
+            raise SecurityViolation(payload)
+        if status == 'not_exportable':
+            raise results.NotExportable(payload)
+        if status == 'timeout' and payload:
+            raise QueryTimeout(payload)  # the executor's CPU limit
+        if status == 'timeout' or reason == 'timeout':
+            raise QueryTimeout(f"Query exceeded the {timeout}s time limit")
+        if status == 'cancelled' or reason == 'cancelled':
+            raise QueryCancelled("Query was cancelled")
+        raise QueryError(payload)
+
+    def run(self, code_string, table_specs, query_id=None, track_memory=False, max_rows=None):
+        """
+        Executes code against the given tables ({name: {'filepath', 'types'}})
+        and returns (result, operator profile), or raises QueryTimeout /
+        QueryCancelled / SecurityViolation / QueryError. `track_memory`
+        adds per-operator peak memory to the profile (slower); a list
+        result longer than `max_rows` comes back as its first max_rows
+        rows (results.TruncatedRows).
+        """
+        options = {'track_memory': track_memory, 'max_rows': max_rows}
+        for _, outcome, reason in self._exchange(code_string, table_specs, options, query_id, self.timeout):
+            pass
+        if outcome[0] == 'ok':
+            return outcome[1], outcome[2]
+        self._raise_for(outcome, reason, self.timeout)
+
+    def stream(self, code_string, table_specs, fmt, compress=False, query_id=None, timeout=None):
+        """
+        Exports the full result of code as CSV or NDJSON bytes (see
+        services.results.export_chunks), yielded as the executor writes
+        them. `timeout` (default: the query timeout) bounds the whole
+        export, wall clock and CPU time. Raises like run(), and
+        NotExportable for a chart.
+        """
+        timeout = timeout or self.timeout
+        options = {'export': {'format': fmt, 'gzip': compress}, 'cpu_limit': timeout}
+        for kind, payload, reason in self._exchange(code_string, table_specs, options, query_id, timeout):
+            if kind == 'chunk':
+                yield payload
+            elif payload[0] != 'ok':
+                self._raise_for(payload, reason, timeout)
+
+    def shutdown(self):
+        with self._lock:
+            procs = list(self._all)
+            self._all.clear()
+        for proc in procs:
+            proc.kill()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns this web worker's executor pool, starting it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = QueryExecutor(
+                processes=Config.EXECUTOR_PROCESSES,
+                timeout=Config.QUERY_TIMEOUT,
+                cpu_limit=Config.QUERY_CPU_LIMIT,
+                cancel_dir=Config.EXECUTOR_CANCEL_DIR,
+            )
+        return _executor
@@ -1,6 +1,10 @@
 # services/llm_service.py
+import json
+import re
+import time
 import google.generativeai as genai
 from config import Config
+from services.plan_cache import normalize_question
 
 model = None
 
@@ -46,11 +50,19 @@ You may ONLY use these:
     df.project(["col1", "col2"])
     df.join(other_df, "left_key", "right_key")
     df.groupby("column")
+    df.groupby("date_column", bucket="month")
+    df.groupby(["col1", "col2"])
+    df.join(other_df, ["left_key1", "left_key2"], ["right_key1", "right_key2"])
     df.aggregate(df.groupby("country"), {"total_amount": "sum"})
     df.columns
     df.max_by("column")
     df.min_by("column")
     df.top_k_by("column", k)
+    df.pivot("row_column", "column_column", "value_column", "sum")
+    df.cumsum("column", order_by="date_column", partition_by="account")
+    df.lag("column", 1, order_by="date_column")
+    df.lead("column", 1, order_by="date_column")
+    df.rolling_mean("column", 3, order_by="date_column")
 
 Replace df with ANY DataFrame variable (customers, orders, etc.).
 
@@ -76,6 +88,28 @@ RULES FOR COMMON OPERATIONS
 6. GROUP BY + AGGREGATE
        df.aggregate(df.groupby("country"), {"total_amount": "sum"})
 
+7. GROUP BY DAY / MONTH / YEAR OF A DATE COLUMN
+       df.aggregate(df.groupby("order_date", bucket="month"), {"total_amount": "sum"})
+
+8. GROUP BY OR JOIN ON SEVERAL COLUMNS
+       df.aggregate(df.groupby(["country", "order_date"], bucket="month"), {"total_amount": "sum"})
+       df.join(other_df, ["invoice_id", "line_no"], ["invoice_id", "line_no"])
+   Pass a list of columns; never build combined keys in a lambda.
+   With several group columns, bucket applies to the LAST one.
+
+9. GRIDS (PIVOT / CROSSTAB)
+       df.pivot("customer_id", "order_date", "total_amount", "sum", bucket="month")
+   Returns a LIST of row dicts: one per customer_id, one column per month.
+   Use it instead of one groupby/aggregate per column value.
+
+10. RUNNING TOTALS, PREVIOUS/NEXT VALUES, MOVING AVERAGES
+       df.cumsum("amount", order_by="order_date", partition_by="account_id")
+       df.lag("total", 1, order_by="month")          # adds "total_lag"
+       df.rolling_mean("total", 3, order_by="month") # adds "total_rolling_mean"
+   Each returns a DataFrame with one extra column ("<column>_cumsum",
+   "<column>_lag", "<column>_lead", "<column>_rolling_mean").
+   NEVER compute these with a filter() per row.
+
 ------------------------------------------------------------
 IMPORTANT RETURN-TYPE RULES
 ------------------------------------------------------------
@@ -126,10 +160,83 @@ Example of correct output:
     orders.max_by("total_amount")
 """
 
+class LlmResponse:
+    """Minimal response object: routes only ever read `.text`."""
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """
+    Deterministic local stand-in for Gemini, for development and load tests.
+
+    Implements the same `generate_content(prompt)` interface. Chat prompts
+    are answered from a recordings file mapping questions (normalized like
+    the plan cache does) to query code or to {"isCode", "content"} objects.
+    Relationship prompts get the recorded relationships, or else every
+    `*_id` column shared by two tables.
+    """
+
+    _QUESTION_RE = re.compile(r'NOW, generate the JSON for: "(.*)"', re.DOTALL)
+    _SCHEMA_RE = re.compile(r'Given this schema:\s*(\{.*?\})\s*\n', re.DOTALL)
+
+    def __init__(self, recordings_path=None, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.answers = {}
+        self.relationships = None
+        if recordings_path:
+            with open(recordings_path, 'r', encoding='utf-8') as f:
+                recordings = json.load(f)
+            for question, answer in recordings.get('chat', {}).items():
+                if isinstance(answer, str):
+                    answer = {'isCode': True, 'content': answer}
+                self.answers[normalize_question(question)] = answer
+            self.relationships = recordings.get('relationships')
+
+    def generate_content(self, prompt):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        match = self._QUESTION_RE.search(prompt)
+        if match:
+            answer = self.answers.get(normalize_question(match.group(1)))
+            if answer is None:
+                answer = {'isCode': False, 'content': "I don't have a recorded answer for that question."}
+            return LlmResponse(json.dumps(answer))
+
+        return LlmResponse(json.dumps({
+            'success': True,
+            'relationships': self._relationships(prompt)
+        }))
+
+    def _relationships(self, prompt):
+        if self.relationships is not None:
+            return self.relationships
+        match = self._SCHEMA_RE.search(prompt)
+        if not match:
+            return []
+        schema = json.loads(match.group(1))
+        found = []
+        tables = list(schema)
+        for i, from_table in enumerate(tables):
+            for column in schema[from_table]:
+                if not column.endswith('_id'):
+                    continue
+                for to_table in tables[:i]:
+                    if column in schema[to_table]:
+                        found.append({'from_table': from_table, 'from_column': column,
+                                      'to_table': to_table, 'to_column': column})
+                        break
+        return found
+
+
 def configure_llm():
     global model
     try:
-        if Config.GEMINI_API_KEY:
+        if Config.LLM_BACKEND == 'stub':
+            model = StubModel(Config.LLM_STUB_PATH, latency_ms=Config.LLM_STUB_LATENCY_MS)
+            print("✅ Local LLM stub configured")
+        elif Config.GEMINI_API_KEY:
             genai.configure(api_key=Config.GEMINI_API_KEY)
             model = genai.GenerativeModel(
                 'gemini-2.5-flash',
@@ -18,6 +18,9 @@ class JsonFormatter(logging.Formatter):
             log_record['user_id'] = record.user_id
         if hasattr(record, 'request_id'):
             log_record['request_id'] = record.request_id
+        # Structured payload, e.g. query profiles
+        if hasattr(record, 'fields'):
+            log_record.update(record.fields)
             
         return json.dumps(log_record)
 
@@ -0,0 +1,131 @@
+# services/metrics.py
+import glob
+import json
+import os
+import threading
+
+from config import Config
+
+# name -> (help text, bucket upper bounds)
+HISTOGRAMS = {
+    'aistora_llm_latency_seconds': (
+        'Time spent waiting for the LLM to generate a plan.',
+        (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ),
+    'aistora_query_execution_seconds': (
+        'Time spent executing generated query code.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ),
+    'aistora_query_result_rows': (
+        'Number of rows (or groups) in a query result.',
+        (1, 10, 100, 1000, 10000, 100000, 1000000),
+    ),
+}
+
+# name -> help text; counters carry a single label
+COUNTERS = {
+    'aistora_chat_responses_total': 'Chat responses by response type.',
+    'aistora_exports_total': 'Result exports by format.',
+}
+
+
+class Metrics:
+    """
+    Prometheus metrics shared by all gunicorn workers.
+
+    Every process keeps its own values and mirrors them to
+    `<directory>/<pid>.json` after each update; render() merges the files
+    of all workers. Files of exited workers are kept so the totals never
+    go backwards.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._state = {
+            'histograms': {
+                name: {'buckets': [0] * len(bounds), 'sum': 0.0, 'count': 0}
+                for name, (_, bounds) in HISTOGRAMS.items()
+            },
+            'counters': {name: {} for name in COUNTERS},
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def observe(self, name, value):
+        _, bounds = HISTOGRAMS[name]
+        with self._lock:
+            hist = self._state['histograms'][name]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+            self._flush()
+
+    def inc(self, name, label, amount=1):
+        with self._lock:
+            counter = self._state['counters'][name]
+            counter[label] = counter.get(label, 0) + amount
+            self._flush()
+
+    def _flush(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _merged(self):
+        merged = {
+            'histograms': {
+                name: {'buckets': [0] * len(bounds), 'sum': 0.0, 'count': 0}
+                for name, (_, bounds) in HISTOGRAMS.items()
+            },
+            'counters': {name: {} for name in COUNTERS},
+        }
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, hist in state.get('histograms', {}).items():
+                target = merged['histograms'].get(name)
+                if target is None or len(hist['buckets']) != len(target['buckets']):
+                    continue
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], hist['buckets'])]
+                target['sum'] += hist['sum']
+                target['count'] += hist['count']
+            for name, values in state.get('counters', {}).items():
+                target = merged['counters'].get(name)
+                if target is None:
+                    continue
+                for label, value in values.items():
+                    target[label] = target.get(label, 0) + value
+        return merged
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        merged = self._merged()
+        lines = []
+        for name, (help_text, bounds) in HISTOGRAMS.items():
+            hist = merged['histograms'][name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(bounds, hist['buckets']):
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {hist["count"]}')
+            lines.append(f"{name}_sum {hist['sum']}")
+            lines.append(f"{name}_count {hist['count']}")
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for label, value in sorted(merged['counters'][name].items()):
+                lines.append(f'{name}{{type="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(Config.METRICS_DIR)
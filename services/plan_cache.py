@@ -0,0 +1,184 @@
+# services/plan_cache.py
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from config import Config
+from extensions import db
+from models import PlanCacheEntry
+from services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Sentence punctuation that does not change the meaning of a question.
+# Dots and commas between digits (1.5, 10,000) are kept.
+_PUNCTUATION_RE = re.compile(r"[?!;:\"'`]|(?<!\d)[.,]|[.,](?!\d)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Lower-cases a question and strips punctuation and repeated whitespace."""
+    text = (question or "").lower()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def schema_fingerprint(schema, relationships=None):
+    """
+    Stable hash of everything the LLM sees about a database:
+    table names, column types and known relationships.
+    """
+    payload = {
+        "tables": {name: details.get('types') for name, details in (schema or {}).items()},
+        "relationships": sorted(
+            json.dumps(r, sort_keys=True) for r in (relationships or [])
+        ),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Two-level cache of LLM answers.
+
+    An in-process LRU sits in front of the `plan_cache_entry` table, so
+    answers survive worker restarts and are shared between gunicorn workers.
+    Entries expire after `ttl` seconds; both levels are capped at
+    `max_entries` and evict the least recently used entries first. Hits
+    served from memory are recorded in the table with the next put(),
+    before it evicts.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (stored_at, payload)
+        self._used = {}  # key -> last memory hit not yet written to the table
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind, fingerprint, question=""):
+        raw = f"{kind}|{fingerprint}|{normalize_question(question)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # ---------- In-process LRU ----------
+
+    def _memory_get(self, key):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            stored_at, payload = item
+            if time.time() - stored_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._used[key] = datetime.utcnow()
+            return payload
+
+    def _memory_put(self, key, payload, stored_at=None):
+        with self._lock:
+            self._memory[key] = (stored_at or time.time(), payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # ---------- Public API ----------
+
+    def get(self, kind, fingerprint, question=""):
+        """Returns the cached payload or None."""
+        key = self.make_key(kind, fingerprint, question)
+        payload = self._memory_get(key)
+        if payload is not None:
+            return payload
+
+        try:
+            entry = db.session.get(PlanCacheEntry, key)
+            if entry is None:
+                return None
+
+            now = datetime.utcnow()
+            if entry.created_at and now - entry.created_at > timedelta(seconds=self.ttl):
+                db.session.delete(entry)
+                db.session.commit()
+                return None
+
+            entry.last_used_at = now
+            db.session.commit()
+            stored_at = time.time() - (now - entry.created_at).total_seconds()
+            self._memory_put(key, entry.payload, stored_at=stored_at)
+            return entry.payload
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Plan cache read failed: {e}")
+            return None
+
+    def put(self, kind, fingerprint, question, payload):
+        key = self.make_key(kind, fingerprint, question)
+        self._memory_put(key, payload)
+
+        try:
+            now = datetime.utcnow()
+            entry = db.session.get(PlanCacheEntry, key)
+            if entry is None:
+                entry = PlanCacheEntry(key=key, kind=kind)
+                db.session.add(entry)
+            entry.payload = payload
+            entry.created_at = now
+            entry.last_used_at = now
+            self._record_used()
+            db.session.commit()
+            self._evict()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Plan cache write failed: {e}")
+
+    def invalidate(self, kind, fingerprint, question=""):
+        """Drops one entry, e.g. when the cached plan failed to execute."""
+        key = self.make_key(kind, fingerprint, question)
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            PlanCacheEntry.query.filter_by(key=key).delete()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Plan cache invalidation failed: {e}")
+
+    def _record_used(self):
+        """Writes the memory hits since the last put() to last_used_at."""
+        with self._lock:
+            used, self._used = self._used, {}
+        for key, used_at in used.items():
+            PlanCacheEntry.query.filter(
+                PlanCacheEntry.key == key, PlanCacheEntry.last_used_at < used_at
+            ).update({'last_used_at': used_at}, synchronize_session=False)
+
+    def _evict(self):
+        """Removes expired rows and trims the table to `max_entries` (LRU)."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        PlanCacheEntry.query.filter(PlanCacheEntry.created_at < cutoff).delete()
+
+        overflow = PlanCacheEntry.query.count() - self.max_entries
+        if overflow > 0:
+            stale = (
+                db.session.query(PlanCacheEntry.key)
+                .order_by(PlanCacheEntry.last_used_at.asc())
+                .limit(overflow)
+                .all()
+            )
+            PlanCacheEntry.query.filter(
+                PlanCacheEntry.key.in_([k for (k,) in stale])
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+
+plan_cache = PlanCache(
+    ttl=Config.PLAN_CACHE_TTL,
+    max_entries=Config.PLAN_CACHE_MAX_ENTRIES,
+)
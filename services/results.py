@@ -0,0 +1,268 @@
+# services/results.py
+"""
+Query results as table rows.
+
+table_rows() turns what a generated query returns into the rows /api/chat
+shows, limit_rows() caps how many of them are kept, and table_payload()
+lays them out as rows (a dict per row) or columns (the names once, then a
+value array per row). encode_json() uses orjson when it is installed and
+the standard library otherwise.
+
+stream_rows() and the writers below serve /api/export: the query is
+evaluated lazily, so a filter over a table, or over a join of two tables,
+is streamed straight from the scan to the response in CSV or NDJSON
+chunks (optionally gzipped) without the result ever being held in
+memory. export_chunks() is what the query executor runs for an export.
+"""
+import ast
+import csv
+import io
+import json
+import re
+import zlib
+
+from engine.dataframe import DataFrame
+from services.chart_builder import is_chart_url
+from services.security import secure_eval
+
+try:
+    import orjson
+except ImportError:  # optional: a faster encoder for large results
+    orjson = None
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+# Layouts of table results in /api/chat responses
+TABLE_FORMATS = ('rows', 'columnar')
+# Bytes of output gathered before a chunk is sent
+CHUNK_BYTES = 64 * 1024
+
+
+class NotExportable(ValueError):
+    """The query's result is not a table (a chart)."""
+    pass
+
+
+class TruncatedRows(list):
+    """The first rows of a longer list result; `total` is the full row count."""
+
+    def __init__(self, rows, total):
+        super().__init__(rows)
+        self.total = total
+
+
+_GROUPBY_RE = re.compile(r"\.groupby\(\s*(\[[^\]]*\]|'[^']+'|\"[^\"]+\")")
+
+
+def group_columns(code):
+    """The column names of the first groupby() in the code, [] if none is found."""
+    match = _GROUPBY_RE.search(code)
+    if not match:
+        return []
+    return [single or double for single, double in re.findall(r"'([^']+)'|\"([^\"]+)\"", match.group(1))]
+
+
+def table_rows(result, code):
+    """
+    The rows of an aggregate() result ({group: {col: value}}): the group
+    key in a column named after the groupby() column, one column per key
+    part for a composite key.
+    """
+    columns = group_columns(code)
+    for key, values in result.items():
+        if isinstance(key, tuple):
+            names = columns if len(columns) == len(key) \
+                else [f"group_{i}" for i in range(1, len(key) + 1)]
+            row = dict(zip(names, key))
+        else:
+            row = {columns[0] if len(columns) == 1 else "group": key}
+        row.update(values)
+        yield row
+
+
+def limit_rows(rows, max_rows):
+    """
+    A list result cut to its first `max_rows` rows (as TruncatedRows);
+    shorter lists, other results and a max_rows of 0 are left as they are.
+    """
+    if max_rows and isinstance(rows, list) and len(rows) > max_rows:
+        return TruncatedRows(rows[:max_rows], getattr(rows, 'total', len(rows)))
+    return rows
+
+
+def table_payload(rows, fmt='rows'):
+    """
+    The 'data' of a table response: the rows as they are, or for the
+    columnar layout {'columns': [...], 'data': [[...], ...]} with the
+    columns in order of first appearance. Values that are not dicts
+    become a 'value' column.
+    """
+    if fmt != 'columnar':
+        return {'data': rows}
+    columns = {}
+    for row in rows:
+        for col in (row if isinstance(row, dict) else ('value',)):
+            columns.setdefault(col, None)
+    columns = list(columns)
+    values = [[row.get(col) for col in columns] if isinstance(row, dict) else [row] for row in rows]
+    return {'columns': columns, 'data': values}
+
+
+def encode_json(payload):
+    """Encodes a response payload as JSON bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. tuple keys: the standard encoder reports it the usual way
+    return json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8')
+
+
+def _method(node):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def _unsliced(code):
+    tree = ast.parse(code.strip(), mode='eval').body
+    if isinstance(tree, ast.Subscript) and isinstance(tree.slice, ast.Slice):
+        tree = tree.value
+    return tree
+
+
+def without_slice(code):
+    """The query without its trailing slice: what an export runs."""
+    return ast.unparse(_unsliced(code))
+
+
+def stream_rows(code, context):
+    """
+    Evaluates a query for export and returns (rows, columns): an iterator
+    over all its result rows and the columns to write (None: those of the
+    first row). A trailing slice is dropped, since the export wants every
+    row. For `table.filter(...)...project(cols)`, with a table or a
+    `left.join(right, ...)` as the source, the rows are produced lazily
+    by the scan; any other query is evaluated and then iterated.
+    Raises NotExportable for results that are not tabular (charts).
+    """
+    def evaluate(node):
+        return secure_eval(ast.unparse(node), context)
+
+    tree = _unsliced(code)
+
+    expression = tree
+    columns = None
+    if _method(tree) == 'project' and len(tree.args) == 1 and not tree.keywords:
+        columns = evaluate(tree.args[0])
+        tree = tree.func.value
+    filters = []
+    while _method(tree) == 'filter' and len(tree.args) == 1 \
+            and all(k.arg == 'predicates' for k in tree.keywords):
+        filters.append(tree)
+        tree = tree.func.value
+
+    joined = None
+    if _method(tree) == 'join' and len(tree.args) == 3 and not tree.keywords:
+        left, right = evaluate(tree.func.value), evaluate(tree.args[0])
+        if isinstance(left, DataFrame) and isinstance(right, DataFrame):
+            joined = left.iter_join(right, evaluate(tree.args[1]), evaluate(tree.args[2]))
+
+    source = evaluate(tree) if joined is None and (filters or columns is not None) else None
+    if joined is not None or isinstance(source, DataFrame):
+        rows = joined
+        for call in reversed(filters):  # innermost first
+            condition = evaluate(call.args[0])
+            if rows is None:
+                predicates = evaluate(call.keywords[0].value) if call.keywords else None
+                rows = source.iter_filter(condition, predicates=predicates)
+            else:
+                rows = _filtered(rows, condition)
+        if rows is None:
+            rows = source.iter_rows()
+    else:
+        columns = None
+        result = evaluate(expression)
+        if isinstance(result, DataFrame):
+            rows = result.iter_rows()
+        elif isinstance(result, dict):
+            rows = table_rows(result, code)
+        elif isinstance(result, list):
+            rows = (row if isinstance(row, dict) else {'value': row} for row in result)
+        elif is_chart_url(result):
+            raise NotExportable("Charts cannot be exported")
+        else:
+            rows = iter([{'result': result}])
+
+    if columns is not None:
+        rows = _projected(rows, columns)
+    return rows, columns
+
+
+def _filtered(rows, condition):
+    for row in rows:
+        if condition(row):
+            yield row
+
+
+def _projected(rows, columns):
+    for row in rows:
+        yield {col: row[col] for col in columns if col in row}
+
+
+def csv_chunks(rows, columns=None):
+    """Writes rows as CSV text chunks, the header taken from `columns` or the first row."""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(columns or row.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if writer is None and columns:
+        csv.writer(buffer).writerow(columns)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    """Writes rows as newline-delimited JSON text chunks."""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, default=str)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_BYTES:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def gzip_chunks(chunks):
+    """Compresses text chunks into a gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(code, context, fmt, compress=False):
+    """
+    The bytes of a query's full result as a CSV or NDJSON file, gzipped
+    if `compress`. The query is evaluated (and NotExportable raised)
+    before the first chunk is returned; rows are then read as the chunks
+    are consumed.
+    """
+    rows, columns = stream_rows(code, context)
+    chunks = csv_chunks(rows, columns) if fmt == 'csv' else ndjson_chunks(rows)
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -0,0 +1,180 @@
+# services/schema_store.py
+"""
+Server-side store of project schemas.
+
+The schema the chat and upload routes work from (every table's id, file,
+column types and row count, plus the detected relationships) is kept in
+the `schema_snapshot` table instead of the cookie session. Every change
+(an upload, a rename, a delete, new relationships) saves a new numbered
+version; the last SCHEMA_SNAPSHOTS_KEPT versions of a project are kept.
+
+Reads go through two caches: the snapshots already loaded by this worker
+(an LRU of SCHEMA_CACHE_MAX_PROJECTS projects) and, within a request,
+flask.g. A worker checks the project's latest version number once per
+request, so a version saved by another worker is picked up on the next
+request without reloading an unchanged schema.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import g, has_request_context, session
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from extensions import db
+from models import SchemaSnapshot, Table
+from services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# project_id -> {'version', 'tables', 'relationships'}
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+def _request_cache():
+    if not has_request_context():
+        return {}
+    if 'schema_snapshots' not in g:
+        g.schema_snapshots = {}
+    return g.schema_snapshots
+
+
+def _remember(project_id, snapshot):
+    with _lock:
+        cached = _snapshots.get(project_id)
+        if cached is None or cached['version'] <= snapshot['version']:
+            _snapshots[project_id] = snapshot
+        _snapshots.move_to_end(project_id)
+        while len(_snapshots) > Config.SCHEMA_CACHE_MAX_PROJECTS:
+            _snapshots.popitem(last=False)
+    _request_cache()[project_id] = snapshot
+
+
+def _as_dict(entry):
+    return {'version': entry.version, 'tables': entry.tables, 'relationships': entry.relationships}
+
+
+def build_tables(project_id):
+    """The schema of a project as its tables currently are in the database."""
+    return {
+        table.name: {
+            'id': table.id,
+            'filename': table.filename,
+            'types': table.columns_schema,
+            'row_count': table.row_count
+        }
+        for table in Table.query.filter_by(project_id=project_id).order_by(Table.id).all()
+    }
+
+
+def current(project_id):
+    """
+    The latest snapshot of a project: {'version', 'tables', 'relationships'}.
+    Projects without one (created before snapshots existed) get a first
+    version built from their tables.
+    """
+    requested = _request_cache()
+    if project_id in requested:
+        return requested[project_id]
+
+    latest = db.session.query(func.max(SchemaSnapshot.version)) \
+        .filter_by(project_id=project_id).scalar()
+    if latest is None:
+        return save(project_id, build_tables(project_id), [])
+
+    with _lock:
+        cached = _snapshots.get(project_id)
+    if cached is None or cached['version'] != latest:
+        cached = snapshot(project_id, latest) or _latest(project_id)
+    _remember(project_id, cached)
+    return cached
+
+
+def _latest(project_id):
+    """The newest kept snapshot, for when the version just looked up was pruned meanwhile."""
+    entry = SchemaSnapshot.query.filter_by(project_id=project_id) \
+        .order_by(SchemaSnapshot.version.desc()).first()
+    return _as_dict(entry) if entry else {'version': 0, 'tables': {}, 'relationships': []}
+
+
+def snapshot(project_id, version):
+    """One version of a project's schema, or None if it is not kept."""
+    entry = SchemaSnapshot.query.filter_by(project_id=project_id, version=version).first()
+    return _as_dict(entry) if entry else None
+
+
+def versions(project_id):
+    """The kept versions of a project: [{'version', 'tables', 'created_at'}], newest first."""
+    entries = SchemaSnapshot.query.filter_by(project_id=project_id) \
+        .order_by(SchemaSnapshot.version.desc()).all()
+    return [{'version': e.version, 'tables': sorted(e.tables), 'created_at': e.created_at.isoformat()}
+            for e in entries]
+
+
+def save(project_id, tables, relationships):
+    """Stores a new version of a project's schema and returns it."""
+    for attempt in range(2):
+        latest = db.session.query(func.max(SchemaSnapshot.version)) \
+            .filter_by(project_id=project_id).scalar() or 0
+        entry = SchemaSnapshot(project_id=project_id, version=latest + 1,
+                               tables=tables, relationships=relationships)
+        db.session.add(entry)
+        try:
+            # Versions older than the last SCHEMA_SNAPSHOTS_KEPT go in the same commit
+            SchemaSnapshot.query.filter(
+                SchemaSnapshot.project_id == project_id,
+                SchemaSnapshot.version <= entry.version - Config.SCHEMA_SNAPSHOTS_KEPT,
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Another worker saved the same version number first
+            db.session.rollback()
+            if attempt:
+                raise
+
+    saved = _as_dict(entry)
+    _remember(project_id, saved)
+    logger.info(f"Schema of project {project_id} saved as version {saved['version']}")
+    return saved
+
+
+def refresh(project_id):
+    """
+    Saves a new version after tables changed. Relationships are kept,
+    except those of tables that no longer exist.
+    """
+    tables = build_tables(project_id)
+    relationships = [rel for rel in current(project_id)['relationships']
+                     if rel.get('from_table') in tables and rel.get('to_table') in tables]
+    return save(project_id, tables, relationships)
+
+
+def set_relationships(project_id, relationships):
+    """Saves a new version with the detected relationships."""
+    return save(project_id, current(project_id)['tables'], relationships)
+
+
+def forget(project_id=None):
+    """Drops this worker's cached snapshots of one project, or of all of them."""
+    with _lock:
+        if project_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(project_id, None)
+
+
+# ---------- Active project ----------
+
+def get_schema():
+    """The tables of the active project's current schema ({} if none is selected)."""
+    project_id = session.get('active_project_id')
+    return current(project_id)['tables'] if project_id else {}
+
+
+def get_relationships():
+    """The relationships of the active project's current schema."""
+    project_id = session.get('active_project_id')
+    return current(project_id)['relationships'] if project_id else []
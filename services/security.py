@@ -16,7 +16,8 @@ class AstValidator(ast.NodeVisitor):
         self.allowed_attributes = {
             'filter', 'project', 'join', 'groupby', 'aggregate',
             'get_header', 'columns', 'items',
-            'max_by', 'min_by', 'top_k_by'
+            'max_by', 'min_by', 'top_k_by',
+            'cumsum', 'lag', 'lead', 'rolling_mean', 'pivot'
         }
 
         self.allowed_functions = {
@@ -1,7 +1,114 @@
 # services/state_manager.py
+import ast
+import os
+import threading
+from collections import OrderedDict
 from flask import session
+from config import Config
 from engine.dataframe import DataFrame
-from models import Table
+from engine.parser import CsvParser
+from engine import indexes
+from engine.segments import SegmentStore
+from services import catalog
+
+# Per-worker cache of open tables (table metadata is cached by
+# services.catalog). Only an optimisation: the database and the files on
+# disk stay the source of truth.
+#   _handles: (project_id, table_name, mtime) -> DataFrame
+_handles = OrderedDict()
+_lock = threading.Lock()
+_segment_store = None
+
+
+def _get_segment_store():
+    global _segment_store
+    if _segment_store is None and Config.SHARED_SEGMENTS:
+        _segment_store = SegmentStore(Config.SEGMENT_DIR, Config.SEGMENT_BUDGET_MB * 1024 * 1024)
+    return _segment_store
+
+
+def _release(df):
+    """Drops the worker's reference on a handle's shared segment."""
+    store = _get_segment_store()
+    if store is not None and df.segment is not None:
+        try:
+            store.release(df.segment)
+        except Exception as e:
+            print(f"Error releasing segment {df.segment.path}: {e}")
+
+
+def _attach_segment(df, table_name):
+    """
+    Maps the shared segment of a handle's file if it is built; otherwise
+    starts building it in the background and the handle reads the CSV
+    until a later query finds it ready.
+    """
+    store = _get_segment_store()
+    if store is None:
+        return
+    try:
+        segment = store.acquire(df.parser, build=False)
+        if segment is None:
+            store.build_in_background(df.parser)
+            return
+    except Exception as e:
+        # The CSV stays usable; only the shared copy is missing
+        print(f"Error attaching shared segment for {table_name}: {e}")
+        return
+    with _lock:
+        if df.segment is None:
+            df.segment = segment
+            return
+    store.release(segment)  # another thread attached it first
+
+
+def build_segments(table_specs):
+    """
+    Starts building the shared segments (see engine.segments) of the
+    tables in `table_specs` that have none yet, in the background: after
+    an upload, and before a query runs in the executors, which never
+    build them.
+    """
+    store = _get_segment_store()
+    if store is None:
+        return
+    for spec in table_specs.values():
+        try:
+            if not store.exists(spec['filepath']):
+                store.build_in_background(CsvParser(spec['filepath'], column_types=spec.get('types')))
+        except Exception as e:
+            print(f"Error starting segment build for {spec['filepath']}: {e}")
+
+
+def _get_handle(project_id, table_name, info):
+    """Returns a cached DataFrame for the file, re-opening it if the file changed."""
+    mtime = os.path.getmtime(info['filepath'])
+    key = (project_id, table_name, mtime)
+
+    with _lock:
+        df = _handles.get(key)
+        if df is not None and df.filepath == info['filepath']:
+            _handles.move_to_end(key)
+    if df is not None and df.filepath == info['filepath']:
+        if df.segment is None:
+            _attach_segment(df, table_name)
+        return df
+
+    df = DataFrame(source=info['filepath'], column_types=info['types'], stats=info.get('stats'))
+    _attach_segment(df, table_name)
+
+    dropped = []
+    with _lock:
+        # Drop handles for older versions of the same table
+        for stale in [k for k in _handles if k[:2] == (project_id, table_name)]:
+            dropped.append(_handles.pop(stale))
+        _handles[key] = df
+        while len(_handles) > Config.CATALOG_MAX_HANDLES:
+            dropped.append(_handles.popitem(last=False)[1])
+    for old in dropped:
+        _release(old)
+    return df
+
 
 def get_dataframe(table_name):
     """
@@ -12,23 +119,94 @@ def get_dataframe(table_name):
     if not active_project_id:
         return None
 
-    # Query Postgres for the table info
-    table_record = Table.query.filter_by(project_id=active_project_id, name=table_name).first()
-    
-    if table_record:
+    info = catalog.table_meta(active_project_id).get(table_name)
+    if info:
         try:
-            # Re-create the DataFrame object from the stored path
-            df = DataFrame(source=table_record.filepath)
-            return df
+            return _get_handle(active_project_id, table_name, info)
         except Exception as e:
             print(f"Error initializing DataFrame for {table_name}: {e}")
             return None
-    
+
     return None
 
-def clear_cache_for_user():
+
+def get_table_specs(table_names):
+    """
+    Returns {name: {'filepath', 'types', 'row_count', 'stats'}} for tables of the
+    active project, the form the query executor needs to open them in
+    another process and the planner needs for its estimates.
+    """
+    active_project_id = session.get('active_project_id')
+    if not active_project_id:
+        return {}
+    meta = catalog.table_meta(active_project_id)
+    return {name: dict(meta[name]) for name in table_names if name in meta}
+
+
+def index_relationship_columns(relationships):
+    """
+    Makes sure both columns of every detected relationship are indexed, so
+    joins along them can read only the matching rows (see engine.indexes).
+    """
+    columns = {}
+    for rel in relationships or []:
+        for table, column in ((rel.get('from_table'), rel.get('from_column')),
+                              (rel.get('to_table'), rel.get('to_column'))):
+            columns.setdefault(table, set()).add(column)
+
+    for name, spec in get_table_specs(columns).items():
+        indexable = [c for c in sorted(columns[name])
+                     if spec['types'].get(c) in indexes.INDEXED_TYPES]
+        try:
+            indexes.ensure_indexes(CsvParser(spec['filepath'], column_types=spec['types']), indexable)
+        except Exception as e:
+            print(f"Error indexing relationship columns of {name}: {e}")
+
+
+def get_referenced_tables(code_string, table_names):
+    """
+    Returns the table names the generated code actually refers to,
+    by name or through get_dataframe('name'), so only those tables are
+    loaded. Falls back to every table if the code cannot be parsed
+    (secure_eval will report the error) or passes get_dataframe() a
+    computed name.
+    """
+    table_names = list(table_names)
+    try:
+        tree = ast.parse(code_string, mode='eval')
+    except SyntaxError:
+        return table_names
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        # get_dataframe('x') needs the spec of 'x' too: in the query
+        # executor it can only open the tables it was sent
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id == 'get_dataframe':
+            argument = node.args[0] if node.args else None
+            if not (isinstance(argument, ast.Constant) and isinstance(argument.value, str)):
+                return table_names  # a computed name could be any table
+            names.add(argument.value)
+    return [name for name in table_names if name in names]
+
+
+def clear_cache_for_user(project_id=None, table_name=None):
     """
-    No longer needed since we don't cache objects, 
-    but kept for interface compatibility.
+    Invalidation hook for the per-worker caches.
+    Drops everything cached for one table, one project, or (no arguments)
+    the whole worker. Call it after any change to tables or their files.
     """
-    pass
\ No newline at end of file
+    catalog.forget(project_id)
+    dropped = []
+    with _lock:
+        if project_id is None:
+            dropped = list(_handles.values())
+            _handles.clear()
+        else:
+            for key in list(_handles):
+                if key[0] == project_id and (table_name is None or key[1] == table_name):
+                    dropped.append(_handles.pop(key))
+    for df in dropped:
+        _release(df)
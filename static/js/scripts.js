@@ -651,35 +651,93 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
-  function renderTable(data) {
+  // Table results come as rows (a dict per row) or columnar ({columns, data: value arrays})
+  function renderTable(result) {
+    const data = result.data;
     if (data.length === 0)
       return '<p class="text-[11px] text-slate-500">Query returned no results.</p>';
-    const headers = Object.keys(data[0]);
+    const headers = result.columns || Object.keys(data[0]);
     let table =
       '<table class="text-[11px] border border-slate-200 rounded-lg overflow-hidden w-full">';
     table += '<thead class="bg-slate-100"><tr>';
     headers.forEach((h) => (table += `<th class="p-1.5 text-left">${h}</th>`));
     table += "</tr></thead>";
-    table += "<tbody>";
-    data.forEach((row) => {
-      table += '<tr class="hover:bg-slate-50">';
-      headers.forEach(
-        (h) => (table += `<td class="p-1.5 border-t">${row[h]}</td>`)
-      );
-      table += "</tr>";
+    table += `<tbody>${renderRows(result, headers)}</tbody></table>`;
+    let more = "";
+    if (result.cursor && result.cursor.next) {
+      more = `<button class="load-page mt-2 text-[11px] px-2 py-1 rounded-md bg-slate-100 text-slate-700" data-cursor="${result.cursor.id}" data-page="${result.cursor.next}">Load more (${data.length} of ${result.cursor.rows} rows shown)</button>`;
+    }
+    if (result.totalRows) {
+      more += `<p class="mt-1 text-[10px] text-slate-500">Only the first ${result.cursor ? result.cursor.rows : data.length} of ${result.totalRows} rows can be shown here; download all of them below.</p>`;
+    }
+    return `<div class="overflow-x-auto">${table}</div>${more}`;
+  }
+
+  function renderRows(result, headers) {
+    let rows = "";
+    result.data.forEach((row) => {
+      const values = result.columns ? row : headers.map((h) => row[h]);
+      rows += '<tr class="hover:bg-slate-50">';
+      values.forEach((v) => (rows += `<td class="p-1.5 border-t">${v}</td>`));
+      rows += "</tr>";
     });
-    table += "</tbody></table>";
-    return `<div class="overflow-x-auto">${table}</div>`;
+    return rows;
+  }
+
+  // Fetches the next page of a paged table result and appends its rows
+  async function loadPage(button) {
+    button.disabled = true;
+    const response = await apiFetch(
+      `/api/chat/cursor/${button.dataset.cursor}/${button.dataset.page}`
+    );
+    if (!response) return;
+    const page = await response.json();
+    if (page.type === "error") {
+      button.outerHTML = `<p class="text-red-500 text-[11px]">${escapeHtml(page.data)}</p>`;
+      return;
+    }
+    const table = button.previousElementSibling.querySelector("table");
+    const headers = Array.from(table.querySelectorAll("th")).map((th) => th.textContent);
+    table.tBodies[0].insertAdjacentHTML("beforeend", renderRows(page, headers));
+    if (page.next) {
+      const shown = table.tBodies[0].rows.length;
+      button.dataset.page = page.next;
+      button.textContent = button.textContent.replace(/\(\d+ of/, `(${shown} of`);
+      button.disabled = false;
+    } else {
+      button.remove();
+    }
   }
 
-  async function sendMessage() {
+  // Downloads of the full (unsliced) result, streamed by /api/export
+  function exportLinks(question) {
+    const base = `/api/export?query=${encodeURIComponent(question)}`;
+    return `<p class="mt-2 text-[10px] text-slate-500">Download all rows: <a class="text-sky-600 underline" href="${base}&format=csv">CSV</a> · <a class="text-sky-600 underline" href="${base}&format=csv&gzip=1">CSV (gzip)</a> · <a class="text-sky-600 underline" href="${base}&format=ndjson">NDJSON</a></p>`;
+  }
+
+  function escapeHtml(text) {
+    const div = document.createElement("div");
+    div.textContent = text;
+    return div.innerHTML;
+  }
+
+  // `extra` is merged into the request body (e.g. { confirm: true })
+  async function sendMessage(question, extra = {}) {
     // --- ADDED THIS CONSOLE.LOG ---
     // console.log("sendMessage function called");
 
-    const value = chatInput.value.trim();
+    let value = typeof question === "string" ? question : chatInput.value.trim();
     if (!value) return;
-    appendBubble(value, "user");
-    chatInput.value = "";
+    if (typeof question !== "string") {
+      appendBubble(value, "user");
+      chatInput.value = "";
+    }
+    // "/explain <question>" shows the query plan instead of running it
+    const body = { query: value, resultFormat: "columnar", ...extra };
+    if (value.startsWith("/explain ")) {
+      body.query = value.slice("/explain ".length).trim();
+      body.explain = true;
+    }
     setButtonLoading(chatSend, true);
     const typingEl = document.createElement("div");
     typingEl.className = "flex justify-start";
@@ -690,7 +748,7 @@ document.addEventListener("DOMContentLoaded", () => {
       const response = await apiFetch("/api/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ query: value }),
+        body: JSON.stringify(body),
       });
       if (!response) {
         chatThread.removeChild(typingEl);
@@ -709,8 +767,8 @@ document.addEventListener("DOMContentLoaded", () => {
           break;
         case "table":
           htmlResponse = `<p class="text-[11px] text-slate-500 mb-2">Here are the results:</p>${renderTable(
-            result.data
-          )}`;
+            result
+          )}${exportLinks(body.query)}`;
           break;
         case "count":
           htmlResponse = `The result is: <b class="text-sky-600">${result.data}</b>`;
@@ -721,6 +779,12 @@ document.addEventListener("DOMContentLoaded", () => {
         case "error":
           htmlResponse = `<p class="font-medium text-red-600">Error:</p><p class="text-red-500 text-[11px]">${result.data}</p>`;
           break;
+        case "explain":
+          htmlResponse = `<p class="text-[11px] text-slate-500 mb-2">Query plan (not executed):</p><pre class="text-[10px] bg-slate-100 p-2 rounded-md overflow-x-auto">${escapeHtml(result.data)}</pre>`;
+          break;
+        case "confirm":
+          htmlResponse = `<p class="text-[11px] text-amber-600 mb-2">${escapeHtml(result.data)}</p><pre class="text-[10px] bg-slate-100 p-2 rounded-md overflow-x-auto">${escapeHtml(result.plan)}</pre><button class="confirm-run mt-2 text-[11px] px-2 py-1 rounded-md bg-sky-600 text-white" data-query="${escapeHtml(body.query)}">Run anyway</button>`;
+          break;
       }
       if (result.query) {
         htmlResponse += `<details class="mt-2"><summary class="text-[10px] text-slate-400 cursor-pointer">Show code</summary><code class="block text-[10px] bg-slate-100 p-1.5 rounded-md mt-1">${result.query}</code></details>`;
@@ -739,7 +803,20 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
-  if (chatSend) chatSend.addEventListener("click", sendMessage);
+  if (chatSend) chatSend.addEventListener("click", () => sendMessage());
+
+  document.addEventListener("click", (e) => {
+    const button = e.target.closest(".load-page");
+    if (button) loadPage(button);
+  });
+
+  // "Run anyway" on queries held back by the cost limit
+  document.addEventListener("click", (e) => {
+    const button = e.target.closest(".confirm-run");
+    if (!button) return;
+    button.disabled = true;
+    sendMessage(button.dataset.query, { confirm: true });
+  });
 
   if (chatInput)
     chatInput.addEventListener("keydown", (e) => {
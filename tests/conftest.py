@@ -0,0 +1,98 @@
+import io
+import itertools
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Config reads the environment on import: point the app at a throwaway
+# database and directories before anything imports it
+_TMP = tempfile.mkdtemp(prefix="aistora-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ["SECRET_KEY"] = "test"
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["EXECUTOR_PROCESSES"] = "1"
+for _name, _dir in (("UPLOAD_FOLDER", "uploads"), ("METRICS_DIR", "metrics"), ("CURSOR_DIR", "cursors"),
+                    ("CHART_DIR", "charts"), ("EXECUTOR_CANCEL_DIR", "cancel"),
+                    ("SEGMENT_DIR", "segments")):
+    os.environ[_name] = os.path.join(_TMP, _dir)
+
+CUSTOMERS = "customer_id,name,country\n" + "".join(
+    f"{i},C{i},{['US', 'UK', 'DE'][i % 3]}\n" for i in range(1, 31))
+ORDERS = "order_id,customer_id,total_amount,order_date\n" + "".join(
+    f"{i},{i % 30 + 1},{i * 1.5},2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}\n" for i in range(1, 301))
+
+
+@pytest.fixture
+def temp_csv(tmp_path):
+    """Writes CSV content to a new file in the test's temporary directory and returns its path."""
+    numbers = itertools.count()
+
+    def temp_csv(content, name=None):
+        path = tmp_path / (name or f"data{next(numbers)}.csv")
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+    return temp_csv
+
+
+@pytest.fixture
+def rewrite_same_size():
+    """Replaces text in a file with text as long, keeping its size but not its mtime."""
+    def rewrite_same_size(path, old, new):
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        assert len(old) == len(new) and old in content
+        stat = os.stat(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content.replace(old, new))
+        # One second later, so the change shows on coarse mtime clocks too
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert os.path.getsize(path) == stat.st_size
+    return rewrite_same_size
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def client(app, tmp_path, monkeypatch):
+    """A logged-in user with a selected database holding customers and orders (300 rows)."""
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    c = app.test_client()
+    email = f"{uuid.uuid4().hex}@example.com"
+    c.post("/api/register", json={"email": email, "password": "p"})
+    c.post("/api/login", json={"email": email, "password": "p"})
+    c.project_id = c.post("/api/databases", json={"name": "d"}).get_json()["database"]["id"]
+    c.post("/api/databases/select", json={"id": c.project_id})
+    response = c.post("/api/upload", content_type="multipart/form-data", data={"files": [
+        (io.BytesIO(CUSTOMERS.encode()), "customers.csv"),
+        (io.BytesIO(ORDERS.encode()), "orders.csv"),
+    ]})
+    assert response.get_json()["success"]
+    return c
+
+
+@pytest.fixture
+def plant(app, client):
+    """Puts a question's generated code in the plan cache, as if the model had answered it."""
+    from services.plan_cache import plan_cache, schema_fingerprint
+
+    def plant(question, code):
+        schema = client.get("/api/schema").get_json()
+        with app.app_context():
+            plan_cache.put("chat", schema_fingerprint(schema["schema"], schema["relationships"]),
+                           question, {"isCode": True, "content": code})
+    return plant
+
+
+@pytest.fixture
+def ask(client, plant):
+    """Asks a question whose generated code is already in the plan cache (no model call)."""
+    def ask(question, code, **options):
+        plant(question, code)
+        return client.post("/api/chat", json=dict(query=question, **options))
+    return ask
@@ -0,0 +1,74 @@
+import os
+import pytest
+from engine.dataframe import DataFrame
+from engine import indexes, rollups, zone_maps
+
+
+def month_csv(tmp_path, name, month, first_id, n=120, trailing_newline=True):
+    lines = ["order_id,customer_id,country,order_date,amount"]
+    for i in range(first_id, first_id + n):
+        lines.append(f"{i},{i % 15},{['US', 'DE', 'FR'][i % 3]},2024-{month:02d}-{i % 28 + 1:02d},{i % 40}.5")
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + ("\n" if trailing_newline else ""))
+    return str(path)
+
+
+def ingest(path):
+    df = DataFrame(path)
+    stats = df.compute_stats(zone_map=True,
+                             rollups_to_build=rollups.choose(df.header, df.column_types, "auto"))
+    df.stats = stats
+    indexes.create_indexes(df.parser, ["order_id"])
+    return df
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(zone_maps, "BLOCK_ROWS", 50)
+
+
+def test_append_extends_stats_and_sidecars(tmp_path, small_blocks):
+    table = ingest(month_csv(tmp_path, "orders.csv", 1, 0, trailing_newline=False))
+    stats = table.append_csv(month_csv(tmp_path, "feb.csv", 2, 120))
+
+    assert stats["row_count"] == len(table) == 240
+    assert stats["columns"]["order_id"]["max"] == 239
+    assert stats["columns"]["order_id"]["sorted"] == "asc"
+    assert stats["columns"]["country"]["distinct"] == 3
+    assert table.current_stats() is stats
+
+    # Same answers as ingesting the whole file at once
+    with open(table.filepath, encoding="utf-8") as f:
+        whole = tmp_path / "whole.csv"
+        whole.write_text(f.read())
+    reference = DataFrame(str(whole))
+    assert table.filter(lambda row: row["order_id"] >= 230,
+                        predicates=[("order_id", ">=", 230)]).data == \
+        reference.filter(lambda row: row["order_id"] >= 230).data
+    assert len(zone_maps.load(table.filepath)) == 6
+    assert indexes.load(table.filepath, "order_id").count([5, 125]) == 2
+
+    by_month = table.aggregate(table.groupby("order_date", "month"), {"amount": "sum"})
+    assert by_month == reference.aggregate(reference.groupby("order_date", "month"), {"amount": "sum"})
+    assert rollups.load(table.filepath) is not None
+
+
+def test_append_rejects_other_columns(tmp_path):
+    table = ingest(month_csv(tmp_path, "orders.csv", 1, 0))
+    other = tmp_path / "other.csv"
+    other.write_text("order_id,total\n1,2\n")
+    with pytest.raises(ValueError):
+        table.append_csv(str(other))
+    assert len(DataFrame(table.filepath)) == 120
+
+
+def test_append_without_current_stats_analyzes_whole_table(tmp_path):
+    path = month_csv(tmp_path, "orders.csv", 1, 0)
+    table = ingest(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("999,1,US,2024-01-01,1.5\n")  # changed behind the stats' back
+
+    stats = table.append_csv(month_csv(tmp_path, "feb.csv", 2, 120))
+    assert stats["row_count"] == 241
+    assert stats["bytes"] == os.path.getsize(path)
+    assert indexes.load(path, "order_id").count([999]) == 1
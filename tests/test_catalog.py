@@ -0,0 +1,111 @@
+import io
+import uuid
+
+import pytest
+from config import Config
+from extensions import db
+from models import Project, Table, User
+from services import catalog, schema_store
+
+
+@pytest.fixture
+def owner(app):
+    """A user with two projects: one with tables a and b, one empty."""
+    with app.app_context():
+        user = User(email=f"{uuid.uuid4().hex}@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        full, empty = Project(name="full", user_id=user.id), Project(name="empty", user_id=user.id)
+        db.session.add_all([full, empty])
+        db.session.flush()
+        for name in ("a", "b"):
+            db.session.add(Table(name=name, filename=f"{name}.csv", filepath=f"/data/{name}.csv",
+                                 columns_schema={"x": "int"}, row_count=3, project_id=full.id))
+        db.session.commit()
+        ids = user.id, full.id, empty.id
+    yield ids
+    catalog.forget()
+    schema_store.forget()
+
+
+def test_projects_with_table_counts(app, owner):
+    user_id, full, empty = owner
+    with app.app_context():
+        assert catalog.projects(user_id) == [
+            {"id": full, "name": "full", "table_count": 2},
+            {"id": empty, "name": "empty", "table_count": 0},
+        ]
+        assert catalog.projects(-1) == []
+
+
+def test_table_if_owner(app, owner):
+    user_id, full, _ = owner
+    with app.app_context():
+        table = Table.query.filter_by(project_id=full, name="a").one()
+        assert catalog.table_if_owner(table.id, user_id).name == "a"
+
+        other = User(email=f"{uuid.uuid4().hex}@example.com", password_hash="x")
+        db.session.add(other)
+        db.session.commit()
+        assert catalog.table_if_owner(table.id, other.id) is None
+        assert catalog.table_if_owner(-1, user_id) is None
+
+
+def test_table_meta_follows_the_schema_version(app, owner):
+    _, full, _ = owner
+    with app.test_request_context():
+        meta = catalog.table_meta(full)
+        assert meta["a"] == {"filepath": "/data/a.csv", "types": {"x": "int"}, "row_count": 3, "stats": None}
+        assert catalog.table_meta(full) is meta  # cached
+
+    with app.test_request_context():
+        table = Table.query.filter_by(project_id=full, name="b").one()
+        table.row_count = 10
+        db.session.commit()
+        assert catalog.table_meta(full) is meta  # same schema version
+        schema_store.refresh(full)
+    with app.test_request_context():
+        assert catalog.table_meta(full)["b"]["row_count"] == 10
+
+    with app.test_request_context():
+        meta = catalog.table_meta(full)
+        catalog.forget(full)
+        assert full not in catalog._table_meta
+        assert catalog.table_meta(full) == meta and catalog.table_meta(full) is not meta
+
+
+def test_table_meta_keeps_the_most_recently_used_projects(app, owner, monkeypatch):
+    _, full, empty = owner
+    monkeypatch.setattr(Config, "SCHEMA_CACHE_MAX_PROJECTS", 1)
+    catalog.forget()
+    with app.test_request_context():
+        catalog.table_meta(full)
+        catalog.table_meta(empty)
+        assert list(catalog._table_meta) == [empty]
+
+
+def test_reupload_replaces_the_table(app, client):
+    rows = "order_id,customer_id,total_amount,order_date\n1,1,9.5,2024-01-01\n2,2,3.0,2024-01-02\n"
+    response = client.post("/api/upload", content_type="multipart/form-data", data={"files": [
+        (io.BytesIO(rows.encode()), "orders.csv"),
+    ]})
+    assert response.get_json()["success"]
+
+    with app.test_request_context():
+        tables = Table.query.filter_by(project_id=client.project_id, name="orders").all()
+        assert len(tables) == 1
+        assert tables[0].row_count == 2
+        assert tables[0].column_stats["row_count"] == 2
+        assert catalog.table_meta(client.project_id)["orders"]["row_count"] == 2
+
+
+def test_table_meta_prefers_the_newest_duplicate(app, owner):
+    _, full, _ = owner
+    with app.app_context():
+        db.session.add(Table(name="a", filename="a.csv", filepath="/data/a-new.csv",
+                             columns_schema={"x": "int"}, row_count=7, project_id=full))
+        db.session.commit()
+    with app.test_request_context():
+        schema_store.refresh(full)
+        assert catalog.table_meta(full)["a"]["filepath"] == "/data/a-new.csv"
+        assert schema_store.build_tables(full)["a"]["row_count"] == 7
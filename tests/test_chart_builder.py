@@ -0,0 +1,90 @@
+import io
+import xml.etree.ElementTree as ET
+
+from config import Config
+from services import chart_builder
+from services.chart_builder import downsample, lttb, render_svg, top_n
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    points = [(i, 0.0) for i in range(100)]
+    points[37] = (37, 50.0)
+    points[81] = (81, -20.0)
+    sampled = lttb(points, 10)
+    assert len(sampled) == 10
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert (37, 50.0) in sampled and (81, -20.0) in sampled
+    assert [x for x, _ in sampled] == sorted(x for x, _ in sampled)
+    assert lttb(points[:5], 10) == points[:5]
+
+
+def test_top_n_sums_the_rest_into_other():
+    labels, values = top_n(["a", "b", "c", "d", "e"], [5, 1, 9, 3, 2], 3)
+    assert labels == ["a", "c", "Other (3)"]
+    assert values == [5, 9, 6]
+    assert top_n(["a", "b"], [1, 2], 3) == (["a", "b"], [1, 2])
+
+
+def test_downsample_by_chart_type(monkeypatch):
+    monkeypatch.setattr(Config, "CHART_MAX_POINTS", 20)
+    monkeypatch.setattr(Config, "CHART_MAX_CATEGORIES", 15)
+    labels = [f"g{i}" for i in range(100)]
+    values = [float(i % 17) for i in range(100)]
+
+    line_labels, line_values = downsample("line", labels, values)
+    assert len(line_labels) == len(line_values) == 20
+    assert line_labels[0] == "g0" and line_labels[-1] == "g99"
+
+    bar_labels, bar_values = downsample("bar", labels, values)
+    assert len(bar_labels) == 15 and bar_labels[-1] == "Other (86)"
+    assert sum(bar_values) == sum(values)
+
+    pie_labels, _ = downsample("pie", labels, values)
+    assert len(pie_labels) == len(chart_builder._COLORS)
+
+
+def test_render_svg():
+    bar = ET.fromstring(render_svg("Sales <2024>", "bar", ["a", "b", "c"], [1.0, -2.0, 3.0], "total"))
+    assert bar.tag == f"{SVG}svg"
+    assert [t.text for t in bar.iter(f"{SVG}text")][0] == "Sales <2024>"
+    bars = [r for r in bar.iter(f"{SVG}rect") if r.find(f"{SVG}title") is not None]
+    assert [r.find(f"{SVG}title").text for r in bars] == ["a: 1", "b: -2", "c: 3"]
+
+    line = ET.fromstring(render_svg("t", "line", ["a", "b", "c"], [1.0, 2.0, 3.0], "total"))
+    assert len(line.find(f"{SVG}polyline").get("points").split()) == 3
+
+    pie = ET.fromstring(render_svg("t", "doughnut", ["a", "b"], [1.0, 3.0], "total"))
+    assert len(list(pie.iter(f"{SVG}path"))) == 2
+
+
+def test_groups_without_a_value_are_left_out(app):
+    with app.app_context():
+        url = chart_builder.build_chart_url("t", "bar", {"a": {"total": 1}, "b": {"total": None}, "c": {"total": 2}})
+    svg = ET.parse(chart_builder.chart_path(url[len(chart_builder.LOCAL_PREFIX):-4])).getroot()
+    titles = [t.text for t in svg.iter(f"{SVG}title")]
+    assert titles == ["a: 1", "c: 2"]
+    assert "total (1 without a value left out)" in [t.text for t in svg.iter(f"{SVG}text")]
+    assert chart_builder.build_chart_url("t", "bar", {"a": {"total": None}}) is None
+
+
+def test_chart_is_served_again_without_running_the_query(client, ask, monkeypatch):
+    code = "build_chart_url('Sales', 'bar', orders.aggregate(orders.groupby('customer_id'), {'total_amount': 'sum'}))"
+    first = ask("sales chart", code).get_json()
+    assert first["type"] == "chart" and first["data"].startswith("/api/charts/")
+    assert client.get(first["data"]).mimetype == "image/svg+xml"
+
+    def not_run(*args, **kwargs):
+        raise AssertionError("the query ran again")
+    monkeypatch.setattr("routes.chat.get_executor", not_run)
+    monkeypatch.setattr("routes.chat.secure_eval", not_run)
+    assert client.post("/api/chat", json={"query": "sales chart"}).get_json() == first
+
+    monkeypatch.undo()
+    more = "order_id,customer_id,total_amount,order_date\n301,1,1000.0,2024-01-01\n"
+    response = client.post("/api/upload", content_type="multipart/form-data",
+                           data={"mode": "append", "files": [(io.BytesIO(more.encode()), "orders.csv")]})
+    assert response.get_json()["success"]
+    second = client.post("/api/chat", json={"query": "sales chart"}).get_json()
+    assert second["type"] == "chart" and second["data"] != first["data"]
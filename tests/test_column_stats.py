@@ -0,0 +1,89 @@
+import os
+from engine.dataframe import DataFrame
+from engine.column_stats import collect_stats, may_match, selectivity
+from engine.planner import annotate
+
+
+def test_collect_stats_per_column():
+    rows = [{"id": i, "country": "US" if i % 3 else "DE", "total": None if i == 4 else i * 1.5}
+            for i in range(1, 11)]
+    stats = collect_stats(rows, ["id", "country", "total"],
+                          {"id": "int", "country": "str", "total": "float"})
+
+    assert stats["row_count"] == 10
+    ids = stats["columns"]["id"]
+    assert (ids["min"], ids["max"], ids["distinct"], ids["sorted"]) == (1, 10, 10, "asc")
+    country = stats["columns"]["country"]
+    assert country["distinct"] == 2
+    assert country["sorted"] is None
+    assert country["top"][0] == ["US", 7]
+    total = stats["columns"]["total"]
+    assert total["nulls"] == 1
+    assert total["max"] == 15.0
+    assert total["histogram"][0] == 1.5 and total["histogram"][-1] == 15.0
+
+
+def test_may_match_and_selectivity():
+    col = {"nulls": 0, "min": 10, "max": 20, "distinct": 11, "histogram": [10, 15, 20], "top": []}
+    assert not may_match(col, 100, ">", 20)
+    assert may_match(col, 100, ">=", 20)
+    assert not may_match(col, 100, "in", [1, 2, 30])
+    assert may_match(col, 100, "==", "10")  # not comparable: unknown
+    assert selectivity(col, 100, "<", 15) == 0.5
+    assert abs(selectivity(col, 100, "==", 12) - 1 / 11) < 1e-9
+
+
+def test_filter_skips_scan_when_stats_rule_out_matches(temp_csv):
+    path = temp_csv("id,total\n1,5\n2,7\n3,9\n")
+    df = DataFrame(path)
+    df = DataFrame(path, stats=df.compute_stats())
+    assert len(df) == 3
+
+    # The lambda would fail on every row, so an empty result proves it never ran
+    def explode(row):
+        raise AssertionError("scanned")
+    assert df.filter(explode, predicates=[("total", ">", 100)]).data == []
+    assert df.filter(lambda row: row["total"] > 6, predicates=[("total", ">", 6)]).data == [
+        {"id": 2, "total": 7}, {"id": 3, "total": 9}
+    ]
+
+    # Stats of a changed file are ignored
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("4,500\n")
+    assert df.current_stats() is None
+    assert df.filter(lambda row: row["total"] > 100, predicates=[("total", ">", 100)]).data == [
+        {"id": 4, "total": 500}
+    ]
+
+
+def test_join_builds_smaller_left_side_with_same_result():
+    left = DataFrame([{"k": 1, "a": "x"}, {"k": 2, "a": "y"}, {"k": 1, "a": "z"}])
+    right = DataFrame([{"k": i % 3, "b": i} for i in range(20)])
+
+    joined = left.join(right, "k", "k")
+    expected = left._join_build_left(right, "k", "k", "joined")
+    assert joined.data == expected.data
+    assert [(row["a"], row["b"]) for row in joined.data[:3]] == [("x", 1), ("x", 4), ("x", 7)]
+
+
+def test_annotate_adds_filter_predicates():
+    code = annotate("t.filter(lambda row: float(row['total']) > 3 and row['c'] == 'US').project(['c'])")
+    assert "predicates=[('total', '>', 3), ('c', '==', 'US')]" in code
+    assert annotate("t.filter(lambda row: int(row['x']) > 3)") == "t.filter(lambda row: int(row['x']) > 3)"
+
+
+def test_stats_of_a_same_size_rewrite_are_not_current(temp_csv, rewrite_same_size):
+    path = temp_csv("id,amount\n1,10\n2,20\n3,30\n")
+    df = DataFrame(path)
+    df.stats = df.compute_stats()
+    assert df.stats["mtime_ns"] == os.stat(path).st_mtime_ns
+    assert df.current_stats() is df.stats
+
+    rewrite_same_size(path, "30", "90")
+    assert df.current_stats() is None
+    assert df.filter(lambda row: row["amount"] > 50, predicates=[("amount", ">", 50)]).data == [
+        {"id": 3, "amount": 90}
+    ]
+    # Statistics recorded without a modification time cannot be trusted either
+    df.stats = dict(df.compute_stats(), mtime_ns=None)
+    assert df.current_stats() is None
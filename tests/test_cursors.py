@@ -0,0 +1,69 @@
+import json
+
+from config import Config
+from services import cursors
+
+
+def test_pages_are_written_in_the_background(app, monkeypatch):
+    rows = [{"i": i} for i in range(25)]
+    cursor_id = cursors.create(1, rows, "rows", 10)
+    page = json.loads(cursors.read_page(1, cursor_id, 2))
+    assert page == {"type": "page", "page": 2, "pages": 4, "next": 3, "data": rows[:10]}
+    page = json.loads(cursors.read_page(1, cursor_id, 4))
+    assert page["data"] == rows[20:] and page["next"] is None
+
+    assert cursors.read_page(1, cursor_id, 1) is None  # answered with the chat response
+    assert cursors.read_page(1, cursor_id, 5) is None
+    assert cursors.read_page(2, cursor_id, 2) is None  # another user's cursor
+    assert cursors.read_page(1, "../" + cursor_id, 2) is None
+
+    monkeypatch.setattr(Config, "CURSOR_TTL", -1)
+    assert cursors.read_page(1, cursor_id, 2) is None
+
+
+def test_unwritten_page_is_waited_for(app, monkeypatch):
+    started = []
+    write_pages = cursors._write_pages
+
+    def slow_write_pages(*args):
+        started.append(True)
+        import time
+        time.sleep(0.3)
+        write_pages(*args)
+    monkeypatch.setattr(cursors, "_write_pages", slow_write_pages)
+    cursor_id = cursors.create(1, list(range(5)), "columnar", 2)
+    assert json.loads(cursors.read_page(1, cursor_id, 3))["data"] == [[2], [3]]
+
+    monkeypatch.setattr(Config, "CURSOR_WAIT", 0)
+    cursor_id = cursors.create(1, list(range(5)), "columnar", 2)
+    assert cursors.read_page(1, cursor_id, 2) is None
+    assert len(started) == 2
+
+
+def test_cursor_route(client, ask, monkeypatch):
+    monkeypatch.setattr(Config, "RESULT_PAGE_ROWS", 120)
+    body = ask("all orders", "orders.project(['order_id'])", resultFormat="columnar").get_json()
+    assert body["format"] == "columnar" and body["columns"] == ["order_id"]
+    assert len(body["data"]) == 120 and "totalRows" not in body
+    cursor = body["cursor"]
+    assert cursor["rows"] == 300 and cursor["pages"] == 3 and cursor["next"] == 2
+
+    page = client.get(f"/api/chat/cursor/{cursor['id']}/2").get_json()
+    assert page["data"][0] == [121] and page["next"] == 3
+    page = client.get(f"/api/chat/cursor/{cursor['id']}/3").get_json()
+    assert len(page["data"]) == 60 and page["next"] is None
+
+    for number in (1, 4):
+        response = client.get(f"/api/chat/cursor/{cursor['id']}/{number}")
+        assert response.status_code == 404 and response.get_json()["type"] == "error"
+
+
+def test_cursor_keeps_at_most_cursor_max_rows(client, ask, monkeypatch):
+    monkeypatch.setattr(Config, "RESULT_PAGE_ROWS", 100)
+    monkeypatch.setattr(Config, "CURSOR_MAX_ROWS", 250)
+    body = ask("every order", "orders.project(['order_id'])").get_json()
+    assert body["totalRows"] == 300
+    assert body["cursor"]["rows"] == 250 and body["cursor"]["pages"] == 3
+    page = client.get(f"/api/chat/cursor/{body['cursor']['id']}/3").get_json()
+    assert page["data"][-1] == {"order_id": 250}
+    assert client.get(f"/api/chat/cursor/{body['cursor']['id']}/4").status_code == 404
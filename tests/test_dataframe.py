@@ -1,5 +1,7 @@
+import threading
 import pytest
 from engine.dataframe import DataFrame
+from engine import execution
 
 
 def test_header_and_length():
@@ -84,3 +86,137 @@ def test_infer_types():
     assert types["a"] == "int"
     assert types["b"] == "float"
     assert types["c"] == "str"
+
+
+def test_cancel_check_stops_scan():
+    df = DataFrame([{"id": i} for i in range(10)])
+
+    execution.set_cancel_check(lambda: True)
+    try:
+        with pytest.raises(execution.QueryCancelled):
+            df.filter(lambda r: True)
+    finally:
+        execution.set_cancel_check(None)
+
+    assert len(df.filter(lambda r: True)) == 10
+
+
+def test_cancel_check_stays_in_its_thread():
+    df = DataFrame([{"id": i} for i in range(10)])
+    installed = threading.Event()
+    finished = threading.Event()
+
+    def cancelled_query():
+        execution.set_cancel_check(lambda: True)
+        installed.set()
+        finished.wait(5)
+
+    thread = threading.Thread(target=cancelled_query)
+    thread.start()
+    try:
+        installed.wait(5)
+        # Another thread's check must not stop this query
+        assert len(df.filter(lambda r: True)) == 10
+    finally:
+        finished.set()
+        thread.join()
+
+
+def test_join_scan_keeps_only_matching_keys(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,customer_id\n" + "".join(f"{i},{i % 50}\n" for i in range(500)))
+    orders = DataFrame(str(path))
+    customers = DataFrame([{"customer_id": 7, "name": "A"}, {"customer_id": 42, "name": "B"}])
+
+    expected = DataFrame(list(orders._get_data())).join(customers, "customer_id", "customer_id").data
+    assert orders.join(customers, "customer_id", "customer_id").data == expected
+    assert len(list(orders._get_data(("customer_id", {7, 42})))) == 20
+
+
+def test_groupby_several_columns():
+    df = DataFrame([
+        {"country": "US", "order_date": "2024-01-03", "amount": 10},
+        {"country": "DE", "order_date": "2024-01-09", "amount": 5},
+        {"country": "US", "order_date": "2024-01-20", "amount": 1},
+        {"country": "US", "order_date": "2024-02-01", "amount": 2},
+        {"country": None, "order_date": "2024-02-01", "amount": 7},
+    ])
+
+    by_day = df.groupby(["country", "order_date"])
+    assert len(by_day) == 4
+    by_month = df.aggregate(df.groupby(["country", "order_date"], bucket="month"), {"amount": "sum"})
+    assert by_month == {("US", "2024-01"): {"amount": 11}, ("DE", "2024-01"): {"amount": 5},
+                        ("US", "2024-02"): {"amount": 2}}
+    assert df.aggregate(df.groupby(["country"]), {"amount": "count"}) == \
+        df.aggregate(df.groupby("country"), {"amount": "count"})
+
+
+def test_join_on_composite_key(tmp_path):
+    path = tmp_path / "lines.csv"
+    path.write_text("invoice_id,line_no,sku\n" +
+                    "".join(f"{i // 3},{i % 3},S{i}\n" for i in range(300)))
+    lines = DataFrame(str(path))
+    returns = DataFrame([{"invoice_id": 4, "line_no": 2, "qty": 1},
+                         {"invoice_id": 4, "line_no": 0, "qty": 3},
+                         {"invoice_id": 2, "line_no": 7, "qty": 9}])
+
+    joined = lines.join(returns, ["invoice_id", "line_no"], ["invoice_id", "line_no"])
+    assert [(row["sku"], row["qty"]) for row in joined.data] == [("S12", 3), ("S14", 1)]
+    # The small side on the left hashes the left side instead; same rows
+    assert returns.join(lines, ["invoice_id", "line_no"], ["invoice_id", "line_no"]).data == [
+        {"invoice_id": 4, "line_no": 2, "qty": 1, "sku": "S14"},
+        {"invoice_id": 4, "line_no": 0, "qty": 3, "sku": "S12"},
+    ]
+    with pytest.raises(ValueError):
+        lines.join(returns, ["invoice_id", "line_no"], "invoice_id")
+
+
+def test_pivot_builds_grid():
+    df = DataFrame([
+        {"customer": "ann", "order_date": "2024-02-10", "amount": 5},
+        {"customer": "bob", "order_date": "2024-01-03", "amount": 7},
+        {"customer": "ann", "order_date": "2024-01-20", "amount": 1},
+        {"customer": "ann", "order_date": "2024-01-21", "amount": 2},
+        {"customer": None, "order_date": "2024-01-21", "amount": 2},
+    ])
+    grid = df.pivot("customer", "order_date", "amount", "sum", bucket="month")
+    assert grid == [
+        {"customer": "ann", "2024-01": 3.0, "2024-02": 5.0},
+        {"customer": "bob", "2024-01": 7.0, "2024-02": None},
+    ]
+    assert df.pivot("customer", "order_date", agg="count", bucket="year") == [
+        {"customer": "ann", "2024": 3}, {"customer": "bob", "2024": 1}
+    ]
+
+    with pytest.raises(ValueError):
+        df.pivot("customer", "order_date", "amount", max_columns=3)
+    with pytest.raises(ValueError):
+        df.pivot("customer", "order_date", "amount", agg="median")
+
+
+def test_iter_filter_streams_same_rows(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,amount\n" + "".join(f"{i},{i % 97}\n" for i in range(3000)))
+    df = DataFrame(str(path))
+    df.stats = df.compute_stats(zone_map=True)
+    predicates = [("order_id", ">=", 2900)]
+
+    rows = df.iter_filter(lambda row: row["order_id"] >= 2900 and row["amount"] > 50, predicates)
+    assert not isinstance(rows, list)
+    assert list(rows) == df.filter(lambda row: row["order_id"] >= 2900 and row["amount"] > 50).data
+    assert list(df.iter_filter(lambda row: True, [("order_id", ">", 5000)])) == []
+    assert sum(1 for _ in df.iter_rows()) == 3000
+
+
+def test_iter_join_streams_same_rows(tmp_path):
+    orders = tmp_path / "orders.csv"
+    orders.write_text("order_id,customer_id\n" + "".join(f"{i},{i % 13}\n" for i in range(500)))
+    customers = tmp_path / "customers.csv"
+    customers.write_text("customer_id,country\n" + "".join(f"{i},C{i % 3}\n" for i in range(0, 13, 2)))
+    left, right = DataFrame(str(orders)), DataFrame(str(customers))
+
+    rows = left.iter_join(right, "customer_id", "customer_id")
+    assert not isinstance(rows, list)
+    assert list(rows) == left.join(right, "customer_id", "customer_id").data
+    with pytest.raises(ValueError):
+        list(left.iter_join(right, ["customer_id", "order_id"], "customer_id"))
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+from config import Config
+from services.executor import QueryExecutor, QueryTimeout, QueryCancelled
+from services.state_manager import get_referenced_tables
+
+# Pure-Python work the engine never polls the cancel check in (no scan)
+BUSY = "sum(1 for a in '1' * 20000 for b in '1' * 20000)"
+# A scan slow enough to be stopped cooperatively between row batches
+SLOW_SCAN = "len(orders.filter(lambda row: sum(1 for c in '1' * 20000) > 0))"
+
+
+def orders_csv(tmp_path, rows=20000):
+    lines = ["order_id,customer_id,amount"]
+    lines += [f"{i},{i % 7},{i % 50}.5" for i in range(rows)]
+    path = tmp_path / "orders.csv"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SHARED_SEGMENTS", False)
+    pool = QueryExecutor(processes=1, timeout=1, cpu_limit=30,
+                         cancel_dir=str(tmp_path / "cancel"), grace=0.3)
+    yield pool
+    pool.shutdown()
+
+
+def specs_for(code, path):
+    tables = {"orders": {"filepath": path, "types": None}}
+    return {name: tables[name] for name in get_referenced_tables(code, tables)}
+
+
+def test_get_dataframe_by_name_reaches_the_executor(tmp_path, executor):
+    path = orders_csv(tmp_path, rows=10)
+    code = "len(get_dataframe('orders'))"
+    assert get_referenced_tables(code, ["orders", "customers"]) == ["orders"]
+    assert get_referenced_tables("len(get_dataframe(str('orders')))", ["orders", "customers"]) \
+        == ["orders", "customers"]
+
+    result, _ = executor.run(code, specs_for(code, path))
+    assert result == 10
+    result, _ = executor.run("len(orders)", specs_for("len(orders)", path))
+    assert result == 10
+
+
+def test_timeout_stops_a_scan(tmp_path, executor):
+    path = orders_csv(tmp_path)
+    started = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        executor.run(SLOW_SCAN, specs_for(SLOW_SCAN, path))
+    assert time.monotonic() - started < 5
+    # The same process answers the next query
+    assert executor.run("len(orders)", specs_for("len(orders)", path))[0] == 20000
+
+
+def test_cancel_marker_stops_a_query(tmp_path, executor):
+    path = orders_csv(tmp_path)
+    executor.timeout = 30
+    timer = threading.Timer(0.3, executor.cancel, args=("q1",))
+    timer.start()
+    try:
+        with pytest.raises(QueryCancelled):
+            executor.run(SLOW_SCAN, specs_for(SLOW_SCAN, path), query_id="q1")
+    finally:
+        timer.cancel()
+    assert not (tmp_path / "cancel" / "q1").exists()
+
+
+def test_unresponsive_executor_is_replaced(tmp_path, executor):
+    path = orders_csv(tmp_path, rows=10)
+    before = list(executor._all)
+    with pytest.raises(QueryTimeout):
+        executor.run(BUSY, {})
+    assert len(executor._all) == 1 and executor._all[0] is not before[0]
+    assert not before[0].process.is_alive()
+    assert executor.run("len(orders)", specs_for("len(orders)", path))[0] == 10
+
+
+def test_long_list_results_are_cut_to_max_rows(tmp_path, executor):
+    path = orders_csv(tmp_path, rows=50)
+    code = "orders.project(['order_id'])"
+    result, _ = executor.run(code, specs_for(code, path), max_rows=20)
+    assert len(result) == 20 and result.total == 50
+    assert len(executor.run(code, specs_for(code, path))[0]) == 50
+
+
+def test_waiting_for_a_busy_pool_counts_against_the_deadline(tmp_path, executor):
+    path = orders_csv(tmp_path, rows=10)
+    busy = executor._idle.get()  # as if another request held the only executor
+    try:
+        started = time.monotonic()
+        with pytest.raises(QueryTimeout):
+            executor.run("len(orders)", specs_for("len(orders)", path))
+        assert time.monotonic() - started < 3
+
+        executor.timeout = 30
+        timer = threading.Timer(0.3, executor.cancel, args=("q2",))
+        timer.start()
+        with pytest.raises(QueryCancelled):
+            executor.run("len(orders)", specs_for("len(orders)", path), query_id="q2")
+        assert not (tmp_path / "cancel" / "q2").exists()
+    finally:
+        executor._idle.put(busy)
+    assert executor.run("len(orders)", specs_for("len(orders)", path))[0] == 10
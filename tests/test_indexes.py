@@ -0,0 +1,121 @@
+import os
+from engine.dataframe import DataFrame
+from engine import indexes
+
+
+def test_index_lookup_and_range(temp_csv):
+    path = temp_csv("id,name\n" + "".join(f"{i % 50},n{i}\n" for i in range(200)))
+    df = DataFrame(path)
+    index = df.create_index("id")
+    assert indexes.indexed_columns(path) == ["id"]
+    assert index.count([3, 7]) == 8
+    rows = [row for row, _ in index.lookup([7, 3])]
+    assert rows == [3, 7, 53, 57, 103, 107, 153, 157]
+    assert index.range_count("<", 2) == 8
+    assert index.range_count(">=", 48) == 8
+
+    # Offsets point at the rows' lines
+    assert list(df.parser.parse_at([off for _, off in index.lookup([3])])) == [
+        {"id": 3, "name": f"n{i}"} for i in (3, 53, 103, 153)
+    ]
+
+    # The stored index is loaded back identically
+    indexes._cache.clear()
+    loaded = indexes.load(path, "id")
+    assert loaded.keys == index.keys and list(loaded.offsets) == list(index.offsets)
+
+
+def test_filter_uses_index_with_same_result(temp_csv):
+    path = temp_csv("id,total\n" + "".join(f"{i},{i * 3 % 7}\n" for i in range(1000)))
+    df = DataFrame(path)
+    expected = df.filter(lambda row: row["id"] in (5, 900) and row["total"] > 0).data
+    df.create_index("id")
+
+    scanned = []
+
+    def condition(row):
+        scanned.append(row["id"])
+        return row["id"] in (5, 900) and row["total"] > 0
+    result = df.filter(condition, predicates=[("id", "in", [5, 900]), ("total", ">", 0)])
+    assert result.data == expected
+    assert scanned == [5, 900]
+
+    # A predicate the index cannot order (str against an int column) scans
+    scanned.clear()
+    df.filter(condition, predicates=[("id", "==", "5")])
+    assert len(scanned) == 1000
+
+
+def test_index_join_matches_hash_join(temp_csv):
+    orders = temp_csv("order_id,customer_id,total\n"
+                             + "".join(f"{i},{i % 300},{i % 11}\n" for i in range(3000)))
+    customers = temp_csv("customer_id,country\n"
+                                + "".join(f"{i},{['US', 'DE'][i % 2]}\n" for i in range(300)))
+    orders_df, customers_df = DataFrame(orders), DataFrame(customers)
+    few = DataFrame([{"customer_id": 4, "tag": "a"}, {"customer_id": 299, "tag": "b"},
+                     {"customer_id": 4, "tag": "c"}])
+    expected_right = few.join(orders_df, "customer_id", "customer_id").data
+    expected_left = orders_df.join(few, "customer_id", "customer_id").data
+
+    orders_df.create_index("customer_id")
+    assert few._index_join(orders_df, "customer_id", "customer_id", orders) is not None
+    assert few.join(orders_df, "customer_id", "customer_id").data == expected_right
+    assert orders_df._index_join(few, "customer_id", "customer_id", "joined") is not None
+    assert orders_df.join(few, "customer_id", "customer_id").data == expected_left
+    assert len(expected_left) == 30
+
+    # A composite key probes the index of its first column
+    pairs = DataFrame([{"customer_id": 4, "total": 4}, {"customer_id": 299, "total": 0}])
+    expected_composite = [row for row in orders_df.join(pairs, "customer_id", "customer_id").data
+                          if row["total"] == row["joined.total"]]
+    composite = orders_df._index_join(pairs, ("customer_id", "total"), ("customer_id", "total"), "joined")
+    assert composite is not None
+    assert composite.data == [{k: v for k, v in row.items() if k != "joined.total"}
+                              for row in expected_composite]
+    assert len(composite.data) == 2
+
+    # Large on both sides: the hash join runs
+    assert orders_df._index_join(customers_df, "customer_id", "customer_id", customers) is None
+
+
+def test_extend_indexes_after_append(temp_csv):
+    path = temp_csv("id,name\n1,a\n2,b\n")
+    df = DataFrame(path)
+    df.create_index("id")
+    start = os.path.getsize(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("3,c\n2,d\n")
+    assert indexes.load(path, "id") is None  # stale until extended
+
+    indexes.extend_indexes(df.parser, start, first_row=2)
+    index = indexes.load(path, "id")
+    assert [row for row, _ in index.lookup([2])] == [1, 3]
+    assert list(df.parser.parse_at([off for _, off in index.lookup([2])])) == [
+        {"id": 2, "name": "b"}, {"id": 2, "name": "d"}
+    ]
+
+
+def test_stale_index_is_not_used(temp_csv):
+    path = temp_csv("id,name\n1,a\n2,b\n3,c\n")
+    df = DataFrame(path)
+    df.create_index("id")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("2,z\n")
+    assert df.filter(lambda row: row["id"] == 2, predicates=[("id", "==", 2)]).data == [
+        {"id": 2, "name": "b"}, {"id": 2, "name": "z"}
+    ]
+    assert indexes.key_columns({"row_count": 4, "columns": {
+        "id": {"nulls": 0, "distinct": 4}, "name": {"nulls": 0, "distinct": 2}}},
+        {"id": "int", "name": "str"}) == ["id"]
+
+
+def test_index_of_a_same_size_rewrite_is_not_used(temp_csv, rewrite_same_size):
+    path = temp_csv("id,name\n1,a\n2,b\n3,c\n")
+    df = DataFrame(path)
+    df.create_index("id")
+    assert indexes.load(path, "id") is not None
+    rewrite_same_size(path, "3,c", "7,c")
+    assert indexes.load(path, "id") is None
+    assert DataFrame(path).filter(lambda row: row["id"] == 7, predicates=[("id", "==", 7)]).data == [
+        {"id": 7, "name": "c"}
+    ]
@@ -0,0 +1,83 @@
+import random
+from engine.dataframe import DataFrame
+from engine.optimizer import optimize
+
+RELATIONSHIPS = [
+    {"from_table": "orders", "from_column": "customer_id", "to_table": "customers", "to_column": "customer_id"},
+    {"from_table": "orders", "from_column": "product_id", "to_table": "products", "to_column": "product_id"},
+]
+
+
+def make_tables():
+    rng = random.Random(7)
+    customers = [{"customer_id": i, "country": ["US", "DE", "FR", "IN"][i % 4]} for i in range(40)]
+    products = [{"product_id": i, "category": ["toys", "books"][i % 2]} for i in range(10)]
+    orders = [{"order_id": i, "customer_id": rng.randrange(40), "product_id": rng.randrange(10),
+               "total": float(rng.randrange(100))} for i in range(400)]
+    data = {"customers": customers, "products": products, "orders": orders}
+    tables = {name: {"row_count": len(rows), "bytes": 50 * len(rows),
+                     "types": {col: type(v).__name__ for col, v in rows[0].items()}}
+              for name, rows in data.items()}
+    return data, tables
+
+
+def run(code, data):
+    context = {name: DataFrame(rows) for name, rows in data.items()}
+    context["len"] = len
+    return eval(code, {"__builtins__": {}}, context)
+
+
+def test_filter_is_pushed_below_join_and_result_unchanged():
+    data, tables = make_tables()
+    code = ("customers.join(orders, 'customer_id', 'customer_id')"
+            ".filter(lambda row: row['country'] == 'US' and row['total'] > 50 and row['total'] > row['order_id'])"
+            ".project(['order_id', 'country'])[:50]")
+    optimized = optimize(code, tables, RELATIONSHIPS)
+
+    assert "customers.filter(lambda row: row['country'] == 'US', pushed=True)" in optimized
+    assert "orders.filter(lambda row: row['total'] > 50 and row['total'] > row['order_id'], pushed=True)" in optimized
+    assert run(optimized, data) == run(code, data)
+
+
+def test_pushed_filter_keeps_rows_whose_condition_raises():
+    df = DataFrame([{"a": None}, {"a": 5}, {"a": 1}])
+    assert df.filter(lambda row: row["a"] > 2, pushed=True).data == [{"a": None}, {"a": 5}]
+
+
+def test_join_column_filter_is_pushed_to_both_sides():
+    data, tables = make_tables()
+    code = ("len(orders.join(customers, 'customer_id', 'customer_id')"
+            ".filter(lambda row: row['customer_id'] < 5))")
+    optimized = optimize(code, tables, RELATIONSHIPS)
+    assert "orders.filter(lambda row: row['customer_id'] < 5, pushed=True)" in optimized
+    assert "customers.filter(lambda row: row['customer_id'] < 5, pushed=True)" in optimized
+    assert run(optimized, data) == run(code, data)
+
+
+def test_join_chain_is_reordered_when_order_is_not_observed():
+    data, tables = make_tables()
+    chain = ("products.join(orders, 'product_id', 'product_id')"
+             ".join(customers, 'customer_id', 'customer_id')"
+             ".filter(lambda row: row['country'] == 'US' and row['customer_id'] < 8)")
+
+    optimized = optimize(f"len({chain})", tables, RELATIONSHIPS)
+    assert optimized.startswith("len(orders.filter(lambda row: row['customer_id'] < 8, pushed=True)"
+                                ".join(customers.filter(")
+    assert run(optimized, data) == run(f"len({chain})", data)
+
+    # Groups come out in first-seen order: a grouped chain keeps its joins
+    grouped = f"{chain}.aggregate({chain}.groupby('product_id'), {{'total': 'sum'}})"
+    optimized = optimize(grouped, tables, RELATIONSHIPS)
+    assert optimized.startswith("products.aggregate(products.join(orders.filter(")
+    assert list(run(optimized, data)) == list(run(grouped, data))
+    assert run(optimized, data) == run(grouped, data)
+
+    # A limit observes the row order: the joins are left as written
+    limited = optimize(f"{chain}.project(['order_id'])[:5]", tables, RELATIONSHIPS)
+    assert limited.startswith("products.join(orders.filter(")
+
+
+def test_unsupported_code_is_returned_unchanged():
+    _, tables = make_tables()
+    for code in ("len(orders)", "orders.join(customers, 'customer_id', 'missing')", "not python ("):
+        assert optimize(code, tables, RELATIONSHIPS) == code
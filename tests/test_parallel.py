@@ -0,0 +1,120 @@
+import random
+import tempfile
+import threading
+import pytest
+from engine import parallel
+from engine.dataframe import DataFrame
+from engine.parser import CsvParser
+from engine.segments import SegmentStore
+
+
+@pytest.fixture
+def orders_csv(temp_csv):
+    rng = random.Random(7)
+    lines = ["order_id,customer_id,country,amount"]
+    for i in range(2000):
+        amount = "" if i % 50 == 0 else f"{rng.randint(1, 500)}.{rng.randint(0, 99):02d}"
+        lines.append(f"{i},{rng.randint(1, 40)},{rng.choice(['US', 'UK', 'DE'])},{amount}")
+    return temp_csv("\n".join(lines) + "\n")
+
+
+def rounded(value):
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {k: rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rounded(v) for v in value]
+    return value
+
+
+def run_queries(orders, customers):
+    return {
+        "len": len(orders),
+        "filter": orders.filter(lambda r: r["country"] == "UK").data,
+        "aggregate": orders.aggregate(
+            orders.groupby("customer_id"),
+            {"amount": "sum", "order_id": "count", "country": "min"},
+        ),
+        "avg": orders.aggregate(orders.groupby("country"), {"amount": "avg"}),
+        "max_by": orders.max_by("amount"),
+        "min_by": orders.min_by("amount"),
+        "top_k": orders.top_k_by("amount", 7),
+        "join": orders.join(customers, "customer_id", "customer_id").data,
+        "composite": orders.aggregate(orders.groupby(["country", "customer_id"]), {"amount": "sum"}),
+        "pivot": orders.pivot("customer_id", "country", "amount", "avg"),
+        "composite_join": orders.join(customers, ["customer_id", "country"],
+                                      ["customer_id", "country"]).data,
+    }
+
+
+def test_parallel_results_match_serial(orders_csv):
+    customers = DataFrame([{"customer_id": i, "name": f"C{i}", "country": ["US", "UK"][i % 4 // 2]}
+                           for i in range(1, 41, 2)])
+    orders = DataFrame(orders_csv)
+    serial = run_queries(orders, customers)
+
+    parallel.configure(workers=3, min_bytes=0)
+    try:
+        assert parallel.should_parallelize(orders)
+        partitioned = run_queries(orders, customers)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SegmentStore(tmp, budget_bytes=10 * 1024 * 1024)
+            shared = DataFrame(orders_csv, segment=store.acquire(CsvParser(orders_csv)))
+            from_segment = run_queries(shared, customers)
+    finally:
+        parallel.configure(workers=0, min_bytes=32 * 1024 * 1024)
+
+    # Partial sums are added in a different order, so compare rounded
+    assert rounded(partitioned) == rounded(serial)
+    assert rounded(from_segment) == rounded(serial)
+    # Group order is first appearance, independent of partitioning
+    assert list(partitioned["aggregate"]) == list(serial["aggregate"])
+
+
+def test_concurrent_threads_keep_their_own_jobs(orders_csv):
+    orders = DataFrame(orders_csv)
+    predicates = {
+        "UK": lambda r: r["country"] == "UK",
+        "big": lambda r: r["amount"] is not None and r["amount"] > 250,
+    }
+    expected = {name: orders.filter(pred).data for name, pred in predicates.items()}
+    results = {name: [] for name in predicates}
+    errors = []
+
+    def worker(name):
+        try:
+            for _ in range(5):
+                results[name].append(orders.filter(predicates[name]).data)
+        except Exception as exc:
+            errors.append(exc)
+
+    parallel.configure(workers=3, min_bytes=0)
+    try:
+        threads = [threading.Thread(target=worker, args=(name,)) for name in predicates]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        parallel.configure(workers=0, min_bytes=32 * 1024 * 1024)
+
+    assert errors == []
+    for name, runs in results.items():
+        assert len(runs) == 5
+        assert all(run == expected[name] for run in runs)
+
+
+def test_groupby_still_behaves_like_a_dict():
+    df = DataFrame([
+        {"dept": "HR", "salary": 100},
+        {"dept": "ENG", "salary": 300},
+        {"dept": "HR", "salary": 200},
+    ])
+    groups = df.groupby("dept")
+
+    assert list(groups.keys()) == ["HR", "ENG"]
+    assert [r["salary"] for r in groups["HR"]] == [100, 200]
+    # Aggregating a materialized GroupBy takes the row-list path
+    assert df.aggregate(groups, {"salary": "sum"}) == {"HR": {"salary": 300.0}, "ENG": {"salary": 300.0}}
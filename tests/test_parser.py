@@ -114,3 +114,62 @@ def test_skip_malformed_rows():
 def test_file_not_found():
     with pytest.raises(FileNotFoundError):
         CsvParser("missing_file.csv")
+
+
+def test_known_column_types_skip_inference():
+    """
+    Types passed in (e.g. stored at upload time) are used as-is;
+    columns missing from the mapping fall back to str.
+    """
+    csv = "id,score\n1,10\n2,20\n"
+    filepath = create_temp_csv(csv)
+
+    parser = CsvParser(filepath, column_types={"id": "int"})
+
+    assert parser.get_column_types() == {"id": "int", "score": "str"}
+    assert list(parser.parse())[0] == {"id": 1, "score": "10"}
+
+    os.remove(filepath)
+
+
+def test_byte_ranges_cover_every_row_once():
+    """
+    Splitting the file at arbitrary byte offsets must still yield every
+    row exactly once, in order, across consecutive parse_range() calls.
+    """
+    csv = "id,name\n" + "".join(f"{i},name{i}\n" for i in range(50))
+    filepath = create_temp_csv(csv)
+
+    parser = CsvParser(filepath)
+    expected = list(parser.parse())
+
+    for n in (1, 2, 3, 7, 16):
+        rows = []
+        for start, end in parser.byte_ranges(n):
+            rows.extend(parser.parse_range(start, end))
+        assert rows == expected
+
+    os.remove(filepath)
+
+
+def test_key_filter_drops_rows_before_casting():
+    """
+    A semi-join key filter yields only rows whose cast key is in the set,
+    and the other fields of dropped rows are never cast.
+    """
+    csv = "id,customer_id,total\n" + "".join(f"{i},{i % 10},{i}.5\n" for i in range(100))
+    filepath = create_temp_csv(csv)
+
+    parser = CsvParser(filepath)
+    expected = [row for row in parser.parse() if row["customer_id"] in (3, 7)]
+
+    casts = []
+    original = parser._cast_value
+    parser._cast_value = lambda col, value: casts.append(col) or original(col, value)
+    rows = list(parser.parse_range(parser.data_start(), key_filter=("customer_id", {3: [], 7: []})))
+
+    assert rows == expected
+    assert casts.count("total") == len(expected) == 20
+    assert casts.count("customer_id") == 100 + 20
+
+    os.remove(filepath)
@@ -0,0 +1,120 @@
+import pytest
+from engine import parallel, partitions
+from engine.dataframe import DataFrame
+
+
+def orders_csv(tmp_path, name="orders.csv", months=(1, 2, 3, 4, 5, 6), first_id=0, per_month=40):
+    lines = ["order_id,customer_id,order_date,amount"]
+    i = first_id
+    for day in range(per_month):
+        for month in months:  # months interleaved, as exports usually are not sorted
+            lines.append(f"{i},{i % 23},2024-{month:02d}-{day % 28 + 1:02d},{i % 50}.5")
+            i += 1
+    lines.append(f"{i},1,,3.5")  # no date: the null partition
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def by_id(rows):
+    return sorted(rows, key=lambda row: row["order_id"])
+
+
+def test_month_partitions_are_clustered_and_pruned(tmp_path):
+    path = orders_csv(tmp_path)
+    expected = DataFrame(path).filter(lambda row: (row["order_date"] or "") >= "2024-05").data
+    partition_map = partitions.partition_file(path, "order_date", "month")
+
+    assert [p["key"] for p in partition_map.partitions] == [
+        "2024-01", "2024-02", "2024-03", "2024-04", "2024-05", "2024-06", None
+    ]
+    df = DataFrame(path)
+    assert [row["order_date"][:7] for row in df.project(["order_date"])[:2]] == ["2024-01", "2024-01"]
+
+    seen = set()
+
+    def condition(row):
+        seen.add((row["order_date"] or "none")[:7])
+        return (row["order_date"] or "") >= "2024-05"
+    result = df.filter(condition, predicates=[("order_date", ">=", "2024-05")])
+    assert by_id(result.data) == by_id(expected)
+    assert seen == {"2024-05", "2024-06", "none"}
+
+
+def test_hash_partitions_prune_equality(tmp_path):
+    path = orders_csv(tmp_path)
+    expected = DataFrame(path).filter(lambda row: row["customer_id"] in (3, 7)).data
+    partition_map = partitions.partition_file(path, "customer_id", "hash", buckets=8)
+    df = DataFrame(path)
+
+    kept = partition_map.matching([("customer_id", "in", [3, 7])])
+    assert 1 <= len(kept) <= 2
+    assert partition_map.matching([("customer_id", ">", 3)]) == partition_map.partitions
+
+    scanned = []
+
+    def condition(row):
+        scanned.append(row["customer_id"])
+        return row["customer_id"] in (3, 7)
+    result = df.filter(condition, predicates=[("customer_id", "in", [3, 7])])
+    assert by_id(result.data) == by_id(expected)
+    assert len(scanned) < len(df) / 2
+
+
+def test_partitions_scan_in_parallel(tmp_path):
+    path = orders_csv(tmp_path)
+    partition_map = partitions.partition_file(path, "order_date", "month")
+    df = DataFrame(path)
+    predicates = [("order_date", ">=", "2024-03"), ("order_date", "<", "2024-05")]
+
+    def condition(row):
+        return "2024-03" <= (row["order_date"] or "") < "2024-05"
+    serial = df.filter(condition, predicates=predicates).data
+
+    parallel.configure(workers=2, min_bytes=0)
+    try:
+        # March, April and the null partition
+        assert [p["key"] for p in partition_map.matching(predicates)] == ["2024-03", "2024-04", None]
+        assert df._matching_blocks(predicates) == partition_map.scan_parts(partition_map.matching(predicates))
+        assert df.filter(condition, predicates=predicates).data == serial
+    finally:
+        parallel.configure(workers=0, min_bytes=32 * 1024 * 1024)
+    assert len(serial) == 80
+
+
+def test_append_keeps_partitions_clustered(tmp_path):
+    path = orders_csv(tmp_path)
+    partitions.partition_file(path, "order_date", "month")
+    df = DataFrame(path)
+    df.stats = df.compute_stats(zone_map=True)
+
+    df.append_csv(orders_csv(tmp_path, "july.csv", months=(6, 7), first_id=1000, per_month=5))
+    partition_map = partitions.load(path)
+    assert partition_map is not None
+    june = next(p for p in partition_map.partitions if p["key"] == "2024-06")
+    assert len(june["ranges"]) == 2
+    assert [p["key"] for p in partition_map.partitions][-2:] == ["2024-07", None]
+
+    july = df.filter(lambda row: (row["order_date"] or "").startswith("2024-07"),
+                     predicates=[("order_date", ">=", "2024-07")])
+    assert [row["order_id"] for row in july.data] == [1001, 1003, 1005, 1007, 1009]
+    assert len(df) == 240 + 1 + 10 + 1
+
+
+def test_unknown_scheme_or_column_is_rejected(tmp_path):
+    path = orders_csv(tmp_path)
+    with pytest.raises(ValueError):
+        partitions.partition_file(path, "order_date", "range")
+    with pytest.raises(ValueError):
+        partitions.partition_file(path, "missing", "month")
+
+
+def test_partition_map_of_a_same_size_rewrite_is_ignored(tmp_path, rewrite_same_size):
+    path = orders_csv(tmp_path)
+    partitions.partition_file(path, "order_date", "month")
+    assert partitions.load(path) is not None
+    rewrite_same_size(path, "2024-01-01", "2024-09-01")
+    assert partitions.load(path) is None
+    result = DataFrame(path).filter(lambda row: (row["order_date"] or "") >= "2024-09",
+                                    predicates=[("order_date", ">=", "2024-09")])
+    assert [row["order_date"] for row in result.data] == ["2024-09-01"] * len(result.data) and result.data
@@ -0,0 +1,81 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from extensions import db
+from models import PlanCacheEntry
+from services.plan_cache import PlanCache, normalize_question, schema_fingerprint
+
+SCHEMA = {"orders": {"types": {"order_id": "int", "total": "float"}}}
+
+
+@pytest.fixture
+def cache(app):
+    with app.app_context():
+        PlanCacheEntry.query.delete()
+        db.session.commit()
+        yield PlanCache(ttl=60, max_entries=3)
+
+
+def test_normalize_question():
+    assert normalize_question("  What's the TOTAL,  by month?! ") == "what s the total by month"
+    assert normalize_question("Orders over 1,500.75.") == "orders over 1,500.75"
+    assert normalize_question(None) == ""
+
+
+def test_schema_fingerprint_changes_with_what_the_model_sees():
+    fingerprint = schema_fingerprint(SCHEMA)
+    assert fingerprint == schema_fingerprint(dict(SCHEMA, orders={"types": dict(SCHEMA["orders"]["types"])}))
+    assert fingerprint == schema_fingerprint({"orders": dict(SCHEMA["orders"], filepath="other.csv")})
+    assert fingerprint != schema_fingerprint({"orders": {"types": {"order_id": "str", "total": "float"}}})
+    assert fingerprint != schema_fingerprint(dict(SCHEMA, customers={"types": {}}))
+
+    relationship = {"from": "orders.customer_id", "to": "customers.customer_id"}
+    assert fingerprint != schema_fingerprint(SCHEMA, [relationship])
+    other = {"from": "orders.id", "to": "items.order_id"}
+    assert schema_fingerprint(SCHEMA, [relationship, other]) == schema_fingerprint(SCHEMA, [other, relationship])
+
+
+def test_same_question_hits_and_schema_change_misses(cache):
+    fingerprint = schema_fingerprint(SCHEMA)
+    cache.put("chat", fingerprint, "Total by month?", {"content": "a"})
+    assert cache.get("chat", fingerprint, "total by  month") == {"content": "a"}
+    assert cache.get("chat", schema_fingerprint(SCHEMA, [{"from": "a", "to": "b"}]), "total by month") is None
+    assert cache.get("relationships", fingerprint, "total by month") is None
+
+    cache.invalidate("chat", fingerprint, "total by month")
+    assert cache.get("chat", fingerprint, "total by month") is None
+
+
+def test_entries_expire_after_the_ttl(cache):
+    cache.put("chat", "f", "q", {"content": "a"})
+    key = cache.make_key("chat", "f", "q")
+    cache._memory[key] = (time.time() - 61, cache._memory[key][1])
+    entry = db.session.get(PlanCacheEntry, key)
+    entry.created_at = datetime.utcnow() - timedelta(seconds=61)
+    db.session.commit()
+
+    assert cache.get("chat", "f", "q") is None
+    assert key not in cache._memory
+    assert db.session.get(PlanCacheEntry, key) is None
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for question in ("a", "b", "c"):
+        cache.put("chat", "f", question, {"content": question})
+    assert cache.get("chat", "f", "a") == {"content": "a"}  # now "b" is the oldest
+    cache.put("chat", "f", "d", {"content": "d"})
+
+    assert list(cache._memory) == [cache.make_key("chat", "f", q) for q in ("c", "a", "d")]
+    keys = {entry.key for entry in PlanCacheEntry.query.all()}
+    assert keys == {cache.make_key("chat", "f", q) for q in ("c", "a", "d")}
+
+
+def test_database_tier_survives_a_cleared_memory_tier(cache):
+    cache.put("chat", "f", "q", {"content": "a"})
+    cache._memory.clear()  # e.g. another worker, or a restart
+
+    assert cache.get("chat", "f", "q") == {"content": "a"}
+    assert cache.make_key("chat", "f", "q") in cache._memory
+    other = PlanCache(ttl=60, max_entries=3)
+    assert other.get("chat", "f", "q") == {"content": "a"}
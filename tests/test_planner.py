@@ -0,0 +1,57 @@
+import ast
+import pytest
+from engine.planner import explain, predicates, PlanError
+
+TABLES = {
+    "orders": {"row_count": 10000, "bytes": 500000,
+               "types": {"order_id": "int", "customer_id": "int", "total": "float", "country": "str"}},
+    "customers": {"row_count": 100, "bytes": 4000,
+                  "types": {"customer_id": "int", "segment": "str"}},
+}
+
+
+def test_explain_aggregate_streams_filtered_scan():
+    plan = explain(
+        "orders.aggregate(orders.filter(lambda row: row['total'] > 10).groupby('country'), {'total': 'sum'})",
+        TABLES,
+    )
+    ops = [node.op for node in plan.root.walk()]
+    assert ops == ["HashAggregate", "Filter", "Scan"]
+    assert plan.bytes_scanned == 500000
+    filter_node = plan.root.children[0]
+    assert 0 < filter_node.rows < 10000
+    assert "HashAggregate sum(total) by country" in plan.format()
+
+
+def test_explain_join_and_limit():
+    plan = explain("customers.join(orders, 'customer_id', 'customer_id').project(['segment'])[:5]", TABLES)
+    assert plan.root.op == "Limit"
+    assert plan.rows == 5
+    join = plan.root.children[0].children[0]
+    assert join.op == "HashJoin"
+    assert join.rows == 10000
+    assert plan.bytes_scanned == 504000
+    assert plan.memory > 0
+
+
+def test_explain_composite_keys():
+    tables = dict(TABLES, orders=dict(TABLES["orders"], stats={"row_count": 10000, "bytes": 500000, "columns": {
+        "country": {"distinct": 3}, "customer_id": {"distinct": 100}}}))
+    plan = explain("orders.aggregate(orders.groupby(['country', 'customer_id']), {'total': 'sum'})", tables)
+    assert plan.root.rows == 300
+    assert "by (country, customer_id)" in plan.format()
+    plan = explain("orders.join(customers, ['customer_id', 'country'], ['customer_id', 'segment'])", TABLES)
+    assert plan.root.detail.startswith("(customer_id, country) = (customer_id, segment)")
+
+
+def test_predicates_extracts_simple_conjuncts():
+    lam = ast.parse("lambda row: float(row['total']) > 3 and 'US' == row['country'] and len(row) > 1",
+                    mode="eval").body
+    assert predicates(lam) == [("total", ">", 3), ("country", "==", "US")]
+
+
+def test_explain_rejects_code_without_tables():
+    with pytest.raises(PlanError):
+        explain("1 + 1", TABLES)
+    with pytest.raises(PlanError):
+        explain("orders.filter(", TABLES)
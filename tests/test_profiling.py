@@ -0,0 +1,69 @@
+import threading
+from engine.dataframe import DataFrame
+from engine import profiling
+
+
+def _write_csv(tmp_path):
+    path = tmp_path / "orders.csv"
+    lines = ["id,country,total"]
+    for i in range(1, 101):
+        lines.append(f"{i},{'US' if i % 4 else 'DE'},{i * 1.5}")
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_profile_records_operators(tmp_path):
+    df = DataFrame(_write_csv(tmp_path))
+
+    with profiling.profile(track_memory=True) as prof:
+        big = df.filter(lambda row: row["total"] > 30)
+        result = big.aggregate(big.groupby("country"), {"total": "sum"})
+
+    assert set(result) == {"US", "DE"}
+    ops = [entry["op"] for entry in prof.operators]
+    assert ops == ["filter", "aggregate", "aggregate_scan"]
+
+    scan = prof.operators[0]
+    assert scan["table"] == "orders.csv"
+    assert scan["rows_read"] == 100
+    assert scan["rows_emitted"] == 80
+    assert scan["bytes_read"] > 0
+    assert prof.operators[2]["rows_read"] == 80
+    assert prof.operators[2]["depth"] == 1
+    assert prof.rows_read == 180
+    assert all(entry["peak_memory_bytes"] >= 0 for entry in prof.operators)
+
+
+def test_no_profile_is_a_no_op():
+    df = DataFrame([{"id": 1}, {"id": 2}])
+    assert profiling.active() is None
+    assert len(df.filter(lambda row: row["id"] > 1)) == 1
+
+
+def test_concurrent_profiles_stay_separate(tmp_path):
+    df = DataFrame(_write_csv(tmp_path))
+    profiles = {}
+    barrier = threading.Barrier(2)
+
+    def query(name, predicate):
+        with profiling.profile() as prof:
+            barrier.wait(5)
+            for _ in range(20):
+                df.filter(predicate)
+            barrier.wait(5)
+        profiles[name] = prof
+
+    threads = [
+        threading.Thread(target=query, args=("us", lambda row: row["country"] == "US")),
+        threading.Thread(target=query, args=("de", lambda row: row["country"] == "DE")),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert profiling.active() is None
+    for prof in profiles.values():
+        assert [entry["op"] for entry in prof.operators] == ["filter"] * 20
+        assert prof.rows_read == 2000
+    assert {prof.operators[0]["rows_emitted"] for prof in profiles.values()} == {75, 25}
@@ -0,0 +1,100 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import pickle
+
+from config import Config
+from services import results
+
+
+def test_export_csv_has_every_row(client, ask):
+    code = "orders.filter(lambda row: row['total_amount'] > 300).project(['order_id', 'total_amount'])[:5]"
+    assert ask("big orders", code).get_json()["type"] == "table"
+
+    response = client.get("/api/export?query=big orders&format=csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="export.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 100  # the slice is dropped
+    assert rows[0] == {"order_id": "201", "total_amount": "301.5"}
+
+
+def test_export_ndjson_and_gzip_of_a_join(client, ask):
+    code = "orders.join(customers, 'customer_id', 'customer_id').project(['order_id', 'country'])[:10]"
+    ask("orders by country", code)
+
+    response = client.get("/api/export?query=orders by country&format=ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 300
+    assert rows[0] == {"order_id": 1, "country": "DE"}
+
+    response = client.get("/api/export?query=orders by country&format=ndjson&gzip=1")
+    assert response.mimetype == "application/gzip"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="export.ndjson.gz"'
+    assert [json.loads(line) for line in gzip.decompress(response.get_data()).decode().splitlines()] == rows
+
+
+def test_export_errors(client, ask, monkeypatch):
+    response = client.get("/api/export?query=never asked")
+    assert response.status_code == 404
+    assert client.get("/api/export?query=never asked&format=xml").status_code == 400
+
+    ask("chart", "build_chart_url('x', 'bar', orders.aggregate(orders.groupby('customer_id'), {'total_amount': 'sum'}))")
+    assert client.get("/api/export?query=chart").get_json()["data"] == "Charts cannot be exported"
+
+    ask("everything", "orders.project(orders.columns)[:10]")
+    monkeypatch.setattr(Config, "QUERY_COST_LIMIT_MB", 1)
+    monkeypatch.setattr(Config, "QUERY_COST_ACTION", "confirm")
+    monkeypatch.setattr("routes.chat._cost_limit_message", lambda plan: "too big")
+    response = client.get("/api/export?query=everything")
+    assert response.status_code == 403 and response.get_json()["type"] == "confirm"
+    assert client.get("/api/export?query=everything&confirm=1").status_code == 200
+
+
+def test_export_runs_under_the_export_timeout(client, plant, monkeypatch):
+    plant("slow", "orders.filter(lambda row: sum(1 for c in '1' * 300000) > 0)[:10]")
+    monkeypatch.setattr(Config, "EXPORT_TIMEOUT", 1)
+    response = client.get("/api/export?query=slow&format=ndjson")
+    assert response.status_code == 503
+    assert "time limit" in response.get_json()["data"]
+
+
+def test_table_rows_names_group_columns():
+    code = "orders.aggregate(orders.groupby(['country', 'month']), {'total': 'sum'})"
+    assert list(results.table_rows({("US", 1): {"total": 3}}, code)) == \
+        [{"country": "US", "month": 1, "total": 3}]
+    assert list(results.table_rows({"US": {"total": 3}}, "orders.groupby('country')")) == \
+        [{"country": "US", "total": 3}]
+    assert list(results.table_rows({("US", 1): {"total": 3}}, "orders.groupby('country')")) == \
+        [{"group_1": "US", "group_2": 1, "total": 3}]
+
+
+def test_table_payload_and_encode_json(monkeypatch):
+    rows = [{"a": 1, "b": None}, {"b": 2, "c": "x"}]
+    assert results.table_payload(rows) == {"data": rows}
+    assert results.table_payload(rows, "columnar") == {
+        "columns": ["a", "b", "c"],
+        "data": [[1, None, None], [None, 2, "x"]],
+    }
+    assert results.table_payload([5, 6], "columnar") == {"columns": ["value"], "data": [[5], [6]]}
+
+    payload = {"data": [{"d": datetime.date(2024, 1, 2), "n": 1.5}], "keys": {1: "x"}}
+    expected = {"data": [{"d": "2024-01-02", "n": 1.5}], "keys": {"1": "x"}}
+    assert results.orjson is not None
+    assert json.loads(results.encode_json(payload)) == expected
+    monkeypatch.setattr(results, "orjson", None)
+    assert json.loads(results.encode_json(payload)) == expected
+
+
+def test_limit_rows():
+    assert results.limit_rows([1, 2, 3], 5) == [1, 2, 3]
+    assert results.limit_rows([1, 2, 3], 0) == [1, 2, 3]
+    assert results.limit_rows({"a": 1}, 0) == {"a": 1}
+    limited = results.limit_rows([1, 2, 3], 2)
+    assert limited == [1, 2] and limited.total == 3
+    assert pickle.loads(pickle.dumps(limited)).total == 3
+    assert results.limit_rows(limited, 1).total == 3
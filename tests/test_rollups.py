@@ -0,0 +1,110 @@
+import pytest
+from engine.dataframe import DataFrame
+from engine.planner import explain
+from engine import rollups
+
+
+@pytest.fixture
+def orders_csv(temp_csv):
+    lines = ["order_id,customer_id,country,order_date,amount"]
+    for i in range(300):
+        amount = "" if i % 37 == 0 else f"{(i * 7) % 90}.25"
+        lines.append(f"{i},{i % 12},{['US', 'DE', 'FR'][i % 3]},2024-{(i * 5) % 12 + 1:02d}-{i % 28 + 1:02d},{amount}")
+    return temp_csv("\n".join(lines) + "\n")
+
+
+def scanned(df, column, agg, bucket=None):
+    """The aggregate computed by scanning the table."""
+    return DataFrame(list(df._get_data())).aggregate(
+        DataFrame(list(df._get_data())).groupby(column, bucket), agg)
+
+
+def test_rollup_answers_aggregate_without_scanning(orders_csv, monkeypatch):
+    df = DataFrame(orders_csv)
+    df.compute_stats(rollups_to_build=rollups.choose(df.header, df.column_types, "auto"))
+    agg = {"amount": "sum", "order_id": "count", "customer_id": "count"}
+    expected = scanned(df, "country", agg)
+    avg_agg = {"amount": "avg"}
+    expected_avg = scanned(df, "customer_id", avg_agg)
+    expected_range = scanned(df, "country", {"amount": "min", "order_id": "max"})
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("scanned")
+    monkeypatch.setattr(DataFrame, "_aggregate_states", no_scan)
+
+    assert df.aggregate(df.groupby("country"), agg) == expected
+    assert df.aggregate(df.groupby("customer_id"), avg_agg) == expected_avg
+    # order_id is not a measure: max(order_id) scans
+    with pytest.raises(AssertionError):
+        df.aggregate(df.groupby("country"), {"amount": "min", "order_id": "max"})
+    monkeypatch.undo()
+    assert df.aggregate(df.groupby("country"), {"amount": "min", "order_id": "max"}) == expected_range
+
+
+def test_day_rollup_answers_coarser_buckets(orders_csv):
+    df = DataFrame(orders_csv)
+    df.compute_stats(rollups_to_build=rollups.choose(df.header, df.column_types, "order_date:amount"))
+    assert [(r["column"], r["bucket"]) for r in rollups.load(orders_csv).rollups] == [
+        ("order_date", None), ("order_date", "day")
+    ]
+
+    agg = {"amount": "sum", "order_id": "count"}
+    for bucket in ("day", "month", "year"):
+        answer = rollups.load(orders_csv).answer("order_date", bucket, agg)
+        expected = scanned(df, "order_date", agg, bucket)
+        assert list(answer) == list(expected)  # first-appearance order
+        assert answer.keys() == expected.keys()
+        for key in expected:
+            assert answer[key]["order_id"] == expected[key]["order_id"]
+            assert answer[key]["amount"] == pytest.approx(expected[key]["amount"])
+    assert list(df.aggregate(df.groupby("order_date", "month"), agg))[:2] == ["2024-01", "2024-06"]
+
+
+def test_rollups_of_changed_file_are_ignored(orders_csv):
+    df = DataFrame(orders_csv)
+    df.compute_stats(rollups_to_build=rollups.choose(df.header, df.column_types, "country:amount"))
+    assert rollups.load(orders_csv) is not None
+    with open(orders_csv, "a", encoding="utf-8") as f:
+        f.write("300,1,IT,2024-01-01,5.0\n")
+    assert rollups.load(orders_csv) is None
+    assert "IT" in df.aggregate(df.groupby("country"), {"amount": "sum"})
+
+
+def test_rollups_of_a_same_size_rewrite_are_ignored(orders_csv, rewrite_same_size):
+    df = DataFrame(orders_csv)
+    df.compute_stats(rollups_to_build=rollups.choose(df.header, df.column_types, "country:amount"))
+    assert rollups.load(orders_csv) is not None
+    with open(orders_csv, encoding="utf-8") as f:
+        country = f.read().splitlines()[1].split(",")[2]
+    rewrite_same_size(orders_csv, f",{country},", ",ZZ,")
+    assert rollups.load(orders_csv) is None
+    assert "ZZ" in DataFrame(orders_csv).aggregate(df.groupby("country"), {"amount": "sum"})
+
+
+def test_choose_and_group_cap():
+    types = {"id": "int", "country": "str", "amount": "float"}
+    assert rollups.choose(["id", "country", "amount"], types, "auto") == [
+        ("id", None, ["amount"]), ("country", None, ["amount"]), ("country", "day", ["amount"])
+    ]
+    assert rollups.choose(["id", "amount"], types, "id:amount, missing:amount") == [("id", None, ["amount"])]
+    assert rollups.choose(["id", "amount"], types, "off") == []
+
+    builder = rollups.RollupBuilder([("id", None, ["amount"]), ("country", None, ["amount"]),
+                                     ("country", "day", ["amount"])], max_groups=3)
+    rows = [{"id": i, "country": "US", "amount": 1.0} for i in range(10)]
+    assert list(builder.track(rows)) == rows
+    # id has too many groups and country holds no dates
+    assert [(r["column"], r["bucket"]) for r in builder.result(0)["rollups"]] == [("country", None)]
+
+
+def test_explain_shows_rollup_scan(orders_csv):
+    df = DataFrame(orders_csv)
+    df.compute_stats(rollups_to_build=rollups.choose(df.header, df.column_types, "auto"))
+    tables = {"orders": {"filepath": orders_csv, "types": df.column_types, "row_count": 300}}
+    plan = explain("orders.aggregate(orders.groupby('order_date', bucket='year'), {'amount': 'sum'})", tables)
+    assert plan.root.op == "RollupScan"
+    assert plan.root.rows == 1
+    assert plan.bytes_scanned == 0
+    plan = explain("orders.aggregate(orders.filter(lambda row: row['amount'] > 3)"
+                   ".groupby('country'), {'amount': 'sum'})", tables)
+    assert plan.root.op == "HashAggregate"
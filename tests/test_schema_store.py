@@ -0,0 +1,101 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from config import Config
+from extensions import db
+from flask import g
+from models import Project, SchemaSnapshot, Table, User
+from services import schema_store
+from sqlalchemy.exc import IntegrityError
+
+RELATIONSHIP = {"from_table": "orders", "from_column": "customer_id",
+                "to_table": "customers", "to_column": "customer_id"}
+
+
+@pytest.fixture
+def project(app):
+    """A project with orders and customers tables and no snapshot yet."""
+    with app.app_context():
+        user = User(email=f"{uuid.uuid4().hex}@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        project = Project(name="p", user_id=user.id)
+        db.session.add(project)
+        db.session.flush()
+        for name in ("orders", "customers"):
+            db.session.add(Table(name=name, filename=f"{name}.csv", filepath=f"/data/{name}.csv",
+                                 columns_schema={"customer_id": "int"}, row_count=1, project_id=project.id))
+        db.session.commit()
+        project_id = project.id
+    yield project_id
+    schema_store.forget()
+
+
+def add_version(project_id, version, tables=None):
+    """Saves a version the way another worker would, behind this worker's back."""
+    with db.engine.begin() as conn:
+        conn.execute(SchemaSnapshot.__table__.insert().values(
+            project_id=project_id, version=version, tables=tables or {}, relationships=[],
+            created_at=datetime.utcnow()))
+
+
+def test_refresh_and_set_relationships_save_new_versions(app, project):
+    with app.test_request_context():
+        first = schema_store.current(project)
+        assert first["version"] == 1 and sorted(first["tables"]) == ["customers", "orders"]
+        assert schema_store.set_relationships(project, [RELATIONSHIP])["version"] == 2
+
+        Table.query.filter_by(project_id=project, name="customers").delete()
+        db.session.commit()
+        refreshed = schema_store.refresh(project)
+        assert refreshed["version"] == 3
+        assert list(refreshed["tables"]) == ["orders"]
+        assert refreshed["relationships"] == []  # customers is gone
+        assert schema_store.snapshot(project, 2)["relationships"] == [RELATIONSHIP]
+        assert [v["version"] for v in schema_store.versions(project)] == [3, 2, 1]
+
+
+def test_old_versions_are_pruned(app, project, monkeypatch):
+    monkeypatch.setattr(Config, "SCHEMA_SNAPSHOTS_KEPT", 3)
+    with app.test_request_context():
+        for _ in range(5):
+            schema_store.refresh(project)  # the first one saves version 1 before it
+        assert [v["version"] for v in schema_store.versions(project)] == [6, 5, 4]
+        assert schema_store.snapshot(project, 3) is None
+
+
+def test_save_retries_a_version_number_taken_by_another_worker(app, project, monkeypatch):
+    add = db.session.add
+    taken = []
+
+    def racing_add(entry):
+        if isinstance(entry, SchemaSnapshot) and len(taken) < races:
+            taken.append(entry.version)
+            add_version(project, entry.version)
+        add(entry)
+    monkeypatch.setattr(db.session, "add", racing_add)
+
+    with app.test_request_context():
+        races = 1
+        assert schema_store.save(project, {}, [])["version"] == 2
+        assert taken == [1]
+
+        races = 3
+        with pytest.raises(IntegrityError):
+            schema_store.save(project, {}, [])
+        assert taken == [1, 3, 4]
+
+
+def test_current_is_looked_up_once_per_request(app, project):
+    with app.test_request_context():
+        assert schema_store.current(project)["version"] == 1
+        assert g.schema_snapshots[project]["version"] == 1
+        add_version(project, 2, {"added": {}})
+        assert schema_store.current(project)["version"] == 1
+
+    # Another worker saved version 2: the next request picks it up
+    with app.test_request_context():
+        latest = schema_store.current(project)
+        assert latest["version"] == 2 and list(latest["tables"]) == ["added"]
+        assert schema_store._snapshots[project]["version"] == 2
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import pytest
+from engine.parser import CsvParser
+from engine.dataframe import DataFrame
+from engine.segments import Segment, SegmentStore, write_segment
+
+
+def test_segment_round_trip():
+    rows = [
+        {"id": 1, "amount": 1.5, "name": "A", "mixed": 7},
+        {"id": None, "amount": None, "name": None, "mixed": "x"},
+        {"id": 3, "amount": 2.25, "name": "Zoë", "mixed": None},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "t.seg")
+        count = write_segment(
+            path, ["id", "amount", "name", "mixed"], rows,
+            column_types={"id": "int", "amount": "float", "name": "str", "mixed": "int"}
+        )
+        segment = Segment(path)
+
+        assert count == 3
+        assert len(segment) == 3
+        assert list(segment.rows()) == rows
+        assert list(segment.column("amount")) == [1.5, None, 2.25]
+
+
+def test_dataframe_reads_from_segment(temp_csv):
+    filepath = temp_csv("id,score\n1,10.5\n2,\n3,30\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, budget_bytes=10 * 1024 * 1024)
+        plain = DataFrame(filepath)
+        shared = DataFrame(filepath, segment=store.acquire(CsvParser(filepath)))
+
+        assert len(shared) == 3
+        assert shared.project(["id", "score"]) == plain.project(["id", "score"])
+        assert shared.filter(lambda r: r["id"] > 1).data == plain.filter(lambda r: r["id"] > 1).data
+
+
+
+def test_store_evicts_unreferenced_segments(temp_csv):
+    first = temp_csv("id\n" + "\n".join(str(i) for i in range(100)) + "\n")
+    second = temp_csv("id\n" + "\n".join(str(i) for i in range(100)) + "\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, budget_bytes=1)
+        seg_a = store.acquire(CsvParser(first))
+        seg_b = store.acquire(CsvParser(second))
+
+        # Both are referenced, so neither can be evicted
+        assert os.path.exists(seg_a.path) and os.path.exists(seg_b.path)
+
+        store.release(seg_a)
+        assert not os.path.exists(seg_a.path)
+        assert os.path.exists(seg_b.path)
+        # A mapping taken before eviction keeps working
+        assert len(list(seg_a.rows())) == 100
+
+
+
+def test_chunked_write_matches_a_single_chunk():
+    rows = [{"id": i, "amount": i / 4 if i % 5 else None, "name": f"n{i}" * (i % 3),
+             "mixed": i if i < 45 else f"x{i}"} for i in range(50)]
+    types = {"id": "int", "amount": "float", "name": "str", "mixed": "int"}
+    with tempfile.TemporaryDirectory() as tmp:
+        whole, chunked = os.path.join(tmp, "whole.seg"), os.path.join(tmp, "chunked.seg")
+        write_segment(whole, list(types), rows, types)
+        # "mixed" becomes json after its spilled chunks are written
+        write_segment(chunked, list(types), rows, types, chunk_rows=7)
+
+        with open(whole, "rb") as a, open(chunked, "rb") as b:
+            assert a.read() == b.read()
+        segment = Segment(chunked)
+        assert list(segment.rows()) == rows
+        assert list(segment.rows(20, 23)) == rows[20:23]
+        assert [f for f in os.listdir(tmp) if not f.endswith(".seg")] == []
+
+
+def test_segments_are_built_in_the_background(temp_csv):
+    filepath = temp_csv("id\n" + "\n".join(str(i) for i in range(100)) + "\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, budget_bytes=10 * 1024 * 1024)
+        parser = CsvParser(filepath)
+        assert store.acquire(parser, build=False) is None
+        assert not store.exists(filepath)
+
+        thread = store.build_in_background(parser)
+        thread.join()
+        assert store.exists(filepath)
+        assert store.build_in_background(parser) is None  # already built
+        assert len(store.acquire(parser, build=False)) == 100
+        assert not [f for f in os.listdir(tmp) if f.endswith(".building")]
+
+
+
+def test_build_marker_of_a_dead_process_is_taken_over(temp_csv):
+    filepath = temp_csv("id\n1\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, budget_bytes=10 * 1024 * 1024)
+        key = store.segment_key(filepath, os.path.getmtime(filepath))
+        marker = os.path.join(tmp, f"{key}.building")
+
+        with open(marker, "w") as f:
+            f.write(str(os.getpid()))  # a build running in a live process
+        assert store.build_in_background(CsvParser(filepath)) is None
+
+        with open(marker, "w") as f:
+            f.write("999999999")  # a build whose process died
+        store.build_in_background(CsvParser(filepath)).join()
+        assert store.exists(filepath)
+
@@ -0,0 +1,67 @@
+import pytest
+from engine.dataframe import DataFrame
+from engine import window
+
+
+LEDGER = [
+    {"account": "A", "month": "2024-02", "amount": 5},
+    {"account": "B", "month": "2024-01", "amount": 100},
+    {"account": "A", "month": "2024-01", "amount": 10},
+    {"account": "B", "month": "2024-02", "amount": "n/a"},
+    {"account": "A", "month": "2024-03", "amount": 1},
+    {"account": "B", "month": "2024-03", "amount": 40},
+]
+
+
+def column(df, name):
+    return [(row["account"], row["month"], row[name]) for row in df.data]
+
+
+def test_cumsum_by_partition_and_order():
+    df = DataFrame(LEDGER)
+    running = df.cumsum("amount", order_by="month", partition_by="account")
+    assert column(running, "amount_cumsum") == [
+        ("B", "2024-01", 100), ("A", "2024-01", 10), ("A", "2024-02", 15),
+        ("B", "2024-02", 100), ("A", "2024-03", 16), ("B", "2024-03", 140),
+    ]
+    # Without order_by the table's own order is used; input rows are left as they were
+    total = df.cumsum("amount", name="balance")
+    assert [row["balance"] for row in total.data] == [5, 105, 115, 115, 116, 156]
+    assert "balance" not in LEDGER[0]
+
+
+def test_lag_lead_and_rolling_mean():
+    df = DataFrame(LEDGER)
+    previous = df.lag("amount", order_by=["account", "month"])
+    assert [row["amount_lag"] for row in previous.data] == [None, 10, 5, 1, 100, "n/a"]
+    previous = df.lag("amount", order_by="month", partition_by="account")
+    assert column(previous, "amount_lag")[2:] == [("A", "2024-02", 10), ("B", "2024-02", 100),
+                                                 ("A", "2024-03", 5), ("B", "2024-03", "n/a")]
+    following = df.lead("amount", 2, order_by="month", partition_by="account")
+    assert column(following, "amount_lead") == [
+        ("B", "2024-01", 40), ("A", "2024-01", 1), ("A", "2024-02", None),
+        ("B", "2024-02", None), ("A", "2024-03", None), ("B", "2024-03", None),
+    ]
+    moving = df.rolling_mean("amount", 2, order_by="month", partition_by="account")
+    assert [row["amount_rolling_mean"] for row in moving.data] == [100, 10, 7.5, 100, 3, 40]
+
+    with pytest.raises(ValueError):
+        df.lag("amount", 0)
+    with pytest.raises(ValueError):
+        window.apply([], "median", "amount", "x", lambda row: None)
+
+
+def test_sorted_file_is_not_resorted(tmp_path, monkeypatch):
+    path = tmp_path / "daily.csv"
+    path.write_text("day,sales\n" + "".join(f"2024-01-{d:02d},{d}\n" for d in range(1, 29)))
+    df = DataFrame(str(path))
+    df.stats = df.compute_stats()
+
+    def no_sort(columns):
+        raise AssertionError("sorted")
+    monkeypatch.setattr(window, "sort_key", no_sort)
+    moving = df.rolling_mean("sales", 7, order_by="day")
+    assert moving.data[6]["sales_rolling_mean"] == 4
+    assert moving.data[27]["sales_rolling_mean"] == 25
+    with pytest.raises(AssertionError):
+        df.cumsum("sales", order_by="sales_missing")
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import pytest
+from engine.dataframe import DataFrame
+from engine.parser import CsvParser
+from engine.segments import Segment, write_segment
+from engine import zone_maps
+
+
+@pytest.fixture
+def zoned_csv(monkeypatch, temp_csv):
+    monkeypatch.setattr(zone_maps, "BLOCK_ROWS", 10)
+    lines = ["id,customer,day"]
+    lines += [f"{i},c{(i * 7) % 13},2024-01-{i % 28 + 1:02d}" for i in range(1, 101)]
+    path = temp_csv("\n".join(lines) + "\n")
+    DataFrame(path).compute_stats(zone_map=True)
+    return path
+
+
+def test_blocks_cover_the_file(zoned_csv):
+    zone_map = zone_maps.load(zoned_csv)
+    assert len(zone_map) == 10
+    assert [b["rows"] for b in zone_map.blocks] == [10] * 10
+    parts = zone_map.partitions(range(10))
+    parser = CsvParser(zoned_csv)
+    assert parts == [("bytes", parser.data_start(), os.path.getsize(zoned_csv))]
+
+
+def test_sorted_column_uses_binary_search(zoned_csv):
+    zone_map = zone_maps.load(zoned_csv)
+    assert zone_map._sorted("id")[0] == "asc"
+    assert zone_map._search("id", ">=", 35) == (3, 10)
+    assert zone_map._search("id", "==", 35) == (3, 4)
+    assert zone_map._search("id", "<", 11) == (0, 1)
+    assert zone_map.matching_blocks([("id", ">", 40), ("id", "<=", 60)]) == [4, 5]
+
+
+def test_filter_reads_only_matching_blocks(zoned_csv):
+    df = DataFrame(zoned_csv)
+    expected = df.filter(lambda row: 35 <= row["id"] < 38).data
+    pruned = df.filter(lambda row: 35 <= row["id"] < 38, predicates=[("id", ">=", 35), ("id", "<", 38)])
+    assert pruned.data == expected and len(expected) == 3
+
+    # Bloom filters rule out blocks without the value
+    assert df.filter(lambda row: row["customer"] == "zz", predicates=[("customer", "==", "zz")]).data == []
+    found = df.filter(lambda row: row["customer"] == "c3", predicates=[("customer", "==", "c3")]).data
+    assert found == df.filter(lambda row: row["customer"] == "c3").data
+
+
+def test_filter_prunes_segment_scans_by_row(zoned_csv):
+    parser = CsvParser(zoned_csv)
+    with tempfile.TemporaryDirectory() as tmp:
+        seg_path = os.path.join(tmp, "t.seg")
+        write_segment(seg_path, parser.get_header(), parser.parse(), parser.get_column_types())
+        df = DataFrame(zoned_csv, segment=Segment(seg_path))
+        rows = df.filter(lambda row: row["id"] > 95, predicates=[("id", ">", 95)]).data
+    assert [row["id"] for row in rows] == [96, 97, 98, 99, 100]
+
+
+def test_stale_zone_map_is_ignored(zoned_csv):
+    with open(zoned_csv, "a", encoding="utf-8") as f:
+        f.write("500,c1,2024-02-01\n")
+    assert zone_maps.load(zoned_csv) is None
+    rows = DataFrame(zoned_csv).filter(lambda row: row["id"] > 400, predicates=[("id", ">", 400)]).data
+    assert rows == [{"id": 500, "customer": "c1", "day": "2024-02-01"}]
+
+
+def test_zone_map_of_a_same_size_rewrite_is_ignored(zoned_csv, rewrite_same_size):
+    assert zone_maps.load(zoned_csv) is not None
+    rewrite_same_size(zoned_csv, "100,", "999,")
+    assert zone_maps.load(zoned_csv) is None
+    df = DataFrame(zoned_csv)
+    assert df.filter(lambda row: row["id"] == 999, predicates=[("id", "==", 999)]).data[0]["id"] == 999